@@ -0,0 +1,301 @@
+#############################################################################
+# advice.py
+#
+# This file contains the GenAI advice subsystem: it turns a user's recent
+# workouts into a prompt, asks a model for advice, and stores the result.
+#
+# Model calls are the slowest and most expensive thing the app does, so
+# advice is only generated when a user's workout data has changed (checked
+# with a hash of the data the prompt is built from), concurrent requests for
+# the same user share one model call, and offline jobs send prompts to the
+# model in batches.
+#
+# StubModel is a deterministic stand-in for a real model, so everything here
+# can be run and tested without network access.
+#############################################################################
+
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import data_fetcher
+import ingest
+from records import Advice
+
+logger = logging.getLogger(__name__)
+
+# How many of the user's most recent workouts the prompt describes.
+PROMPT_WORKOUT_COUNT = 5
+
+# How many prompts are sent to the model per batch in generate_for_users.
+DEFAULT_BATCH_SIZE = 16
+
+# Users with a workout in this many days are refreshed by the scheduler.
+ACTIVE_USER_DAYS = 30
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+PROMPT_TEMPLATE = '''You are an encouraging fitness coach.
+Write one or two sentences of advice for {name} based on their recent workouts.
+
+Recent workouts (oldest first):
+{workouts}
+'''
+
+
+def prompt_inputs(profile, workouts):
+    """Returns the data a user's prompt is built from, as plain JSON types."""
+    recent = workouts[-PROMPT_WORKOUT_COUNT:]
+    return {
+        'name': profile['full_name'],
+        'workouts': [
+            {key: workout.get(key) for key in (
+                'start_timestamp', 'end_timestamp', 'distance', 'steps', 'calories_burned')}
+            for workout in recent
+        ],
+    }
+
+
+def input_hash(inputs):
+    """Returns a stable hash of prompt_inputs(), used as the cache key."""
+    encoded = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def build_prompt(inputs):
+    """Returns the model prompt for prompt_inputs()."""
+    lines = [
+        f"- {w['start_timestamp']} to {w['end_timestamp']}: {w['distance']} mi, "
+        f"{w['steps']} steps, {w['calories_burned']} cal"
+        for w in inputs['workouts']
+    ]
+    return PROMPT_TEMPLATE.format(
+        name=inputs['name'], workouts='\n'.join(lines) or '- none yet')
+
+
+class StubModel:
+    """A deterministic local model: the same prompt always gets the same advice.
+
+    Any object with the same generate() method can be used in its place.
+    """
+
+    ADVICE = [
+        'Your heart rate indicates you can push yourself further. You got this!',
+        "You're doing great! Keep up the good work.",
+        'You worked hard yesterday, take it easy today.',
+        'Consistency beats intensity. Try to fit in a short walk today.',
+        'Great progress! Add a few minutes to your next workout.',
+    ]
+
+    def __init__(self):
+        self.calls = 0
+        self.prompts = 0
+
+    def generate(self, prompts):
+        """Returns one piece of advice text for each prompt."""
+        self.calls += 1
+        self.prompts += len(prompts)
+        return [self._advise(prompt) for prompt in prompts]
+
+    def _advise(self, prompt):
+        digest = hashlib.sha256(prompt.encode()).digest()
+        return self.ADVICE[digest[0] % len(self.ADVICE)]
+
+
+class AdviceService:
+    """Generates, caches and stores advice for users.
+
+    Args:
+        model: an object with generate(prompts) -> list of advice strings.
+        storage: where advice is stored. Defaults to data_fetcher's storage.
+        clock: returns the current datetime, for advice timestamps.
+    """
+
+    def __init__(self, model=None, storage=None, clock=datetime.now):
+        self.model = model or StubModel()
+        self._storage = storage
+        self._clock = clock
+        # user_id -> (input hash, Advice) of the newest advice.
+        self._cache = {}
+        # (user_id, input hash) -> Future for generations in progress.
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def storage(self):
+        return self._storage or data_fetcher.get_storage()
+
+    def get_advice(self, user_id):
+        """Returns advice for the user's current workouts.
+
+        Advice is only generated when the workouts have changed since the
+        last advice; otherwise the stored advice is returned. If several
+        threads ask for the same new advice at once, one model call is made
+        and everyone gets its result.
+        """
+        inputs = self._inputs(user_id)
+        digest = input_hash(inputs)
+        cached = self._cached_advice(user_id, digest)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            future = self._in_flight.get((user_id, digest))
+            owner = future is None
+            if owner:
+                future = self._in_flight[(user_id, digest)] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            [text] = self.model.generate([build_prompt(inputs)])
+            advice = self._store(user_id, digest, text)
+            future.set_result(advice)
+            return advice
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[(user_id, digest)]
+
+    def generate_for_users(self, user_ids, batch_size=DEFAULT_BATCH_SIZE):
+        """Brings many users' advice up to date, e.g. from an offline job.
+
+        Users whose workouts have not changed are skipped; the rest are sent
+        to the model batch_size prompts at a time.
+
+        Returns:
+            A dict mapping each user whose advice was regenerated to it.
+        """
+        stale = []
+        for user_id in dict.fromkeys(user_ids):
+            inputs = self._inputs(user_id)
+            digest = input_hash(inputs)
+            if self._cached_advice(user_id, digest) is None:
+                stale.append((user_id, digest, build_prompt(inputs)))
+
+        generated = {}
+        for start in range(0, len(stale), batch_size):
+            batch = stale[start:start + batch_size]
+            texts = self.model.generate([prompt for _, _, prompt in batch])
+            for (user_id, digest, _), text in zip(batch, texts):
+                generated[user_id] = self._store(user_id, digest, text)
+        return generated
+
+    def _inputs(self, user_id):
+        # Read straight from storage: cached workouts could be stale.
+        profile = self.storage.get_user(user_id)
+        if profile is None:
+            raise ValueError(f'User {user_id} not found.')
+        return prompt_inputs(profile, self.storage.get_workouts(user_id))
+
+    def _cached_advice(self, user_id, digest):
+        # The in-memory copy first, then the newest stored advice.
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        stored, stored_hash = self.storage.get_latest_advice(user_id, with_input_hash=True)
+        if stored is not None and stored_hash == digest:
+            self._cache[user_id] = (digest, stored)
+            return stored
+        return None
+
+    def _store(self, user_id, digest, text):
+        advice = Advice(
+            advice_id=f'{user_id}-{digest[:16]}',
+            timestamp=self._clock().strftime(TIMESTAMP_FORMAT),
+            content=text,
+        )
+        self.storage.add_advice(user_id, advice, input_hash=digest)
+        self._cache[user_id] = (digest, advice)
+        data_fetcher.get_genai_advice.cache.invalidate_user(user_id)
+        return advice
+
+
+class AdviceScheduler:
+    """Keeps advice up to date in the background, so pages never wait on it.
+
+    Users are refreshed on a worker pool after each sensor ingest and, once
+    started with an interval, periodically for every active user. Pages then
+    only read the latest stored advice (data_fetcher.get_genai_advice).
+
+    Args:
+        service: the AdviceService used to generate advice.
+        workers: how many users can be refreshed at the same time.
+        active_users: returns the ids to refresh on each scheduled run.
+            Defaults to users with a workout in the last ACTIVE_USER_DAYS.
+    """
+
+    def __init__(self, service=None, workers=2, active_users=None):
+        self.service = service or AdviceService()
+        self._active_users = active_users or self._recently_active_users
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='advice')
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._timer = None
+
+    def request(self, user_id):
+        """Queues a refresh of the user's advice and returns its Future.
+
+        A user already waiting in the queue is not queued twice.
+        """
+        with self._lock:
+            future = self._pending.get(user_id)
+            if future is None:
+                future = self._pending[user_id] = self._executor.submit(self._refresh, user_id)
+                future.add_done_callback(_log_failure)
+        return future
+
+    def refresh_active_users(self):
+        """Regenerates stale advice for every active user, in batches."""
+        return self.service.generate_for_users(self._active_users())
+
+    def start(self, interval=None):
+        """Starts refreshing users after ingests and, if an interval (in
+        seconds) is given, refreshing all active users that often."""
+        ingest.add_ingest_listener(self._on_ingest)
+        if interval is not None:
+            self._timer = threading.Thread(
+                target=self._run_every, args=(interval,), name='advice-timer', daemon=True)
+            self._timer.start()
+        return self
+
+    def stop(self, wait=True):
+        """Stops scheduling; with wait=True, finishes queued refreshes first."""
+        ingest.remove_ingest_listener(self._on_ingest)
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.join()
+        self._executor.shutdown(wait=wait)
+
+    def _on_ingest(self, user_id, workout_id):
+        self.request(user_id)
+
+    def _refresh(self, user_id):
+        # Runs on a worker: a user is "pending" until their refresh starts,
+        # so data arriving during generation queues one more refresh.
+        with self._lock:
+            self._pending.pop(user_id, None)
+        return self.service.get_advice(user_id)
+
+    def _run_every(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.refresh_active_users()
+            except Exception:
+                logger.exception('Scheduled advice refresh failed')
+
+    def _recently_active_users(self):
+        since = datetime.now() - timedelta(days=ACTIVE_USER_DAYS)
+        return self.service.storage.get_active_user_ids(since.strftime(TIMESTAMP_FORMAT))
+
+
+def _log_failure(future):
+    # Background refreshes have no caller to raise to, so log their errors.
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Advice refresh failed', exc_info=future.exception())
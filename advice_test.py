@@ -0,0 +1,185 @@
+#############################################################################
+# advice_test.py
+#
+# This file contains tests for advice.py.
+#############################################################################
+
+import threading
+import time
+import unittest
+from datetime import datetime
+
+import data_fetcher
+import ingest
+from advice import (
+    AdviceScheduler, AdviceService, StubModel, build_prompt, input_hash, prompt_inputs)
+from sensor_data import SensorSeries
+
+
+class SlowModel(StubModel):
+    """A stub model that takes a while to answer."""
+
+    def generate(self, prompts):
+        time.sleep(0.1)
+        return super().generate(prompts)
+
+
+class TestPrompt(unittest.TestCase):
+    """Tests building prompts and their hashes."""
+
+    def setUp(self):
+        self.profile = {'full_name': 'Remi'}
+        self.workouts = [
+            {'workout_id': f'w{i}', 'start_timestamp': f'2024-01-0{i + 1} 00:00:00',
+             'end_timestamp': f'2024-01-0{i + 1} 00:30:00', 'distance': 1.0,
+             'steps': 100 * i, 'calories_burned': 10}
+            for i in range(7)
+        ]
+
+    def test_prompt_uses_recent_workouts(self):
+        """Only the most recent workouts are described."""
+        prompt = build_prompt(prompt_inputs(self.profile, self.workouts))
+        self.assertIn('Remi', prompt)
+        self.assertIn('600 steps', prompt)
+        self.assertNotIn('100 steps', prompt)
+
+    def test_hash_changes_with_data(self):
+        """The hash only changes when the prompt's data changes."""
+        first = input_hash(prompt_inputs(self.profile, self.workouts))
+        self.assertEqual(first, input_hash(prompt_inputs(self.profile, list(self.workouts))))
+        self.workouts[-1] = dict(self.workouts[-1], steps=1)
+        self.assertNotEqual(first, input_hash(prompt_inputs(self.profile, self.workouts)))
+
+    def test_stub_model_is_deterministic(self):
+        """The same prompt always gets the same advice."""
+        model = StubModel()
+        self.assertEqual(model.generate(['a', 'b']), model.generate(['a', 'b']))
+        self.assertEqual((model.calls, model.prompts), (2, 4))
+
+
+class TestAdviceService(unittest.TestCase):
+    """Tests generating and caching advice."""
+
+    def setUp(self):
+        self.storage = data_fetcher.open_storage(':memory:')
+        self.model = StubModel()
+        self.service = AdviceService(
+            self.model, self.storage, clock=lambda: datetime(2024, 2, 1, 8, 0, 0))
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_generates_once_until_workouts_change(self):
+        """Advice is cached on the workout data it was generated from."""
+        advice = self.service.get_advice('user1')
+        self.assertEqual(advice['timestamp'], '2024-02-01 08:00:00')
+        self.assertIn(advice['content'], StubModel.ADVICE)
+        self.assertEqual(self.storage.get_latest_advice('user1'), advice)
+
+        self.assertEqual(self.service.get_advice('user1'), advice)
+        self.assertEqual(self.model.prompts, 1)
+
+        self.storage.add_workouts('user1', [{
+            'workout_id': 'new', 'start_timestamp': '2024-02-01 07:00:00',
+            'end_timestamp': '2024-02-01 07:30:00', 'steps': 1}])
+        self.service.get_advice('user1')
+        self.assertEqual(self.model.prompts, 2)
+
+    def test_stored_advice_survives_a_new_service(self):
+        """A new service (e.g. after a restart) reuses stored advice."""
+        advice = self.service.get_advice('user2')
+        other = AdviceService(self.model, self.storage)
+        self.assertEqual(other.get_advice('user2'), advice)
+        self.assertEqual(self.model.prompts, 1)
+
+    def test_concurrent_requests_share_one_call(self):
+        """Identical in-flight requests make a single model call."""
+        model = SlowModel()
+        service = AdviceService(model, self.storage)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(service.get_advice('user3')))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_generate_for_users_in_batches(self):
+        """Offline generation batches prompts and skips up-to-date users."""
+        self.service.get_advice('user1')
+        generated = self.service.generate_for_users(
+            ['user1', 'user2', 'user3', 'user4'], batch_size=2)
+        self.assertEqual(sorted(generated), ['user2', 'user3', 'user4'])
+        # One call for user1, then two batches for the other three.
+        self.assertEqual(self.model.calls, 3)
+        self.assertEqual(self.service.generate_for_users(['user2', 'user3']), {})
+
+    def test_unknown_user(self):
+        """Unknown users are rejected."""
+        with self.assertRaises(ValueError):
+            self.service.get_advice('nobody')
+
+
+class TestAdviceScheduler(unittest.TestCase):
+    """Tests generating advice in the background."""
+
+    def setUp(self):
+        self.storage = data_fetcher.open_storage(':memory:')
+        self.model = StubModel()
+        self.service = AdviceService(self.model, self.storage)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_request_stores_advice(self):
+        """A requested refresh stores advice readers can pick up."""
+        scheduler = AdviceScheduler(self.service)
+        advice = scheduler.request('user1').result(timeout=5)
+        scheduler.stop()
+        self.assertEqual(self.storage.get_latest_advice('user1'), advice)
+
+    def test_refresh_after_ingest(self):
+        """Ingesting samples for a user queues a refresh for them."""
+        scheduler = AdviceScheduler(self.service).start()
+        workout_id = self.storage.get_workouts('user2')[0]['workout_id']
+        ingest.ingest_sensor_batches(
+            'user2', workout_id, [SensorSeries([1], [1.0], [0])], storage=self.storage)
+        scheduler.stop(wait=True)
+        self.assertEqual(self.model.prompts, 1)
+        self.assertEqual(self.storage.get_latest_advice('user2')['advice_id'][:6], 'user2-')
+        self.assertNotIn(scheduler._on_ingest, ingest._ingest_listeners)
+
+    def test_scheduled_refresh_of_active_users(self):
+        """Active users are refreshed on every interval."""
+        refreshed = threading.Event()
+        active = ['user3', 'user4']
+
+        def active_users():
+            refreshed.set()
+            return active
+
+        scheduler = AdviceScheduler(self.service, active_users=active_users)
+        scheduler.start(interval=0.01)
+        self.assertTrue(refreshed.wait(5))
+        scheduler.stop()
+        self.assertEqual(self.model.prompts, 2)
+        self.assertIsNotNone(self.storage.get_latest_advice('user4', with_input_hash=True)[1])
+
+    def test_active_users_from_storage(self):
+        """By default, users with a recent workout are active."""
+        scheduler = AdviceScheduler(self.service)
+        self.assertEqual(scheduler._active_users(), [])
+        self.storage.add_workouts('user4', [{
+            'workout_id': 'recent', 'start_timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'end_timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}])
+        self.assertEqual(scheduler._active_users(), ['user4'])
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#############################################################################
+# analytics.py
+#
+# This file contains functions that compute workout statistics from sensor
+# samples. Everything here works on whole SensorSeries columns with NumPy and
+# pandas, so there are no per-sample Python loops.
+#############################################################################
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from data_fetcher import get_user_sensor_data, get_user_workouts
+from sensor_data import SENSOR_TYPES, SensorSeries
+
+# Lower bounds of heart rate zones 1-5, as fractions of the maximum heart rate.
+HEART_RATE_ZONES = (0.5, 0.6, 0.7, 0.8, 0.9)
+
+_STAT_COLUMNS = ['count', 'min', 'max', 'mean']
+
+
+def estimate_max_heart_rate(date_of_birth, on_date=None):
+    """Estimates a maximum heart rate with the common '220 - age' rule.
+
+    Args:
+        date_of_birth: a 'YYYY-MM-DD' string, like users[...]['date_of_birth'].
+        on_date: the date to compute the age on. Defaults to today.
+    """
+    born = date.fromisoformat(date_of_birth)
+    on_date = on_date or date.today()
+    age = on_date.year - born.year - ((on_date.month, on_date.day) < (born.month, born.day))
+    return 220 - age
+
+
+def sensor_stats(series):
+    """Returns count/min/max/mean for each sensor type in a workout.
+
+    Returns:
+        A dict mapping sensor type name to a dict with 'count', 'min', 'max'
+        and 'mean'. Sensor types with no samples are left out.
+    """
+    if len(series) == 0:
+        return {}
+    order = np.argsort(series.type_codes, kind='stable')
+    codes = series.type_codes[order]
+    values = series.values[order]
+    # Start index of each run of equal sensor codes.
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, len(codes)])
+    sums = np.add.reduceat(values, starts)
+    stats = zip(
+        codes[starts].tolist(),
+        counts.tolist(),
+        np.minimum.reduceat(values, starts).tolist(),
+        np.maximum.reduceat(values, starts).tolist(),
+        (sums / counts).tolist(),
+    )
+    return {
+        SENSOR_TYPES[code]: {'count': count, 'min': low, 'max': high, 'mean': mean}
+        for code, count, low, high, mean in stats
+    }
+
+
+def heart_rate_zones(series, max_heart_rate, zones=HEART_RATE_ZONES):
+    """Returns how long a workout spent in each heart rate zone.
+
+    Each heart rate sample counts until the next heart rate sample; the last
+    sample counts for zero seconds.
+
+    Returns:
+        A dict with 'samples' and 'seconds' lists, one entry per zone.
+        Samples below the first zone are not counted.
+    """
+    heart_rate = series.for_sensor('heart_rate').sorted()
+    bounds = np.asarray(zones) * max_heart_rate
+    zone_index = np.digitize(heart_rate.values, bounds) - 1
+    in_zone = zone_index >= 0
+    durations = np.diff(heart_rate.timestamps, append=heart_rate.timestamps[-1:])
+    return {
+        'samples': np.bincount(
+            zone_index[in_zone], minlength=len(zones)).tolist(),
+        'seconds': np.bincount(
+            zone_index[in_zone], weights=durations[in_zone],
+            minlength=len(zones)).astype(np.int64).tolist(),
+    }
+
+
+def rolling_average(series, sensor_type, window_seconds=60):
+    """Returns the trailing time-window average of one sensor.
+
+    The average at each sample covers every sample of that sensor in
+    (timestamp - window_seconds, timestamp].
+
+    Returns:
+        A tuple of (timestamps, averages) NumPy arrays.
+    """
+    samples = series.for_sensor(sensor_type).sorted()
+    timestamps = samples.timestamps
+    cumulative = np.r_[0.0, np.cumsum(samples.values)]
+    # Ties share a timestamp, so every sample in a tie sees the whole tie.
+    ends = np.searchsorted(timestamps, timestamps, side='right')
+    starts = np.searchsorted(timestamps, timestamps - window_seconds, side='right')
+    return timestamps, (cumulative[ends] - cumulative[starts]) / (ends - starts)
+
+
+def per_minute(series):
+    """Returns the mean of each sensor for every minute of a workout.
+
+    Returns:
+        A DataFrame indexed by minute (datetime64) with one column per sensor
+        type present. Minutes without samples of a sensor are NaN.
+    """
+    frame = _samples_frame(series)
+    frame['minute'] = (frame['timestamp'] // 60 * 60).astype('datetime64[s]')
+    table = frame.pivot_table(
+        index='minute', columns='sensor_type', values='value',
+        aggfunc='mean', observed=True)
+    table.columns = table.columns.astype(str)
+    table.columns.name = None
+    return table
+
+
+def summarize_workouts(workout_series):
+    """Returns per-sensor statistics for many workouts in one pass.
+
+    Args:
+        workout_series: a dict mapping workout_id to its SensorSeries.
+
+    Returns:
+        A DataFrame indexed by (workout_id, sensor_type) with 'count', 'min',
+        'max' and 'mean' columns.
+    """
+    workout_ids = list(workout_series)
+    if not workout_ids:
+        return pd.DataFrame(
+            columns=_STAT_COLUMNS,
+            index=pd.MultiIndex.from_tuples([], names=['workout_id', 'sensor_type']))
+    lengths = [len(workout_series[workout_id]) for workout_id in workout_ids]
+    combined = SensorSeries(
+        np.concatenate([workout_series[w].timestamps for w in workout_ids]),
+        np.concatenate([workout_series[w].values for w in workout_ids]),
+        np.concatenate([workout_series[w].type_codes for w in workout_ids]),
+    )
+    frame = _samples_frame(combined)
+    frame['workout_id'] = pd.Categorical.from_codes(
+        np.repeat(np.arange(len(workout_ids)), lengths), categories=workout_ids)
+    return frame.groupby(['workout_id', 'sensor_type'], observed=True)['value'].agg(
+        _STAT_COLUMNS)
+
+
+def summarize_user(user_id):
+    """Returns summarize_workouts() for every workout of the given user."""
+    return summarize_workouts({
+        workout['workout_id']: get_user_sensor_data(user_id, workout['workout_id'])
+        for workout in get_user_workouts(user_id)
+    })
+
+
+def _samples_frame(series):
+    # A DataFrame view of the series with the sensor type as a categorical.
+    return pd.DataFrame({
+        'timestamp': series.timestamps,
+        'value': series.values,
+        'sensor_type': pd.Categorical.from_codes(
+            series.type_codes, categories=list(SENSOR_TYPES)),
+    })
@@ -0,0 +1,120 @@
+#############################################################################
+# analytics_test.py
+#
+# This file contains tests for analytics.py.
+#############################################################################
+
+import unittest
+from datetime import date
+
+import numpy as np
+
+import analytics
+from sensor_data import SensorSeries
+
+
+def make_series(samples):
+    """Builds a SensorSeries from (sensor_type, minute, value) tuples."""
+    return SensorSeries.from_records([
+        {'sensor_type': sensor_type,
+         'timestamp': f'2024-01-01 00:{minute:02d}:00',
+         'data': value}
+        for sensor_type, minute, value in samples
+    ])
+
+
+class TestSensorStats(unittest.TestCase):
+    """Tests the sensor_stats function."""
+
+    def test_stats_per_sensor(self):
+        """Min, max, mean and count are grouped by sensor type."""
+        series = make_series([
+            ('heart_rate', 0, 100.0), ('pressure', 1, 5.0),
+            ('heart_rate', 2, 140.0), ('heart_rate', 3, 120.0),
+        ])
+        stats = analytics.sensor_stats(series)
+        self.assertEqual(set(stats), {'heart_rate', 'pressure'})
+        self.assertEqual(
+            stats['heart_rate'], {'count': 3, 'min': 100.0, 'max': 140.0, 'mean': 120.0})
+        self.assertEqual(stats['pressure']['count'], 1)
+
+    def test_empty_series(self):
+        """An empty workout has no stats."""
+        self.assertEqual(analytics.sensor_stats(SensorSeries.empty()), {})
+
+
+class TestHeartRateZones(unittest.TestCase):
+    """Tests the heart_rate_zones function."""
+
+    def test_zone_samples_and_seconds(self):
+        """Each sample counts until the next heart rate sample."""
+        series = make_series([
+            ('heart_rate', 0, 40.0),   # below zone 1
+            ('heart_rate', 1, 55.0),   # zone 1
+            ('heart_rate', 3, 95.0),   # zone 5
+            ('accelerometer', 4, 1.0),
+            ('heart_rate', 5, 85.0),   # zone 4, last sample
+        ])
+        zones = analytics.heart_rate_zones(series, max_heart_rate=100)
+        self.assertEqual(zones['samples'], [1, 0, 0, 1, 1])
+        self.assertEqual(zones['seconds'], [120, 0, 0, 0, 120])
+
+    def test_no_heart_rate(self):
+        """Workouts without heart rate samples have empty zones."""
+        zones = analytics.heart_rate_zones(make_series([('pressure', 0, 1.0)]), 190)
+        self.assertEqual(zones, {'samples': [0] * 5, 'seconds': [0] * 5})
+
+
+class TestRollingAndResampling(unittest.TestCase):
+    """Tests rolling_average and per_minute."""
+
+    def test_rolling_average(self):
+        """The window covers the trailing window_seconds."""
+        series = make_series([
+            ('heart_rate', 0, 100.0), ('heart_rate', 1, 110.0),
+            ('heart_rate', 3, 130.0), ('pressure', 3, 9.0),
+        ])
+        timestamps, averages = analytics.rolling_average(series, 'heart_rate', 120)
+        self.assertEqual(len(timestamps), 3)
+        np.testing.assert_allclose(averages, [100.0, 105.0, 130.0])
+
+    def test_per_minute(self):
+        """Samples are averaged into one row per minute."""
+        series = SensorSeries.from_records([
+            {'sensor_type': 'heart_rate', 'timestamp': '2024-01-01 00:00:10', 'data': 100.0},
+            {'sensor_type': 'heart_rate', 'timestamp': '2024-01-01 00:00:50', 'data': 120.0},
+            {'sensor_type': 'heart_rate', 'timestamp': '2024-01-01 00:01:30', 'data': 90.0},
+        ])
+        table = analytics.per_minute(series)
+        self.assertEqual(list(table.columns), ['heart_rate'])
+        self.assertEqual(table['heart_rate'].tolist(), [110.0, 90.0])
+
+
+class TestSummarizeWorkouts(unittest.TestCase):
+    """Tests summarize_workouts and summarize_user."""
+
+    def test_many_workouts(self):
+        """All workouts are summarized together and keyed by workout."""
+        summary = analytics.summarize_workouts({
+            'w1': make_series([('heart_rate', 0, 100.0), ('heart_rate', 1, 120.0)]),
+            'w2': make_series([('heart_rate', 0, 80.0), ('pressure', 1, 2.0)]),
+        })
+        self.assertEqual(summary.loc[('w1', 'heart_rate'), 'mean'], 110.0)
+        self.assertEqual(summary.loc[('w2', 'heart_rate'), 'count'], 1)
+        self.assertEqual(summary.loc[('w2', 'pressure'), 'max'], 2.0)
+        self.assertEqual(len(summary), 3)
+
+    def test_summarize_user(self):
+        """Every workout of the user appears in the summary."""
+        summary = analytics.summarize_user('user1')
+        self.assertGreater(len(summary), 0)
+        self.assertEqual(summary.index.names, ['workout_id', 'sensor_type'])
+
+    def test_max_heart_rate_estimate(self):
+        """The estimate uses the user's age on the given date."""
+        self.assertEqual(
+            analytics.estimate_max_heart_rate('1990-01-01', date(2024, 6, 1)), 186)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,39 +6,152 @@
 #############################################################################
 
 import streamlit as st
-from modules import display_my_custom_component, display_post, display_genai_advice, display_activity_summary, display_recent_workouts
-from data_fetcher import get_user_posts, get_genai_advice, get_user_profile, get_user_sensor_data, get_user_workouts
+import metrics
+import startup
+from advice import AdviceScheduler
+from modules import display_my_custom_component, display_post, display_genai_advice, display_activity_summary
+from modules import display_recent_workouts, display_leaderboard, display_metrics_panel, display_section
+from modules import display_live_workout, LIVE_REFRESH_SECONDS
+from data_fetcher import fetch_page_data, get_user_sensor_data
+from live import LiveWorkout, Replay
+from leaderboards import get_friends_leaderboard
 
 userId = 'user1'
 
-workouts = get_user_workouts(userId)
-genai_advice = get_genai_advice(userId)
+# How often (in seconds) the background scheduler refreshes active users' advice.
+ADVICE_REFRESH_INTERVAL = 15 * 60
 
+# How many times faster than it was recorded the live workout demo replays
+# the latest workout, and the session state key holding the replay.
+LIVE_REPLAY_SPEED = 60
+LIVE_WORKOUT_KEY = "live_workout"
 
-def display_app_page():
-    """Displays the home page of the app."""
-    st.title('Welcome to SDS!')
 
+@st.cache_resource
+def start_advice_scheduler():
+    """Starts one background advice scheduler for the whole server process."""
+    return AdviceScheduler().start(interval=ADVICE_REFRESH_INTERVAL)
+
+
+@st.cache_resource
+def start_metrics_server():
+    """Serves Prometheus metrics once per server process, if configured."""
+    if metrics.ENABLED and metrics.METRICS_PORT:
+        return metrics.start_http_server(metrics.METRICS_PORT)
+    return None
+
+
+def load_home_page(user_id):
+    """Fetches what the home page shows for a user.
+
+    Nothing is fetched when app.py is imported, only when a page is shown.
+
+    Returns:
+        A (page_data, genai_advice, leaderboard) tuple.
+    """
+    # Profile, workouts, posts and advice are fetched concurrently; any part that
+    # fails or times out comes back empty instead of breaking the page.
+    page_data = fetch_page_data(user_id)
+    genai_advice = page_data['genai_advice'] or {'timestamp': None, 'content': None, 'image': None}
+    if page_data['genai_advice'] is None:
+        # Don't wait for the model: ask for advice in the background, and it will
+        # be shown on a later rerun.
+        start_advice_scheduler().request(user_id)
+
+    # This week's steps among the user's friends (the week of their latest
+    # workout, so the demo data has something to show).
+    activity_totals = page_data['activity_totals']
+    leaderboard = get_friends_leaderboard(
+        user_id, 'steps', 'week', activity_totals['period_start'] if activity_totals else None)
+    return page_data, genai_advice, leaderboard
+
+
+@st.fragment
+def display_name_section():
+    """Displays the name box and the custom component that greets it.
+
+    This is a fragment, so typing a name reruns only this section.
+    """
     # An example of displaying a custom component called "my_custom_component"
     value = st.text_input('Enter your name')
     display_my_custom_component(value)
-    display_post(
+
+
+@st.fragment
+def display_live_section(workouts):
+    """Displays a toggle that replays the latest workout as a live workout.
+
+    There is no device to stream from yet, so the latest workout's samples
+    are pushed as if they were coming in now. Only this section reruns when
+    the toggle is used.
+    """
+    if not workouts or not st.toggle("Replay latest workout live"):
+        st.session_state.pop(LIVE_WORKOUT_KEY, None)
+        return
+    display_live_replay(workouts[-1]['workout_id'])
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def display_live_replay(workout_id):
+    """Displays the replayed workout, updated every LIVE_REFRESH_SECONDS.
+
+    Each update is one rerun of this fragment alone; the rest of the page
+    is never held up by it. The replay and its charts are kept in session
+    state between updates.
+    """
+    state = st.session_state.get(LIVE_WORKOUT_KEY)
+    if state is None or state['workout_id'] != workout_id:
+        live = LiveWorkout()
+        state = st.session_state[LIVE_WORKOUT_KEY] = {
+            'workout_id': workout_id,
+            'live': live,
+            'replay': Replay(get_user_sensor_data(userId, workout_id), live, speed=LIVE_REPLAY_SPEED),
+            'charts': {},
+        }
+    if not len(state['replay'].samples):
+        st.info("The latest workout has no sensor samples to replay.")
+        return
+    state['replay'].push_due()
+    display_live_workout(state['live'], state['charts'])
+
+
+def display_app_page():
+    """Displays the home page of the app.
+
+    Each section is a fragment (see modules.display_section), so a widget
+    only reruns the section it is in.
+    """
+    st.title('Welcome to SDS!')
+    page_data, genai_advice, leaderboard = load_home_page(userId)
+    workouts = page_data['workouts']
+
+    display_name_section()
+    display_section(
+        display_post,
         username="WorkoutWarrior",
         user_image="https://upload.wikimedia.org/wikipedia/commons/8/89/Portrait_Placeholder.png?20170328184010", 
         timestamp="2024-01-01 00:00:00",
         content="Crushed my morning run! Feeling great.",
         post_image="https://firstbenefits.org/wp-content/uploads/2017/10/placeholder.png"
     )
-    display_activity_summary(workouts)
-    display_recent_workouts(workouts)
-    display_genai_advice(
+    display_section(display_activity_summary, workouts, page_data['activity_totals'], page_data['route'])
+    display_section(display_recent_workouts, workouts, page_size=10, lazy=True, user_id=userId)
+    display_live_section(workouts)
+    display_section(display_leaderboard, leaderboard, 'steps', highlight_user_id=userId)
+    display_section(
+        display_genai_advice,
         genai_advice['timestamp'],
         genai_advice['content'],
         genai_advice['image']
     )
+    if metrics.ENABLED:
+        display_metrics_panel(metrics.registry.snapshot())
 
 
 
 # This is the starting point for your app. You do not need to change these lines
 if __name__ == '__main__':
-    display_app_page()
+    start_metrics_server()
+    with metrics.timer('display_app_page', kind='page'):
+        display_app_page()
+    startup.record_first_render()
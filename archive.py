@@ -0,0 +1,333 @@
+#############################################################################
+# archive.py
+#
+# This file contains bulk export and import of users' histories as columnar
+# files, for archival, backfills and offline analysis.
+#
+# Each table is written as one file per user and month (users and their
+# friendships per user only) in a Hive-style layout:
+#
+#     <directory>/<table>/user_id=<id>/month=<YYYY-MM>/part-0.arrow
+#
+# Arrow files are uncompressed Arrow IPC, which read_table memory-maps: the
+# columns it returns point into the files' pages, so reading a year of
+# samples copies nothing until the data is used. Parquet files are smaller
+# (zstd-compressed), for archives that are read rarely, and are decoded when
+# read.
+#
+# Run `python archive.py export DIRECTORY` or `python archive.py import
+# DIRECTORY` to copy every user (or --users) out of or into the database
+# at SDS_DATABASE_PATH.
+#############################################################################
+
+import argparse
+import os
+import shutil
+import urllib.parse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cache import invalidate_user
+from data_fetcher import get_storage
+from records import Post, Workout
+from sensor_data import SensorSeries
+
+FORMATS = {'arrow': '.arrow', 'parquet': '.parquet'}
+
+# Each table's columns, in the order Storage.get_archive_rows returns them.
+SCHEMAS = {
+    'users': pa.schema([
+        ('user_id', pa.string()), ('full_name', pa.string()), ('username', pa.string()),
+        ('date_of_birth', pa.string()), ('profile_image', pa.string()),
+    ]),
+    'friendships': pa.schema([
+        ('user_id', pa.string()), ('friend_id', pa.string()), ('position', pa.int64()),
+    ]),
+    'workouts': pa.schema([
+        ('workout_id', pa.string()), ('user_id', pa.string()),
+        ('start_timestamp', pa.string()), ('end_timestamp', pa.string()),
+        ('start_lat', pa.float64()), ('start_lng', pa.float64()),
+        ('end_lat', pa.float64()), ('end_lng', pa.float64()),
+        ('distance', pa.float64()), ('steps', pa.int64()), ('calories_burned', pa.int64()),
+    ]),
+    # The workout id repeats for every sample, so it is dictionary-encoded.
+    'sensor_samples': pa.schema([
+        ('workout_id', pa.dictionary(pa.int32(), pa.string())), ('timestamp', pa.int64()),
+        ('sensor_type', pa.int8()), ('value', pa.float64()),
+    ]),
+    'posts': pa.schema([
+        ('post_id', pa.string()), ('user_id', pa.string()), ('timestamp', pa.string()),
+        ('content', pa.string()), ('image', pa.string()),
+    ]),
+    'advice': pa.schema([
+        ('advice_id', pa.string()), ('user_id', pa.string()), ('timestamp', pa.string()),
+        ('content', pa.string()), ('image', pa.string()), ('input_hash', pa.string()),
+    ]),
+}
+
+# Tables partitioned by month as well as by user.
+MONTHLY_TABLES = ('workouts', 'sensor_samples', 'posts', 'advice')
+
+
+def export_users(directory, user_ids=None, file_format='arrow', storage=None):
+    """Writes users' histories to partitioned files under `directory`.
+
+    A user's existing files are replaced, so exporting again is safe.
+
+    Args:
+        user_ids: the users to export. Defaults to everyone.
+        file_format: 'arrow' (memory-mappable) or 'parquet' (compressed).
+
+    Returns:
+        {table: rows written}.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f'Unknown archive format {file_format}.')
+    storage = storage or get_storage()
+    counts = dict.fromkeys(SCHEMAS, 0)
+    for user_id in storage.get_user_ids() if user_ids is None else user_ids:
+        for table in SCHEMAS:
+            shutil.rmtree(_user_directory(directory, table, user_id), ignore_errors=True)
+        for table in ('users', 'friendships'):
+            counts[table] += _export(storage, directory, table, user_id, None, file_format)
+        for month in storage.get_user_months(user_id):
+            for table in MONTHLY_TABLES:
+                counts[table] += _export(storage, directory, table, user_id, month, file_format)
+    return counts
+
+
+def import_users(directory, user_ids=None, months=None, storage=None):
+    """Loads users' histories from files written by export_users.
+
+    Everything is written in one transaction. Rows that already exist are
+    updated, except sensor samples: workouts that already have samples keep
+    them. Friendships with users that are neither being imported nor stored
+    are skipped.
+
+    Args:
+        user_ids: the users to import. Defaults to every user in the archive.
+        months: only import workouts, samples, posts and advice from these
+            'YYYY-MM' months. Defaults to all of them.
+
+    Returns:
+        {table: rows imported}.
+    """
+    storage = storage or get_storage()
+    if user_ids is None:
+        user_ids = archived_user_ids(directory)
+    tables = {table: read_table(directory, table, user_ids, months)
+              for table in SCHEMAS if table != 'sensor_samples'}
+
+    # Work out what to skip before writing: the reads need a connection of
+    # their own.
+    users = set(tables['users']['user_id'].to_pylist())
+    friend_ids = tables['friendships']['friend_id'].to_pylist()
+    known = users | set(storage.get_users(set(friend_ids) - users))
+    tables['friendships'] = tables['friendships'].filter(
+        pa.array([friend_id in known for friend_id in friend_ids], pa.bool_()))
+    series = read_sensor_data(directory, user_ids, months)
+    stored = storage.get_workouts_with_samples(list(series))
+    series = {workout_id: s for workout_id, s in series.items() if workout_id not in stored}
+
+    with storage.write() as connection:
+        for table in ('users', 'friendships', 'workouts', 'posts', 'advice'):
+            storage.add_archive_rows(table, _rows(tables[table]), connection)
+        if series:
+            storage.add_sensor_data_bulk(
+                list(series), [len(s) for s in series.values()], SensorSeries(
+                    np.concatenate([s.timestamps for s in series.values()]),
+                    np.concatenate([s.values for s in series.values()]),
+                    np.concatenate([s.type_codes for s in series.values()])),
+                connection)
+    for user_id in user_ids:
+        invalidate_user(user_id)
+    return {
+        table: sum(map(len, series.values())) if table == 'sensor_samples'
+        else tables[table].num_rows
+        for table in SCHEMAS
+    }
+
+
+def archived_user_ids(directory):
+    """Returns the ids of the users in an archive, in order."""
+    users = os.path.join(directory, 'users')
+    if not os.path.isdir(users):
+        return []
+    return sorted(urllib.parse.unquote(name.partition('=')[2]) for name in os.listdir(users))
+
+
+def read_table(directory, table, user_ids=None, months=None):
+    """Reads a table's rows from an archive as one pyarrow Table.
+
+    Arrow files are memory-mapped, and their rows are not copied: each
+    file's columns become chunks of the returned table.
+
+    Args:
+        user_ids: only these users. Defaults to everyone in the archive.
+        months: only these 'YYYY-MM' months. Ignored for users and
+            friendships.
+    """
+    if table not in SCHEMAS:
+        raise ValueError(f'Unknown archive table {table}.')
+    if user_ids is None:
+        user_ids = archived_user_ids(directory)
+    chunks = [_read_file(path) for path in _paths(directory, table, user_ids, months)]
+    if not chunks:
+        return SCHEMAS[table].empty_table()
+    return pa.concat_tables(chunks)
+
+
+def read_sensor_data(directory, user_ids, months=None):
+    """Returns {workout_id: SensorSeries} for users' archived workouts.
+
+    The series' arrays are read-only views of the memory-mapped files (for
+    Arrow archives), ready for analytics.summarize_workouts and friends.
+    """
+    if isinstance(user_ids, str):
+        user_ids = [user_ids]
+    series = {}
+    for batch in read_table(directory, 'sensor_samples', user_ids, months).to_batches():
+        if batch.num_rows == 0:
+            continue
+        workout_ids = batch.column('workout_id')
+        codes = workout_ids.indices.to_numpy()
+        names = workout_ids.dictionary.to_pylist()
+        timestamps = batch.column('timestamp').to_numpy()
+        values = batch.column('value').to_numpy()
+        type_codes = batch.column('sensor_type').to_numpy()
+        # Samples are grouped by workout, so each workout is one slice.
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            workout = SensorSeries(
+                timestamps[start:end], values[start:end], type_codes[start:end])
+            workout_id = names[codes[start]]
+            if workout_id in series:
+                # A workout split across Parquet row groups.
+                previous = series[workout_id]
+                workout = SensorSeries(
+                    np.r_[previous.timestamps, workout.timestamps],
+                    np.r_[previous.values, workout.values],
+                    np.r_[previous.type_codes, workout.type_codes])
+            series[workout_id] = workout
+    return series
+
+
+def read_workouts(directory, user_id, months=None):
+    """Returns a user's archived workouts as Workout records, oldest first."""
+    table = read_table(directory, 'workouts', [user_id], months)
+    columns = table.to_pydict()
+    return [
+        Workout(workout_id, start, end, _lat_lng(start_lat, start_lng),
+                _lat_lng(end_lat, end_lng), distance, steps, calories)
+        for workout_id, start, end, start_lat, start_lng, end_lat, end_lng, distance, steps,
+        calories in zip(
+            columns['workout_id'], columns['start_timestamp'], columns['end_timestamp'],
+            columns['start_lat'], columns['start_lng'], columns['end_lat'],
+            columns['end_lng'], columns['distance'], columns['steps'],
+            columns['calories_burned'])
+    ]
+
+
+def read_posts(directory, user_id, months=None):
+    """Returns a user's archived posts as Post records, newest first."""
+    table = read_table(directory, 'posts', [user_id], months)
+    columns = table.to_pydict()
+    posts = list(map(Post, columns['user_id'], columns['post_id'], columns['timestamp'],
+                     columns['content'], columns['image']))
+    return posts[::-1]
+
+
+def _export(storage, directory, table, user_id, month, file_format):
+    # Writes one partition and returns how many rows it has. Empty
+    # partitions aren't written.
+    since = until = None
+    if month is not None:
+        since, until = f'{month}-01', _next_month(month)
+    names, rows = storage.get_archive_rows(table, user_id, since, until)
+    if not rows:
+        return 0
+    schema = SCHEMAS[table]
+    columns = zip(*rows)
+    data = pa.table({name: pa.array(column, schema.field(name).type)
+                     for name, column in zip(names, columns)}, schema=schema)
+    path = os.path.join(_user_directory(directory, table, user_id),
+                        *([f'month={month}'] if month else []), 'part-0' + FORMATS[file_format])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    if file_format == 'parquet':
+        pq.write_table(data, temporary, compression='zstd')
+    else:
+        with pa.OSFile(temporary, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(data)
+    os.replace(temporary, path)
+    return len(rows)
+
+
+def _read_file(path):
+    if path.endswith(FORMATS['parquet']):
+        return pq.read_table(path, memory_map=True)
+    # The returned columns keep the memory map open for as long as they live.
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def _paths(directory, table, user_ids, months):
+    # The files holding the given users' (and months') rows, in order.
+    paths = []
+    for user_id in user_ids:
+        user_directory = _user_directory(directory, table, user_id)
+        if not os.path.isdir(user_directory):
+            continue
+        if table in MONTHLY_TABLES:
+            names = sorted(os.listdir(user_directory))
+            if months is not None:
+                names = [name for name in names if name.partition('=')[2] in months]
+            partitions = [os.path.join(user_directory, name) for name in names]
+        else:
+            partitions = [user_directory]
+        for partition in partitions:
+            paths.extend(os.path.join(partition, name) for name in sorted(os.listdir(partition))
+                         if name.endswith(tuple(FORMATS.values())))
+    return paths
+
+
+def _user_directory(directory, table, user_id):
+    return os.path.join(directory, table, 'user_id=' + urllib.parse.quote(user_id, safe=''))
+
+
+def _next_month(month):
+    # '2024-12' -> '2025-01-01'
+    year, month = map(int, month.split('-'))
+    return f'{year + month // 12:04d}-{month % 12 + 1:02d}-01'
+
+
+def _rows(table):
+    # A table's rows as tuples, built column by column.
+    return zip(*(column.to_pylist() for column in table.columns))
+
+
+def _lat_lng(lat, lng):
+    return None if lat is None else (lat, lng)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Copies users\' histories between the database and an archive.')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('directory')
+    parser.add_argument('--users', nargs='+', help='only these user ids')
+    parser.add_argument('--format', choices=list(FORMATS), default='arrow',
+                        help='file format to export to (default: arrow)')
+    options = parser.parse_args()
+    if options.command == 'export':
+        counts = export_users(options.directory, options.users, options.format)
+    else:
+        counts = import_users(options.directory, options.users)
+    for table, count in counts.items():
+        print(f'{table:<16} {count:>12,}')
+
+
+if __name__ == '__main__':
+    main()
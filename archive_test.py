@@ -0,0 +1,110 @@
+#############################################################################
+# archive_test.py
+#
+# This file contains tests for archive.py.
+#############################################################################
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import archive
+import synthetic
+from analytics import summarize_workouts
+from storage import Storage
+from synthetic_test import dump
+
+
+class TestArchive(unittest.TestCase):
+    """Tests exporting, reading and importing archives."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage = Storage(':memory:')
+        synthetic.generate(cls.storage, 12, seed=3, workouts_per_user=6, posts_per_user=3,
+                           sample_interval=300, days=90)
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.counts = archive.export_users(cls.directory.name, storage=cls.storage)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        cls.directory.cleanup()
+
+    def test_layout(self):
+        """Files are partitioned by table, user and month."""
+        months = {w['start_timestamp'][:7] for w in self.storage.get_workouts('user1')}
+        user_directory = os.path.join(self.directory.name, 'workouts', 'user_id=user1')
+        self.assertEqual(sorted(os.listdir(user_directory)),
+                         sorted(f'month={month}' for month in months))
+        for month in months:
+            self.assertTrue(os.path.exists(os.path.join(
+                user_directory, f'month={month}', 'part-0.arrow')))
+        self.assertEqual(archive.archived_user_ids(self.directory.name),
+                         sorted(synthetic.user_id(i) for i in range(12)))
+        self.assertEqual(self.counts['workouts'], sum(
+            len(self.storage.get_workouts(user_id)) for user_id in self.storage.get_user_ids()))
+
+    def test_round_trip(self):
+        """Importing an export into an empty database recreates it."""
+        for file_format in archive.FORMATS:
+            with self.subTest(file_format), tempfile.TemporaryDirectory() as directory:
+                archive.export_users(directory, file_format=file_format, storage=self.storage)
+                copy = Storage(':memory:')
+                counts = archive.import_users(directory, storage=copy)
+                self.assertEqual(counts, self.counts)
+                self.assertEqual(dump(copy), dump(self.storage))
+
+                # Importing again changes nothing (but rollup distances,
+                # which are re-added and so may differ by rounding).
+                archive.import_users(directory, storage=copy)
+                rows, expected = dump(copy), dump(self.storage)
+                for table in rows:
+                    if table != 'user_rollups':
+                        self.assertEqual(rows[table], expected[table], table)
+                for row, expected_row in zip(rows['user_rollups'], expected['user_rollups']):
+                    self.assertEqual(row[:5], expected_row[:5])
+                    self.assertAlmostEqual(row[5], expected_row[5])
+                copy.close()
+
+    def test_sensor_data_is_memory_mapped(self):
+        """Samples are read without copying, and analyze like stored ones."""
+        series = archive.read_sensor_data(self.directory.name, 'user2')
+        workouts = self.storage.get_workouts('user2')
+        self.assertEqual(list(series), [w['workout_id'] for w in workouts])
+        for workout_id, samples in series.items():
+            self.assertFalse(samples.values.flags.writeable)
+            self.assertFalse(samples.timestamps.flags.owndata)
+        stored = {w['workout_id']: self.storage.get_sensor_data(w['workout_id']) for w in workouts}
+        pd.testing.assert_frame_equal(summarize_workouts(series), summarize_workouts(stored))
+
+    def test_records(self):
+        """Workouts and posts read back as the records Storage returns."""
+        self.assertEqual(archive.read_workouts(self.directory.name, 'user3'),
+                         self.storage.get_workouts('user3'))
+        self.assertEqual(archive.read_posts(self.directory.name, 'user3'),
+                         self.storage.get_posts('user3'))
+        month = self.storage.get_user_months('user3')[-1]
+        recent = archive.read_workouts(self.directory.name, 'user3', months=[month])
+        self.assertTrue(recent)
+        self.assertTrue(all(w['start_timestamp'].startswith(month) for w in recent))
+
+    def test_partial_import(self):
+        """Importing one user skips friendships with users that don't exist."""
+        copy = Storage(':memory:')
+        counts = archive.import_users(self.directory.name, ['user4'], storage=copy)
+        self.assertEqual(counts['users'], 1)
+        self.assertEqual(copy.get_user('user4')['friends'], [])
+        self.assertEqual(copy.get_workouts('user4'), self.storage.get_workouts('user4'))
+        copy.close()
+
+    def test_unknown_format(self):
+        """Only Arrow and Parquet archives can be written."""
+        with self.assertRaises(ValueError):
+            archive.export_users(self.directory.name, file_format='csv', storage=self.storage)
+
+
+if __name__ == "__main__":
+    unittest.main()
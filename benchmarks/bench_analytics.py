@@ -0,0 +1,70 @@
+#############################################################################
+# benchmarks/bench_analytics.py
+#
+# Measures how many sensor samples per second analytics.py can process, on
+# synthetic workouts (see synthetic.py).
+#
+# Run from the repository root with:
+#     python -m benchmarks.bench_analytics
+#############################################################################
+
+import argparse
+import time
+
+import numpy as np
+
+import analytics
+import synthetic
+
+
+def make_workouts(workout_count, minutes, sample_interval, seed=0):
+    """Returns {workout_id: SensorSeries} of synthetic workouts lasting
+    `minutes` each, with every sensor read every sample_interval seconds."""
+    durations = np.full(workout_count, minutes * 60)
+    series = synthetic.sensor_samples(durations, sample_interval, seed=seed)
+    return {f'workout{index}': samples for index, samples in enumerate(series)}
+
+
+def best_time(function, repeat):
+    # Best of several runs, to reduce noise from the rest of the machine.
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workouts', type=int, default=100)
+    parser.add_argument('--minutes', type=int, default=60, help='minutes per workout')
+    parser.add_argument('--sample-interval', type=int, default=1,
+                        help='seconds between readings of each sensor')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workouts = make_workouts(args.workouts, args.minutes, args.sample_interval)
+    one_workout = next(iter(workouts.values()))
+    total_samples = sum(map(len, workouts.values()))
+
+    cases = [
+        ('sensor_stats', len(one_workout),
+         lambda: analytics.sensor_stats(one_workout)),
+        ('heart_rate_zones', len(one_workout),
+         lambda: analytics.heart_rate_zones(one_workout, 190)),
+        ('rolling_average', len(one_workout),
+         lambda: analytics.rolling_average(one_workout, 'heart_rate', 60)),
+        ('per_minute', len(one_workout),
+         lambda: analytics.per_minute(one_workout)),
+        ('summarize_workouts', total_samples,
+         lambda: analytics.summarize_workouts(workouts)),
+    ]
+    print(f'{"case":<20}{"samples":>12}{"seconds":>10}{"samples/s":>16}')
+    for name, samples, function in cases:
+        seconds = best_time(function, args.repeat)
+        print(f'{name:<20}{samples:>12,}{seconds:>10.4f}{samples / seconds:>16,.0f}')
+
+
+if __name__ == '__main__':
+    main()
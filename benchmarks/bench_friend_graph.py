@@ -0,0 +1,101 @@
+#############################################################################
+# benchmarks/bench_friend_graph.py
+#
+# Builds a FriendGraph over a synthetic social network (1M users by default)
+# and compares its queries with the same queries on plain friends lists, as
+# stored in profile dicts.
+#
+# Users are split into communities (see synthetic.friendships); most
+# friendships are inside a user's community, so friends of friends overlap
+# the way they do in real networks.
+#
+# Run from the repository root with:
+#     python -m benchmarks.bench_friend_graph
+#############################################################################
+
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+import synthetic
+from friend_graph import FriendGraph
+
+
+def synthetic_graph(user_count, friends_per_user, community_size, hubs=10, hub_friends=50_000,
+                    seed=0):
+    """Returns a FriendGraph of synthetic.friendships, listed both ways.
+
+    The first `hubs` users are also friends with `hub_friends` random users,
+    like popular accounts.
+    """
+    sources, targets = synthetic.friendships(
+        user_count, friends_per_user, np.random.default_rng(seed), community_size, hubs,
+        hub_friends)
+    user_ids = [f'u{i}' for i in range(user_count)]
+    return FriendGraph.from_edges(user_ids, sources, targets)
+
+
+def list_suggestions(friends, user_id, limit):
+    """Friend suggestions computed from friends lists with a Counter."""
+    counts = Counter(
+        candidate for friend in friends[user_id] for candidate in friends[friend]
+        if candidate != user_id and candidate not in friends[user_id])
+    return sorted(counts.items(), key=lambda item: -item[1])[:limit]
+
+
+def per_call(function, arguments):
+    started = time.perf_counter()
+    for args in arguments:
+        function(*args)
+    return (time.perf_counter() - started) / len(arguments) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--friends', type=int, default=20)
+    parser.add_argument('--community-size', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    graph = synthetic_graph(args.users, args.friends, args.community_size)
+    build_seconds = time.perf_counter() - started
+    print(f'{len(graph):,} users, {len(graph.indices):,} friendships')
+    print(f'  build {build_seconds:.1f} s, CSR arrays {graph.nbytes / 2**20:.0f} MiB')
+
+    rng = np.random.default_rng(1)
+    users = [graph.user_ids[i] for i in rng.integers(0, args.users, args.queries)]
+    others = [graph.user_ids[i] for i in rng.integers(0, args.users, args.queries)]
+    pairs = list(zip(users, others))
+    hub_pairs = [(graph.user_ids[i % 10], other) for i, other in enumerate(others)]
+
+    # Friends lists for just the users the queries touch, as a profile
+    # dict would hold them.
+    needed = set(users) | set(others) | {a for a, _ in hub_pairs}
+    needed |= {friend for user_id in users for friend in graph.friends(user_id)}
+    friends = {user_id: graph.friends(user_id) for user_id in needed}
+
+    rows = [
+        ('are_friends', lambda a, b: b in friends[a], graph.are_friends, pairs),
+        ('are_friends (hub)', lambda a, b: b in friends[a], graph.are_friends, hub_pairs),
+        ('mutual_friend_count', lambda a, b: len(set(friends[a]) & set(friends[b])),
+         graph.mutual_friend_count, pairs),
+        ('mutual_friend_count (hub)', lambda a, b: len(set(friends[a]) & set(friends[b])),
+         graph.mutual_friend_count, hub_pairs),
+        ('suggest_friends', lambda a: list_suggestions(friends, a, 10),
+         lambda a: graph.suggest_friends(a, 10), [(a,) for a in users]),
+    ]
+    # The graph caches friend sets, so each query is timed twice: "cold" is
+    # the first query about those users, "warm" a repeat.
+    print(f'  {"query":<28}{"lists us":>10}{"cold us":>10}{"warm us":>10}')
+    for name, with_lists, with_graph, arguments in rows:
+        cold = per_call(with_graph, arguments)
+        warm = per_call(with_graph, arguments)
+        print(f'  {name:<28}{per_call(with_lists, arguments):>10.1f}{cold:>10.1f}{warm:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#############################################################################
+# benchmarks/bench_ingest.py
+#
+# Measures how fast ingest.py writes a long workout's sensor samples into a
+# fresh SQLite database, for each supported file format. The samples come
+# from synthetic.py.
+#
+# Run from the repository root with:
+#     python -m benchmarks.bench_ingest
+#############################################################################
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import ingest
+import synthetic
+from sensor_data import SENSOR_TYPES, format_timestamps
+from storage import Storage
+
+
+def write_samples(directory, sample_count, seed=0):
+    """Writes the same synthetic samples, about sample_count of one long
+    workout read every second, as CSV, JSON Lines and Arrow files."""
+    [series] = synthetic.sensor_samples(
+        [sample_count // len(SENSOR_TYPES)], sample_interval=1, seed=seed)
+    frame = pd.DataFrame({
+        'sensor_type': np.asarray(SENSOR_TYPES)[series.type_codes],
+        'timestamp': format_timestamps(series.timestamps),
+        'data': series.values,
+    })
+    paths = {fmt: os.path.join(directory, f'samples.{fmt}') for fmt in ingest.READERS}
+    frame.to_csv(paths['csv'], index=False)
+    frame.to_json(paths['jsonl'], orient='records', lines=True)
+    with pa.OSFile(paths['arrow'], 'wb') as sink:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=ingest.DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_samples(directory, args.samples)
+        print(f'{"format":<8}{"samples":>12}{"seconds":>10}{"samples/s":>14}{"duplicates":>12}')
+        for file_format, path in paths.items():
+            storage = Storage(os.path.join(directory, f'{file_format}.db'))
+            storage.add_user('u', {'full_name': 'U', 'username': 'u'})
+            storage.add_workouts('u', [{
+                'workout_id': 'w', 'start_timestamp': '2024-01-01 00:00:00',
+                'end_timestamp': '2024-01-01 01:00:00'}])
+            start = time.perf_counter()
+            counts = ingest.ingest_sensor_file(
+                'u', 'w', path, file_format, batch_size=args.batch_size, storage=storage)
+            seconds = time.perf_counter() - start
+            storage.close()
+            print(f'{file_format:<8}{counts["received"]:>12,}{seconds:>10.2f}'
+                  f'{counts["received"] / seconds:>14,.0f}{counts["duplicates"]:>12,}')
+
+
+if __name__ == '__main__':
+    main()
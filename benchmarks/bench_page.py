@@ -0,0 +1,249 @@
+#############################################################################
+# benchmarks/bench_page.py
+#
+# Load-tests the Streamlit page. For synthetic users of increasing size
+# (workouts, posts and sensor samples, from synthetic.py), it drives the
+# whole page (app.py) and each display_* function in modules.py through
+# Streamlit's AppTest, times fetch_page_data on its own, and reports latency
+# percentiles and peak memory for each.
+#
+# The page is measured both warm (data_fetcher's caches kept between reruns,
+# as for a user clicking around) and cold (caches cleared before every
+# rerun, so each rerun pays the full fetch cost).
+#
+# Results can be saved as a baseline and later runs checked against it;
+# --check exits with status 1 if anything got slower or bigger than the
+# baseline allows, so it can gate a CI job on the same machine type.
+#
+# Streamlit logs warnings to stderr while AppTest runs; the report goes to
+# stdout. Run from the repository root with:
+#     python -m benchmarks.bench_page
+#     python -m benchmarks.bench_page --save-baseline
+#     python -m benchmarks.bench_page --check
+#############################################################################
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+import data_fetcher
+import leaderboards
+import synthetic
+from storage import Storage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'bench_page.json')
+
+# Synthetic data sizes: average workouts and posts per user, and seconds
+# between sensor readings (see synthetic.generate).
+SIZES = {
+    'small': (10, 10, 60),
+    'medium': (100, 100, 30),
+    'large': (1_000, 1_000, 30),
+}
+
+# How many users are generated: app.py's user and their friends.
+USER_COUNT = 5
+
+# How many of each user's latest workouts have GPS routes.
+ROUTES_PER_USER = 3
+
+# What --check compares, and how much worse each must also be in absolute
+# terms to count as a regression, so run-to-run jitter doesn't fail it.
+# (Tail percentiles over a few dozen reruns are too noisy to gate on.)
+MIN_REGRESSIONS = {'p50_ms': 5.0, 'peak_mib': 1.0}
+
+# The user app.py shows.
+USER_ID = 'user1'
+
+
+def build_storage(path, workouts_per_user, posts_per_user, sample_interval, seed=0):
+    """Generates a synthetic data set into a new database at `path`."""
+    storage = Storage(path)
+    synthetic.generate(
+        storage, USER_COUNT, seed=seed, friends_per_user=USER_COUNT - 1,
+        workouts_per_user=workouts_per_user, posts_per_user=posts_per_user,
+        sample_interval=sample_interval, routes_per_user=ROUTES_PER_USER)
+    return storage
+
+
+def percentiles(seconds):
+    """Returns latency percentiles (in ms) of a list of timings."""
+    ms = np.asarray(seconds) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': ms.max()}
+
+
+def measure(run, repeats, before=None):
+    """Times `repeats` calls of run() and measures one more call's peak
+    memory with tracemalloc (which slows calls down, so it isn't timed).
+    `before` is called, untimed, before each call."""
+    timings = []
+    for _ in range(repeats):
+        if before:
+            before()
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    if before:
+        before()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {**percentiles(timings), 'peak_mib': peak / 2**20}
+
+
+def _run_app(app):
+    app.run()
+    if app.exception:
+        raise RuntimeError(f'The page raised: {app.exception[0].value}')
+
+
+def _display_scripts(page):
+    # One AppTest script per display function, fed the page's own data.
+    # AppTest runs each function's source as a script, so imports go inside.
+    def activity_summary(workouts, totals, route):
+        from modules import display_activity_summary
+        display_activity_summary(workouts, totals, route)
+
+    def recent_workouts(workouts):
+        from modules import display_recent_workouts
+        display_recent_workouts(workouts, page_size=10, lazy=True)
+
+    def leaderboard(entries):
+        from modules import display_leaderboard
+        display_leaderboard(entries, 'steps', highlight_user_id='user1')
+
+    def genai_advice(advice):
+        from modules import display_genai_advice
+        display_genai_advice(advice['timestamp'], advice['content'], advice['image'])
+
+    def post(posts):
+        from modules import display_post
+        for item in posts[:20]:
+            display_post(item['user_id'], None, item['timestamp'], item['content'], item['image'])
+
+    totals = page['activity_totals']
+    entries = leaderboards.get_friends_leaderboard(
+        USER_ID, 'steps', 'week', totals['period_start'] if totals else None)
+    return {
+        'display_activity_summary': (activity_summary, (page['workouts'], totals, page['route'])),
+        'display_recent_workouts': (recent_workouts, (page['workouts'],)),
+        'display_leaderboard': (leaderboard, (entries,)),
+        'display_genai_advice': (genai_advice, (page['genai_advice'],)),
+        'display_post': (post, (page['posts'],)),
+    }
+
+
+def bench_size(size, options, reruns, directory):
+    """Returns {scenario: measurements} for one synthetic user size."""
+    storage = build_storage(os.path.join(directory, f'{size}.db'), *options)
+    data_fetcher.use_storage(storage)
+    leaderboards.get_leaderboards().clear()
+    results = {}
+    try:
+        results[f'fetch_page_data/{size}'] = measure(
+            lambda: data_fetcher.fetch_page_data(USER_ID), reruns, before=data_fetcher.clear_all)
+
+        app = AppTest.from_file(APP_PATH, default_timeout=120)
+        _run_app(app)
+        results[f'page/warm/{size}'] = measure(lambda: _run_app(app), reruns)
+        results[f'page/cold/{size}'] = measure(
+            lambda: _run_app(app), reruns, before=data_fetcher.clear_all)
+
+        page = data_fetcher.fetch_page_data(USER_ID)
+        for name, (script, script_args) in _display_scripts(page).items():
+            display = AppTest.from_function(script, args=script_args, default_timeout=120)
+            _run_app(display)
+            results[f'{name}/{size}'] = measure(lambda: _run_app(display), reruns)
+    finally:
+        data_fetcher.use_storage(None)
+        leaderboards.get_leaderboards().clear()
+        storage.close()
+    return results
+
+
+def check_regressions(results, baseline, tolerance):
+    """Compares results with a baseline.
+
+    Returns:
+        A message for every scenario whose median latency or peak memory is
+        more than `tolerance` (e.g. 0.5 for 50%) above the baseline, and
+        more than MIN_REGRESSIONS above it. Scenarios missing from either
+        side are skipped.
+    """
+    regressions = []
+    for scenario, measured in sorted(results.items()):
+        expected = baseline.get(scenario)
+        if expected is None:
+            continue
+        for key, minimum in MIN_REGRESSIONS.items():
+            limit = max(expected[key] * (1 + tolerance), expected[key] + minimum)
+            if measured[key] > limit:
+                regressions.append(
+                    f'{scenario} {key}: {measured[key]:.1f} > {limit:.1f} '
+                    f'(baseline {expected[key]:.1f})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    parser.add_argument('--reruns', type=int, default=20)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write these results to the baseline file')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 if results regressed from the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed slowdown or growth over the baseline (0.5 = 50%%)')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results.update(bench_size(size, SIZES[size], args.reruns, directory))
+
+    print(f'{"scenario":<40}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}{"peak MiB":>10}')
+    for scenario, measured in results.items():
+        print(f'{scenario:<40}{measured["p50_ms"]:>10.1f}{measured["p95_ms"]:>10.1f}'
+              f'{measured["p99_ms"]:>10.1f}{measured["max_ms"]:>10.1f}{measured["peak_mib"]:>10.1f}')
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline.update({
+            scenario: {key: round(value, 3) for key, value in measured.items()}
+            for scenario, measured in results.items()
+        })
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f'Saved baseline to {args.baseline}')
+
+    if args.check:
+        with open(args.baseline) as file:
+            regressions = check_regressions(results, json.load(file), args.tolerance)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#############################################################################
+# benchmarks/bench_records.py
+#
+# Compares the original dict workouts, reparsed with strptime on every
+# render, against Workout records (records.py), which are parsed once with
+# the fromisoformat fast path and reused on each rerun. Workouts come from
+# synthetic.py.
+#
+# Run from the repository root with:
+#     python -m benchmarks.bench_records
+#############################################################################
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime
+
+import synthetic
+from records import Workout
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Average workouts per synthetic user.
+WORKOUTS_PER_USER = 20
+
+
+def make_workouts(count, seed=0):
+    """Returns about `count` synthetic workout dicts in the storage format."""
+    return synthetic.workouts(
+        max(1, count // WORKOUTS_PER_USER), seed=seed, workouts_per_user=WORKOUTS_PER_USER)
+
+
+def legacy_render_fields(workouts):
+    """What the display functions did per workout on every render."""
+    for w in workouts:
+        start = datetime.strptime(w['start_timestamp'], DATE_FORMAT)
+        end = datetime.strptime(w['end_timestamp'], DATE_FORMAT)
+        yield start.date(), int((end - start).total_seconds() / 60)
+
+
+def record_render_fields(workouts):
+    """The same fields read from already-parsed records."""
+    for w in workouts:
+        yield w.start.date(), w.duration_minutes
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def allocated(function, *args):
+    tracemalloc.start()
+    result = function(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workouts', type=int, default=100_000)
+    parser.add_argument('--renders', type=int, default=5)
+    args = parser.parse_args()
+
+    dict_bytes, workouts = allocated(make_workouts, args.workouts)
+    build_seconds, records = timed(lambda: [Workout.from_dict(w) for w in workouts])
+    record_bytes, _ = allocated(lambda: [Workout.from_dict(w) for w in workouts])
+    strptime_seconds, _ = timed(
+        lambda: [datetime.strptime(w['start_timestamp'], DATE_FORMAT) for w in workouts])
+    iso_seconds, _ = timed(
+        lambda: [datetime.fromisoformat(w['start_timestamp']) for w in workouts])
+
+    legacy = min(timed(lambda: list(legacy_render_fields(workouts)))[0] for _ in range(args.renders))
+    typed = min(timed(lambda: list(record_render_fields(records)))[0] for _ in range(args.renders))
+    assert list(legacy_render_fields(workouts)) == list(record_render_fields(records))
+
+    print(f'{len(workouts):,} workouts')
+    print(f'  parse one timestamp each, strptime     {strptime_seconds * 1e3:>9.1f} ms')
+    print(f'  parse one timestamp each, fromisoformat{iso_seconds * 1e3:>9.1f} ms')
+    print(f'  build Workout records (once)           {build_seconds * 1e3:>9.1f} ms')
+    print(f'  render fields, dicts + strptime        {legacy * 1e3:>9.1f} ms per render')
+    print(f'  render fields, records                 {typed * 1e3:>9.1f} ms per render')
+    print(f'  memory, dicts                          {dict_bytes / 2**20:>9.1f} MiB')
+    print(f'  memory, records (incl. parsed times)   {record_bytes / 2**20:>9.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#############################################################################
+# benchmarks/bench_startup.py
+#
+# Measures cold starts. Every run is a fresh Python process, as on a Cloud
+# Run cold start:
+#
+#   import/*               time to import app.py (python -X importtime),
+#                          split by top-level package
+#   first_render/plain     process start to the end of the first page, as
+#                          with `streamlit run app.py`
+#   first_render/startup   the same in startup mode (startup.py), where the
+#                          time includes preloading and warm-up
+#   render/plain           how long the first page itself takes: what the
+#   render/startup         first visitor waits for once the server is up
+#
+# Pages are rendered with Streamlit's AppTest against a demo database in a
+# temporary directory. Like bench_page, results can be saved as a baseline
+# and checked against it (--check exits with status 1 on a regression).
+#
+# Run from the repository root with:
+#     python -m benchmarks.bench_startup
+#     python -m benchmarks.bench_startup --save-baseline
+#     python -m benchmarks.bench_startup --check
+#############################################################################
+
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import data_fetcher
+from benchmarks.bench_page import percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'bench_startup.json')
+
+# How many of the slowest packages are reported by name; the rest are
+# summed as import/other.
+TOP_PACKAGES = 8
+
+# How much slower a median must also be in absolute terms (ms) to count as
+# a regression, so run-to-run jitter doesn't fail --check.
+MIN_REGRESSION_MS = 25.0
+
+# Renders the page once in a new process and prints the startup report
+# with the render's own duration added.
+_RENDER_SCRIPT = '''
+import json, sys, time
+import startup
+if sys.argv[1] == 'startup':
+    startup.preload()
+    startup.warm_up()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[2], default_timeout=120)
+started = time.perf_counter()
+app.run()
+if app.exception:
+    raise SystemExit(app.exception[0].value)
+print(json.dumps({**startup.startup_report(), 'render_ms': (time.perf_counter() - started) * 1e3}))
+'''
+
+
+def import_times(environment):
+    """Returns {package: ms} for importing app.py in a new process, split by
+    the top-level package of each module app.py imports directly. Python's
+    own startup imports are 'python'."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=environment,
+        capture_output=True, text=True, check=True)
+    totals = collections.Counter()
+    children = collections.Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        ms = int(cumulative) / 1e3
+        # Nested imports are indented two spaces per level and listed
+        # before the module that imported them, whose time includes theirs.
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level == 1:
+            children[name.strip().split('.')[0]] += ms
+        elif level == 0:
+            if name.strip() == 'app':
+                totals.update(children)
+                totals['app'] += ms - sum(children.values())
+            else:
+                totals['python'] += ms
+            children.clear()
+    top = dict(totals.most_common(TOP_PACKAGES))
+    top['other'] = max(0.0, sum(totals.values()) - sum(top.values()))
+    top['total'] = sum(totals.values())
+    return top
+
+
+def render(mode, environment):
+    """Returns the startup report of one first render in a new process."""
+    result = subprocess.run(
+        [sys.executable, '-c', _RENDER_SCRIPT, mode, os.path.join(ROOT, 'app.py')],
+        cwd=ROOT, env=environment, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'Rendering failed:\n{result.stderr[-2000:]}')
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def bench(runs, directory):
+    """Returns {scenario: measurements} over `runs` fresh processes each."""
+    environment = dict(os.environ, SDS_DATABASE_PATH=os.path.join(directory, 'demo.db'),
+                       PYTHONPATH=ROOT)
+    # Create the demo database up front, so no run pays for it.
+    data_fetcher.open_storage(environment['SDS_DATABASE_PATH']).close()
+
+    timings = collections.defaultdict(list)
+    for _ in range(runs):
+        for package, ms in import_times(environment).items():
+            timings[f'import/{package}'].append(ms)
+        for mode in ('plain', 'startup'):
+            report = render(mode, environment)
+            timings[f'first_render/{mode}'].append(report['first_render_ms'])
+            timings[f'render/{mode}'].append(report['render_ms'])
+    return {scenario: percentiles([ms / 1e3 for ms in values])
+            for scenario, values in timings.items()}
+
+
+def check_regressions(results, baseline, tolerance):
+    """Returns a message for every scenario whose median is more than
+    `tolerance` and MIN_REGRESSION_MS above its baseline."""
+    regressions = []
+    for scenario, measured in sorted(results.items()):
+        expected = baseline.get(scenario)
+        if expected is None:
+            continue
+        limit = max(expected['p50_ms'] * (1 + tolerance), expected['p50_ms'] + MIN_REGRESSION_MS)
+        if measured['p50_ms'] > limit:
+            regressions.append(f'{scenario} p50_ms: {measured["p50_ms"]:.1f} > {limit:.1f} '
+                               f'(baseline {expected["p50_ms"]:.1f})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write these results to the baseline file')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 if results regressed from the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed slowdown over the baseline (0.5 = 50%%)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = bench(args.runs, directory)
+
+    print(f'{"scenario":<32}{"p50 ms":>10}{"max ms":>10}')
+    for scenario, measured in results.items():
+        print(f'{scenario:<32}{measured["p50_ms"]:>10.1f}{measured["max_ms"]:>10.1f}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({
+                scenario: {key: round(value, 3) for key, value in measured.items()}
+                for scenario, measured in results.items()
+            }, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f'Saved baseline to {args.baseline}')
+
+    if args.check:
+        with open(args.baseline) as file:
+            regressions = check_regressions(results, json.load(file), args.tolerance)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
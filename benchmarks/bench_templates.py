@@ -0,0 +1,48 @@
+#############################################################################
+# benchmarks/bench_templates.py
+#
+# Compares rendering a custom component with the compiled template engine in
+# internals.py against the original read-and-replace path.
+#
+# Run from the repository root with:
+#     python -m benchmarks.bench_templates
+#############################################################################
+
+import argparse
+import timeit
+
+import internals
+
+
+def legacy_render(data, component_name):
+    """The original create_component path: read the file, replace per key."""
+    component_html = internals.load_html_file(f'custom_components/{component_name}.html')
+    for key in data:
+        data_placeholder = "{{" + str(key) + "}}"
+        value = ''.join(['\\' + c if c in ["'", '"', '\\'] else c for c in str(data[key])])
+        component_html = component_html.replace(data_placeholder, value)
+    return component_html
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20_000)
+    parser.add_argument('--value-length', type=int, default=200)
+    args = parser.parse_args()
+
+    data = {'NAME': 'O\'Brien "the runner" ' * (args.value_length // 20)}
+    component_name = 'my_custom_component'
+    assert legacy_render(data, component_name) == internals.render_component(data, component_name)
+
+    print(f'{"path":<12}{"renders/s":>14}{"us/render":>12}')
+    for name, function in [
+        ('legacy', legacy_render),
+        ('compiled', internals.render_component),
+    ]:
+        seconds = min(timeit.repeat(
+            lambda: function(data, component_name), number=args.number, repeat=3))
+        print(f'{name:<12}{args.number / seconds:>14,.0f}{seconds / args.number * 1e6:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
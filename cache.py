@@ -0,0 +1,134 @@
+#############################################################################
+# cache.py
+#
+# This file contains the in-memory cache used by data_fetcher.py. Streamlit
+# re-runs app.py on every interaction, but imported modules (and so these
+# caches) stay alive for the whole server process, so reruns are served from
+# memory instead of going back to the data source.
+#############################################################################
+
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+# Every cache created by @cached, so they can be invalidated together.
+_caches = []
+
+
+class TTLCache:
+    """A bounded least-recently-used cache whose entries expire after a TTL.
+
+    Each entry is stored with the user_id it belongs to, so all of one user's
+    entries can be dropped when their data changes.
+    """
+
+    def __init__(self, name, ttl, maxsize, clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, user_id, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns (True, value) for a fresh entry, else (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, user_id=None):
+        """Stores a value, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, user_id, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Drops every entry belonging to the given user."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] == user_id]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        """Drops every entry and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns the cache's counters as a dict."""
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def cached(ttl, maxsize=128):
+    """Decorator that caches a data_fetcher function's results.
+
+    The decorated function must take a user_id argument; calls are keyed on
+    all arguments (however they are passed) and tagged with the user_id for
+    invalidate_user(). Exceptions are not cached. Cached values are shared
+    between callers, so they must not be mutated.
+
+    The wrapper exposes the underlying TTLCache as `.cache`.
+    """
+    def decorator(function):
+        signature = inspect.signature(function)
+        cache = TTLCache(function.__name__, ttl, maxsize)
+        _caches.append(cache)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.items())
+            found, value = cache.get(key)
+            if found:
+                return value
+            value = function(*args, **kwargs)
+            cache.set(key, value, user_id=bound.arguments.get('user_id'))
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def invalidate_user(user_id):
+    """Drops a user's entries from every cache. Returns how many were dropped."""
+    return sum(cache.invalidate_user(user_id) for cache in _caches)
+
+
+def clear_all():
+    """Empties every cache."""
+    for cache in _caches:
+        cache.clear()
+
+
+def cache_stats():
+    """Returns {function name: counters} for every cache."""
+    return {cache.name: cache.stats() for cache in _caches}
@@ -0,0 +1,111 @@
+#############################################################################
+# cache_test.py
+#
+# This file contains tests for cache.py.
+#############################################################################
+
+import unittest
+
+import cache
+import data_fetcher
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    """Tests the TTLCache class."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = cache.TTLCache('test', ttl=10, maxsize=2, clock=self.clock)
+
+    def test_hit_and_miss_counters(self):
+        """Lookups are counted as hits or misses."""
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), (True, 1))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        """Entries older than the TTL are misses."""
+        self.cache.set('a', 1)
+        self.clock.now = 10
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        """The cache never grows past maxsize."""
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('b'), (False, None))
+        self.assertEqual(self.cache.get('a'), (True, 1))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_invalidate_user(self):
+        """Only the given user's entries are dropped."""
+        self.cache.set('a', 1, user_id='user1')
+        self.cache.set('b', 2, user_id='user2')
+        self.assertEqual(self.cache.invalidate_user('user1'), 1)
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.assertEqual(self.cache.get('b'), (True, 2))
+
+
+class TestCachedDecorator(unittest.TestCase):
+    """Tests the @cached decorator and the module-level helpers."""
+
+    def setUp(self):
+        self.calls = 0
+
+        @cache.cached(ttl=60)
+        def fetch(user_id, limit=10):
+            self.calls += 1
+            return [user_id] * limit
+
+        self.fetch = fetch
+
+    def test_repeated_calls_hit_the_cache(self):
+        """Equivalent calls are only computed once."""
+        self.fetch('user1')
+        self.fetch('user1', 10)
+        self.fetch(user_id='user1', limit=10)
+        self.assertEqual(self.calls, 1)
+        self.fetch('user1', limit=5)
+        self.assertEqual(self.calls, 2)
+
+    def test_exceptions_are_not_cached(self):
+        """A failing call is retried next time."""
+        with self.assertRaises(ValueError):
+            data_fetcher.get_user_profile('missing_user')
+        with self.assertRaises(ValueError):
+            data_fetcher.get_user_profile('missing_user')
+        self.assertEqual(len(data_fetcher.get_user_profile.cache), 0)
+
+    def test_invalidate_user_across_caches(self):
+        """invalidate_user clears the user from every decorated function."""
+        self.fetch('user1')
+        cache.invalidate_user('user1')
+        self.fetch('user1')
+        self.assertEqual(self.calls, 2)
+
+    def test_fetchers_are_cached(self):
+        """data_fetcher results are stable between reruns."""
+        cache.clear_all()
+        first = data_fetcher.get_user_workouts('user1')
+        self.assertIs(data_fetcher.get_user_workouts('user1'), first)
+        stats = cache.cache_stats()['get_user_workouts']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
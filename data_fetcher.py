@@ -8,8 +8,27 @@
 # testing earlier units.
 #############################################################################
 
+import base64
+import binascii
+import json
+import os
 import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+
+import synthetic
+from cache import cached, clear_all
+from friend_graph import FriendGraph
+from metrics import instrumented
+from routes import DEFAULT_ROUTE_ZOOM, ROUTE_ZOOM_LEVELS
+from sensor_data import SENSOR_TYPES, SensorSeries, parse_timestamps
+from storage import Storage
+
+# Demo users, written to an empty database by _seed_demo_data.
 users = {
     'user1': {
         'full_name': 'Remi',
@@ -41,107 +60,493 @@ users = {
     },
 }
 
+# How long (in seconds) each function's results are cached, and how many
+# results are kept. Sensor samples never change once a workout is recorded,
+# so they can be kept the longest.
+PROFILE_CACHE_TTL = 300
+WORKOUTS_CACHE_TTL = 60
+POSTS_CACHE_TTL = 30
+SENSOR_DATA_CACHE_TTL = 3600
+GENAI_ADVICE_CACHE_TTL = 120
+ROUTE_CACHE_TTL = 3600
+FRIEND_GRAPH_CACHE_TTL = 300
+CACHE_MAXSIZE = 256
+
+# How long (in seconds) fetch_page_data waits for each part of the page.
+PAGE_FETCH_TIMEOUTS = {
+    'profile': 2.0,
+    'workouts': 2.0,
+    'posts': 2.0,
+    'genai_advice': 5.0,
+    'activity_totals': 2.0,
+    'route': 2.0,
+}
+
+# Threads shared by every fetch_page_data call. Fetches spend their time
+# waiting on I/O, so threads are enough to run them side by side.
+_page_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='page-fetch')
+
+# The SQLite database the app reads from. Without SDS_DATABASE_PATH, a demo
+# database is created in the temp directory and filled with example data.
+DATABASE_PATH = os.environ.get(
+    'SDS_DATABASE_PATH', os.path.join(tempfile.gettempdir(), 'sds-demo.db'))
+
+# With SDS_SYNTHETIC_USERS set, an empty database is filled with that many
+# generated users (see synthetic.py) instead of the demo users, e.g. to
+# load-test the app. The app shows user1.
+SYNTHETIC_USERS = int(os.environ.get('SDS_SYNTHETIC_USERS') or 0)
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def open_storage(path):
+    """Opens a Storage, filling it with the demo data if it is empty."""
+    storage = Storage(path)
+    if SYNTHETIC_USERS and storage.is_empty():
+        synthetic.generate(storage, SYNTHETIC_USERS, routes_per_user=1)
+        return storage
+    with storage.write() as connection:
+        if storage.is_empty(connection):
+            _seed_demo_data(storage, connection)
+    return storage
+
+
+def get_storage():
+    """Returns the Storage backing this module, opening it on first use."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = open_storage(DATABASE_PATH)
+    return _storage
+
 
+def use_storage(storage):
+    """Makes this module read from the given Storage, e.g. in tests.
+
+    Cached results from the previous storage are dropped.
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
+    clear_all()
+
+
+@instrumented('fetch')
+@cached(ttl=SENSOR_DATA_CACHE_TTL, maxsize=CACHE_MAXSIZE)
 def get_user_sensor_data(user_id, workout_id):
-    """Returns a list of timestampped information for a given workout.
-
-    This function currently returns random data. You will re-write it in Unit 3.
-    """
-    sensor_data = []
-    sensor_types = [
-        'accelerometer',
-        'gyroscope',
-        'pressure',
-        'temperature',
-        'heart_rate',
-    ]
-    for index in range(random.randint(5, 100)):
-        random_minute = str(random.randint(0, 59))
-        if len(random_minute) == 1:
-            random_minute = '0' + random_minute
-        timestamp = '2024-01-01 00:' + random_minute + ':00'
-        data = random.random() * 100
-        sensor_type = random.choice(sensor_types)
-        sensor_data.append(
-            {'sensor_type': sensor_type, 'timestamp': timestamp, 'data': data}
-        )
-    return sensor_data
+    """Returns the timestampped sensor samples recorded for a given workout.
+
+    The samples come back as a SensorSeries (see sensor_data.py), which stores
+    them in NumPy columns but can still be iterated as a list of
+    {'sensor_type', 'timestamp', 'data'} dicts. Unknown workouts have no
+    samples.
+    """
+    return get_storage().get_sensor_data(workout_id)
 
 
+@instrumented('fetch')
+@cached(ttl=WORKOUTS_CACHE_TTL, maxsize=CACHE_MAXSIZE)
 def get_user_workouts(user_id):
-    """Returns a list of user's workouts.
-
-    This function currently returns random data. You will re-write it in Unit 3.
-    """
-    workouts = []
-    for index in range(random.randint(1, 3)):
-        random_lat_lng_1 = (
-            1 + random.randint(0, 100) / 100,
-            4 + random.randint(0, 100) / 100,
-        )
-        random_lat_lng_2 = (
-            1 + random.randint(0, 100) / 100,
-            4 + random.randint(0, 100) / 100,
-        )
-        workouts.append({
-            'workout_id': f'workout{index}',
-            'start_timestamp': '2024-01-01 00:00:00',
-            'end_timestamp': '2024-01-01 00:30:00',
-            'start_lat_lng': random_lat_lng_1,
-            'end_lat_lng': random_lat_lng_2,
-            'distance': random.randint(0, 200) / 10.0,
-            'steps': random.randint(0, 20000),
-            'calories_burned': random.randint(0, 100),
-        })
-    return workouts
+    """Returns a list of user's workouts, oldest first.
 
+    Workouts are Workout records (see records.py): their timestamps are
+    already parsed (start, end) and their duration_seconds computed. They can
+    also be read like the dicts this used to return.
+    """
+    return get_storage().get_workouts(user_id)
 
-def get_user_profile(user_id):
-    """Returns information about the given user.
 
-    This function currently returns random data. You will re-write it in Unit 3.
+@instrumented('fetch')
+@cached(ttl=WORKOUTS_CACHE_TTL, maxsize=CACHE_MAXSIZE)
+def get_user_activity_totals(user_id, period='week', period_start=None):
+    """Returns a user's workout totals for one day, week or month.
+
+    Totals are kept up to date in storage as workouts are added, so this is
+    a single-row lookup however many workouts the user has.
+
+    Args:
+        period: 'day', 'week' (weeks start on Monday) or 'month'.
+        period_start: the 'YYYY-MM-DD' date the period starts on. Defaults
+            to the user's most recent period with a workout.
+
+    Returns:
+        A dict with 'period_start', 'workouts', 'duration_seconds',
+        'distance', 'steps' and 'calories_burned', or None if the user has
+        no workouts in that period.
     """
-    if user_id not in users:
+    rollups = get_storage().get_rollups(user_id, period, period_start)
+    return rollups[0] if rollups else None
+
+
+@instrumented('fetch')
+@cached(ttl=SENSOR_DATA_CACHE_TTL, maxsize=CACHE_MAXSIZE)
+def get_workout_summary(user_id, workout_id):
+    """Returns a workout's duration, sample count and heart rate summary.
+
+    See Storage.get_workout_summary for the fields. Returns None for unknown
+    workouts.
+    """
+    return get_storage().get_workout_summary(workout_id)
+
+
+@instrumented('fetch')
+@cached(ttl=ROUTE_CACHE_TTL, maxsize=CACHE_MAXSIZE)
+def get_workout_route(user_id, workout_id, zoom=DEFAULT_ROUTE_ZOOM):
+    """Returns a workout's GPS route, simplified for a map zoom level.
+
+    Routes are simplified when they are stored (see routes.py), so this is
+    at most a few hundred (lat, lng) rows however long the trace was. Pass
+    zoom=None for the full trace.
+
+    Returns:
+        A read-only (N, 2) NumPy array of (lat, lng), or None if the workout
+        has no route.
+    """
+    return get_storage().get_route(workout_id, zoom)
+
+
+@instrumented('fetch')
+@cached(ttl=ROUTE_CACHE_TTL, maxsize=CACHE_MAXSIZE)
+def get_workout_route_map(user_id, workout_id, zoom=DEFAULT_ROUTE_ZOOM):
+    """Returns a workout's route as data for st.map, or None without a route.
+
+    Cached like get_workout_route, so page reruns reuse the same DataFrame
+    instead of building a new one from the route every time.
+
+    Returns:
+        A pandas DataFrame with 'lat' and 'lon' columns, one row per point.
+    """
+    # Imported here so loading the app doesn't wait for pandas (see startup.py).
+    import pandas as pd
+    route = get_workout_route(user_id, workout_id, zoom)
+    if route is None:
+        return None
+    return pd.DataFrame({'lat': route[:, 0], 'lon': route[:, 1]})
+
+
+@instrumented('fetch')
+@cached(ttl=ROUTE_CACHE_TTL, maxsize=CACHE_MAXSIZE)
+def get_user_routes(user_id, zoom=ROUTE_ZOOM_LEVELS[0]):
+    """Returns all of a user's routes, for a "map of all my workouts".
+
+    The default zoom is the least detailed stored level, which suits a map
+    that fits many workouts.
+
+    Returns:
+        A list of dicts with 'workout_id', 'bounds' (min_lat, min_lng,
+        max_lat, max_lng) and 'points', oldest workout first.
+    """
+    return get_storage().get_user_routes(user_id, zoom)
+
+
+@instrumented('fetch')
+@cached(ttl=PROFILE_CACHE_TTL, maxsize=CACHE_MAXSIZE)
+def get_user_profile(user_id):
+    """Returns information about the given user."""
+    profile = get_storage().get_user(user_id)
+    if profile is None:
         raise ValueError(f'User {user_id} not found.')
-    return users[user_id]
+    return profile
 
 
+@instrumented('fetch')
+@cached(ttl=POSTS_CACHE_TTL, maxsize=CACHE_MAXSIZE)
 def get_user_posts(user_id):
-    """Returns a list of a user's posts.
+    """Returns a list of a user's Post records, newest first."""
+    return get_storage().get_posts(user_id)
+
+
+@instrumented('fetch')
+def get_user_workouts_page(user_id, cursor=None, limit=100, since=None, until=None):
+    """Returns one page of a user's workouts, oldest first.
 
-    This function currently returns random data. You will re-write it in Unit 3.
+    Args:
+        cursor: the continuation token from the previous page, or None for
+            the first page.
+        limit: the maximum number of workouts on the page, at least 1.
+        since: only workouts starting at or after this 'YYYY-MM-DD HH:MM:SS'.
+        until: only workouts starting before this 'YYYY-MM-DD HH:MM:SS'.
+
+    Returns:
+        A (workouts, next_cursor) tuple. next_cursor is None on the last page.
     """
-    content = random.choice([
-        'Had a great workout today!',
-        'The AI really motivated me to push myself further, I ran 10 miles!',
-    ])
-    return [{
-        'user_id': user_id,
-        'post_id': 'post1',
-        'timestamp': '2024-01-01 00:00:00',
-        'content': content,
-        'image': 'image_url',
-    }]
+    _check_page_limit(limit)
+    after = _decode_cursor(cursor, 'workouts')
+    workouts = get_storage().get_workouts_page(user_id, after, since, until, limit)
+    if len(workouts) < limit:
+        return workouts, None
+    last = workouts[-1]
+    return workouts, _encode_cursor('workouts', last['start_timestamp'], last['workout_id'])
+
 
+@instrumented('fetch')
+def get_user_posts_page(user_id, cursor=None, limit=100, since=None, until=None):
+    """Returns one page of a user's posts, newest first.
 
+    Takes the same arguments, and returns the same (posts, next_cursor)
+    tuple, as get_user_workouts_page.
+    """
+    _check_page_limit(limit)
+    before = _decode_cursor(cursor, 'posts')
+    posts = get_storage().get_posts_page(user_id, before, since, until, limit)
+    if len(posts) < limit:
+        return posts, None
+    last = posts[-1]
+    return posts, _encode_cursor('posts', last['timestamp'], last['post_id'])
+
+
+def stream_user_workouts(user_id, since=None, until=None, limit=None, page_size=500):
+    """Yields a user's workouts oldest first, one page in memory at a time.
+
+    Args:
+        since, until: as in get_user_workouts_page.
+        limit: stop after this many workouts (default: all of them).
+        page_size: how many workouts are read from storage at a time.
+    """
+    return _stream(get_user_workouts_page, user_id, since, until, limit, page_size)
+
+
+def stream_user_posts(user_id, since=None, until=None, limit=None, page_size=500):
+    """Yields a user's posts newest first, one page in memory at a time.
+
+    Takes the same arguments as stream_user_workouts.
+    """
+    return _stream(get_user_posts_page, user_id, since, until, limit, page_size)
+
+
+@instrumented('fetch')
+@cached(ttl=FRIEND_GRAPH_CACHE_TTL, maxsize=1)
+def get_friend_graph():
+    """Returns a FriendGraph of every user (see friend_graph.py).
+
+    The graph is rebuilt from storage at most every FRIEND_GRAPH_CACHE_TTL
+    seconds, so friendships added in the meantime show up late.
+    """
+    return FriendGraph.from_storage(get_storage())
+
+
+@instrumented('fetch')
+def get_friend_suggestions(user_id, limit=5):
+    """Returns up to `limit` friends of friends the user could add.
+
+    Returns:
+        A list of (user_id, mutual friend count) tuples, most mutual
+        friends first. Raises ValueError for unknown users.
+    """
+    return get_friend_graph().suggest_friends(user_id, limit)
+
+
+@instrumented('fetch')
+def get_users_profiles(user_ids):
+    """Returns the profiles of many users at once.
+
+    Args:
+        user_ids: an iterable of user ids, e.g. a user's 'friends' list.
+
+    Returns:
+        A dict mapping each user id to its profile, in the order given.
+        Raises ValueError naming every id that does not exist.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    profiles = get_storage().get_users(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in profiles]
+    if missing:
+        raise ValueError(f'Users {", ".join(missing)} not found.')
+    return {user_id: profiles[user_id] for user_id in user_ids}
+
+
+@instrumented('fetch')
+def get_posts_for_users(user_ids, limit=20, since=None):
+    """Returns the newest posts written by any of the given users.
+
+    Each user's newest posts are read in posts_user_timestamp index order
+    and merged lazily (see Storage.get_posts_for_users), so the feed costs
+    about `limit` rows however long the users' histories are.
+
+    Args:
+        user_ids: an iterable of user ids, e.g. a user's 'friends' list.
+        limit: the maximum number of posts to return.
+        since: if given, only posts with a timestamp after this
+            'YYYY-MM-DD HH:MM:SS' string are returned.
+
+    Returns:
+        A list of Post records sorted by timestamp, newest first.
+    """
+    return get_storage().get_posts_for_users(dict.fromkeys(user_ids), since, limit)
+
+
+@instrumented('fetch')
+@cached(ttl=GENAI_ADVICE_CACHE_TTL, maxsize=CACHE_MAXSIZE)
 def get_genai_advice(user_id):
-    """Returns the most recent advice from the genai model.
-
-    This function currently returns random data. You will re-write it in Unit 3.
-    """
-    advice = random.choice([
-        'Your heart rate indicates you can push yourself further. You got this!',
-        "You're doing great! Keep up the good work.",
-        'You worked hard yesterday, take it easy today.',
-        'You have burned 100 calories so far today!',
-    ])
-    image = random.choice([
-        'https://plus.unsplash.com/premium_photo-1669048780129-051d670fa2d1?q=80&w=3870&auto=format&fit=crop&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D',
-        None,
-    ])
-    return {
-        'advice_id': 'advice1',
-        'timestamp': '2024-01-01 00:00:00',
-        'content': advice,
-        'image': image,
+    """Returns the most recent Advice record from the genai model, or None."""
+    return get_storage().get_latest_advice(user_id)
+
+
+@instrumented('fetch')
+def fetch_page_data(user_id, timeouts=None):
+    """Fetches everything the home page needs for a user, concurrently.
+
+    The profile, workouts, posts and GenAI advice are requested at the same
+    time, so the page waits for the slowest fetch instead of all of them in
+    turn. A fetch that fails or runs past its timeout does not fail the page:
+    its fallback value is used and the error is reported under 'errors'.
+
+    Args:
+        user_id: the user to fetch data for.
+        timeouts: optional overrides for PAGE_FETCH_TIMEOUTS, in seconds.
+
+    Returns:
+        A dict with 'profile' (None on failure), 'workouts' ([]), 'posts' ([]),
+        'genai_advice' (None), 'activity_totals' (None; the latest week's
+        totals), 'route' (None; the latest workout's route as returned by
+        get_workout_route_map) and
+        'errors', a dict mapping the name of each failed part to the
+        exception it raised (TimeoutError on timeout).
+    """
+    timeouts = {**PAGE_FETCH_TIMEOUTS, **(timeouts or {})}
+    fetches = {
+        'profile': (get_user_profile, None),
+        'workouts': (get_user_workouts, []),
+        'posts': (get_user_posts, []),
+        'genai_advice': (get_genai_advice, None),
+        'activity_totals': (get_user_activity_totals, None),
+        'route': (_latest_route, None),
     }
+    # Opening (and, the first time, filling) the database isn't part of any
+    # one fetch, so it doesn't count against their timeouts.
+    get_storage()
+    started = time.monotonic()
+    futures = {
+        name: _page_executor.submit(fetch, user_id)
+        for name, (fetch, _) in fetches.items()
+    }
+    page = {'errors': {}}
+    for name, future in futures.items():
+        remaining = started + timeouts[name] - time.monotonic()
+        try:
+            page[name] = future.result(timeout=max(remaining, 0))
+        except Exception as error:
+            if not future.done():
+                future.cancel()
+                error = TimeoutError(f'{name} took longer than {timeouts[name]}s')
+            page[name] = fetches[name][1]
+            page['errors'][name] = error
+    return page
+
+
+def _latest_route(user_id):
+    # The map route of the user's most recent workout, if they have one.
+    workouts = get_user_workouts(user_id)
+    return get_workout_route_map(user_id, workouts[-1]['workout_id']) if workouts else None
+
+
+def _stream(get_page, user_id, since, until, limit, page_size):
+    # Follows continuation tokens page by page until the end or the limit.
+    cursor = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        items, cursor = get_page(user_id, cursor, size, since, until)
+        yield from items
+        if remaining is not None:
+            remaining -= len(items)
+        if cursor is None:
+            return
+
+
+def _check_page_limit(limit):
+    # An empty page would have no last item to continue from, and SQLite
+    # reads a negative LIMIT as no limit at all.
+    if limit < 1:
+        raise ValueError(f'Page limit must be at least 1, not {limit}.')
+
+
+def _encode_cursor(kind, timestamp, item_id):
+    # Continuation tokens are opaque to callers: URL-safe base64 of the
+    # position of the last item returned.
+    payload = json.dumps([kind, timestamp, item_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_cursor(cursor, kind):
+    # Returns the (timestamp, id) position stored in a token, or None.
+    if cursor is None:
+        return None
+    try:
+        cursor_kind, timestamp, item_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError('Invalid cursor.') from None
+    if cursor_kind != kind:
+        raise ValueError(f'Cursor is not for {kind}.')
+    return timestamp, item_id
+
+
+def _seed_demo_data(storage, connection):
+    # Fills an empty database with a few random workouts, sensor samples,
+    # posts and advice for every user in the `users` dict. Each user's data
+    # comes from their own seeded generator, so it is the same every time.
+    for user_id, profile in users.items():
+        storage.add_user(user_id, profile, connection)
+    for user_id in users:
+        rng = random.Random(user_id)
+        workouts = []
+        for index in range(rng.randint(1, 3)):
+            day = f'2024-01-{index + 1:02d}'
+            workouts.append({
+                'workout_id': f'{user_id}-workout{index}',
+                'start_timestamp': f'{day} 00:00:00',
+                'end_timestamp': f'{day} 00:30:00',
+                'start_lat_lng': (1 + rng.randint(0, 100) / 100, 4 + rng.randint(0, 100) / 100),
+                'end_lat_lng': (1 + rng.randint(0, 100) / 100, 4 + rng.randint(0, 100) / 100),
+                'distance': rng.randint(0, 200) / 10.0,
+                'steps': rng.randint(0, 20000),
+                'calories_burned': rng.randint(0, 100),
+            })
+        storage.add_workouts(user_id, workouts, connection)
+        for workout in workouts:
+            sample_count = rng.randint(5, 100)
+            start = int(parse_timestamps(workout['start_timestamp']))
+            storage.add_sensor_data(workout['workout_id'], SensorSeries(
+                [start + rng.randint(0, 59) * 60 for _ in range(sample_count)],
+                [rng.random() * 100 for _ in range(sample_count)],
+                [rng.randrange(len(SENSOR_TYPES)) for _ in range(sample_count)],
+            ), connection)
+        storage.add_posts([{
+            'user_id': user_id,
+            'post_id': f'{user_id}-post1',
+            'timestamp': '2024-01-01 00:00:00',
+            'content': rng.choice([
+                'Had a great workout today!',
+                'The AI really motivated me to push myself further, I ran 10 miles!',
+            ]),
+            'image': 'image_url',
+        }], connection)
+        storage.add_advice(user_id, {
+            'advice_id': f'{user_id}-advice1',
+            'timestamp': '2024-01-01 00:00:00',
+            'content': rng.choice([
+                'Your heart rate indicates you can push yourself further. You got this!',
+                "You're doing great! Keep up the good work.",
+                'You worked hard yesterday, take it easy today.',
+                'You have burned 100 calories so far today!',
+            ]),
+            'image': rng.choice([
+                'https://plus.unsplash.com/premium_photo-1669048780129-051d670fa2d1?q=80&w=3870&auto=format&fit=crop&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D',
+                None,
+            ]),
+        }, connection)
+        for workout in workouts:
+            storage.add_route(workout['workout_id'], _demo_route(
+                workout['start_lat_lng'], workout['end_lat_lng'], rng), connection)
+
+
+def _demo_route(start, end, rng, point_count=2000):
+    # A wandering GPS trace from start to end: a straight line plus a random
+    # walk that is pulled back to zero at both ends.
+    generator = np.random.default_rng(rng.getrandbits(32))
+    fraction = np.linspace(0.0, 1.0, point_count)[:, None]
+    walk = generator.normal(scale=2e-4, size=(point_count, 2)).cumsum(axis=0)
+    walk -= fraction * walk[-1]
+    return np.asarray(start) + fraction * (np.asarray(end) - np.asarray(start)) + walk
@@ -5,7 +5,24 @@
 #
 # You will write these tests in Unit 3.
 #############################################################################
+import threading
+import time
 import unittest
+from unittest import mock
+
+import data_fetcher
+from data_fetcher import get_user_sensor_data, get_user_workouts
+from sensor_data import SENSOR_TYPES, SensorSeries
+
+
+def setUpModule():
+    # Run against a private in-memory copy of the demo data.
+    data_fetcher.use_storage(data_fetcher.open_storage(':memory:'))
+
+
+def tearDownModule():
+    data_fetcher.use_storage(None)
+
 
 class TestDataFetcher(unittest.TestCase):
 
@@ -13,5 +30,286 @@ class TestDataFetcher(unittest.TestCase):
         """Tests foo."""
         pass
 
+
+class TestGetUserSensorData(unittest.TestCase):
+    """Tests the get_user_sensor_data function."""
+
+    def setUp(self):
+        self.workout_id = get_user_workouts('user1')[0]['workout_id']
+
+    def test_returns_sorted_sensor_series(self):
+        """Samples come back as a time-ordered SensorSeries."""
+        series = get_user_sensor_data('user1', self.workout_id)
+        self.assertIsInstance(series, SensorSeries)
+        self.assertGreaterEqual(len(series), 5)
+        self.assertTrue((series.timestamps[1:] >= series.timestamps[:-1]).all())
+
+    def test_compatible_with_dict_callers(self):
+        """Iterating the series still yields the legacy sample dicts."""
+        for sample in get_user_sensor_data('user1', self.workout_id):
+            self.assertEqual(set(sample), {'sensor_type', 'timestamp', 'data'})
+            self.assertIn(sample['sensor_type'], SENSOR_TYPES)
+            self.assertTrue(sample['timestamp'].startswith('2024-01-01 00:'))
+
+    def test_unknown_workout_has_no_samples(self):
+        """A workout that does not exist has an empty series."""
+        self.assertEqual(len(get_user_sensor_data('user1', 'no-such-workout')), 0)
+
+
+class TestStoredData(unittest.TestCase):
+    """Tests the functions that read the demo data from storage."""
+
+    def test_profile_matches_users_dict(self):
+        """Profiles are stored with their friends lists in order."""
+        profile = data_fetcher.get_user_profile('user3')
+        self.assertEqual(profile, data_fetcher.users['user3'])
+
+    def test_workouts_are_oldest_first(self):
+        """Workouts come back in start order with the expected fields."""
+        workouts = data_fetcher.get_user_workouts('user1')
+        self.assertGreaterEqual(len(workouts), 1)
+        starts = [w['start_timestamp'] for w in workouts]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(len(workouts[0]['start_lat_lng']), 2)
+
+    def test_activity_totals(self):
+        """The latest week's totals add up the user's workouts in it."""
+        workouts = data_fetcher.get_user_workouts('user1')
+        totals = data_fetcher.get_user_activity_totals('user1')
+        self.assertEqual(totals['period_start'], '2024-01-01')
+        self.assertEqual(totals['workouts'], len(workouts))
+        self.assertEqual(totals['steps'], sum(w['steps'] for w in workouts))
+        self.assertIsNone(data_fetcher.get_user_activity_totals('user1', 'day', '2020-01-01'))
+
+    def test_workout_summary(self):
+        """Summaries count the workout's stored samples."""
+        workout_id = data_fetcher.get_user_workouts('user1')[0]['workout_id']
+        summary = data_fetcher.get_workout_summary('user1', workout_id)
+        self.assertEqual(summary['duration_seconds'], 1800)
+        self.assertEqual(
+            summary['sample_count'], len(data_fetcher.get_user_sensor_data('user1', workout_id)))
+
+    def test_posts_and_advice(self):
+        """Every demo user has posts and advice."""
+        self.assertEqual(data_fetcher.get_user_posts('user2')[0]['user_id'], 'user2')
+        advice = data_fetcher.get_genai_advice('user2')
+        self.assertEqual(set(advice), {'advice_id', 'timestamp', 'content', 'image'})
+
+    def test_workout_routes(self):
+        """Demo workouts have routes simplified for the map."""
+        workouts = data_fetcher.get_user_workouts('user1')
+        route = data_fetcher.get_workout_route('user1', workouts[-1]['workout_id'])
+        full = data_fetcher.get_workout_route('user1', workouts[-1]['workout_id'], zoom=None)
+        self.assertLess(len(route), len(full))
+        self.assertEqual(len(data_fetcher.get_user_routes('user1')), len(workouts))
+
+    def test_workout_route_map(self):
+        """A route's map data is built once and then shared from the cache."""
+        workout_id = data_fetcher.get_user_workouts('user1')[-1]['workout_id']
+        route = data_fetcher.get_workout_route('user1', workout_id)
+        map_data = data_fetcher.get_workout_route_map('user1', workout_id)
+        self.assertEqual(map_data['lat'].tolist(), route[:, 0].tolist())
+        self.assertIs(data_fetcher.get_workout_route_map('user1', workout_id), map_data)
+        self.assertIsNone(data_fetcher.get_workout_route_map('user1', 'no-such-workout'))
+
+    def test_synthetic_users(self):
+        """SDS_SYNTHETIC_USERS fills new databases with generated users."""
+        with mock.patch.object(data_fetcher, 'SYNTHETIC_USERS', 3):
+            storage = data_fetcher.open_storage(':memory:')
+        self.assertTrue(storage.get_user('user3')['username'].endswith('3'))
+        self.assertIsNone(storage.get_user('user4'))
+        storage.close()
+
+    def test_friend_suggestions(self):
+        """Suggestions come from the stored friendships."""
+        self.assertEqual(data_fetcher.get_friend_suggestions('user2'), [('user3', 1), ('user4', 1)])
+        self.assertTrue(data_fetcher.get_friend_graph().are_friends('user3', 'user4'))
+
+
+class TestBulkFetch(unittest.TestCase):
+    """Tests get_users_profiles and get_posts_for_users."""
+
+    def use_fake_posts(self):
+        """Stores three posts per user, a user-specific minute apart."""
+        storage = data_fetcher.open_storage(':memory:')
+        for user_id in ('user2', 'user3', 'user4'):
+            offset = int(user_id[-1])
+            storage.add_posts([
+                {'user_id': user_id, 'post_id': f'{user_id}-{hour}',
+                 'timestamp': f'2024-01-01 {hour:02d}:{offset:02d}:00', 'content': ''}
+                for hour in (12, 8, 4)
+            ])
+        data_fetcher.use_storage(storage)
+        self.addCleanup(storage.close)
+        self.addCleanup(data_fetcher.use_storage, None)
+
+    def test_profiles_for_friends(self):
+        """Every friend's profile is returned, keyed by id."""
+        friends = data_fetcher.users['user1']['friends']
+        profiles = data_fetcher.get_users_profiles(friends)
+        self.assertEqual(list(profiles), friends)
+        self.assertEqual(profiles['user2']['username'], 'blake')
+
+    def test_profiles_missing_user(self):
+        """Unknown ids are reported together."""
+        with self.assertRaises(ValueError) as context:
+            data_fetcher.get_users_profiles(['user2', 'nobody', 'ghost'])
+        self.assertIn('nobody, ghost', str(context.exception))
+
+    def test_posts_are_merged_newest_first(self):
+        """Posts from every user come back in one timestamp-sorted list."""
+        self.use_fake_posts()
+        posts = data_fetcher.get_posts_for_users(['user2', 'user3'], limit=4)
+        self.assertEqual(
+            [post['post_id'] for post in posts],
+            ['user3-12', 'user2-12', 'user3-8', 'user2-8'])
+
+    def test_posts_since(self):
+        """Only posts after `since` are returned."""
+        self.use_fake_posts()
+        posts = data_fetcher.get_posts_for_users(['user2', 'user3'], since='2024-01-01 08:02:00')
+        self.assertEqual(
+            [post['post_id'] for post in posts], ['user3-12', 'user2-12', 'user3-8'])
+
+    def test_posts_skip_full_histories(self):
+        """The feed reads only the newest posts, not every user's history."""
+        self.use_fake_posts()
+        storage = data_fetcher.get_storage()
+        with mock.patch.object(storage, 'get_posts', wraps=storage.get_posts) as get_posts, \
+                mock.patch.object(storage, 'get_posts_for_users',
+                                  wraps=storage.get_posts_for_users) as get_posts_for_users:
+            data_fetcher.get_posts_for_users(['user2', 'user3', 'user2'], limit=2)
+        get_posts.assert_not_called()
+        get_posts_for_users.assert_called_once()
+
+
+class TestCursorPagination(unittest.TestCase):
+    """Tests the paged and streaming workout and post readers."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage = data_fetcher.open_storage(':memory:')
+        cls.storage.add_user('runner', {'full_name': 'Runner', 'username': 'runner'})
+        # Pairs of workouts share a start time, to exercise the id tie-break.
+        cls.storage.add_workouts('runner', [
+            {'workout_id': f'w{i:02d}',
+             'start_timestamp': f'2024-03-{i // 2 + 1:02d} 08:00:00',
+             'end_timestamp': f'2024-03-{i // 2 + 1:02d} 09:00:00'}
+            for i in range(9)
+        ])
+        cls.storage.add_posts([
+            {'post_id': f'p{i:02d}', 'user_id': 'runner',
+             'timestamp': f'2024-03-{i // 2 + 1:02d} 10:00:00', 'content': str(i)}
+            for i in range(7)
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+
+    def setUp(self):
+        self.original_storage = data_fetcher._storage
+        data_fetcher._storage = self.storage
+
+    def tearDown(self):
+        data_fetcher._storage = self.original_storage
+
+    def test_workout_pages(self):
+        """Following cursors visits every workout once, oldest first."""
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            workouts, cursor = data_fetcher.get_user_workouts_page('runner', cursor, limit=4)
+            seen += [w['workout_id'] for w in workouts]
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'w{i:02d}' for i in range(9)])
+        self.assertEqual(pages, 3)
+
+    def test_posts_stream_newest_first(self):
+        """Posts stream newest first across page boundaries."""
+        posts = list(data_fetcher.stream_user_posts('runner', page_size=2))
+        self.assertEqual([p['post_id'] for p in posts], [f'p{i:02d}' for i in reversed(range(7))])
+
+    def test_since_until_and_limit(self):
+        """Filters and limits apply across pages."""
+        workouts = data_fetcher.stream_user_workouts(
+            'runner', since='2024-03-02 00:00:00', until='2024-03-05 00:00:00', page_size=3)
+        self.assertEqual([w['workout_id'] for w in workouts],
+                         ['w02', 'w03', 'w04', 'w05', 'w06', 'w07'])
+        limited = data_fetcher.stream_user_workouts('runner', limit=5, page_size=2)
+        self.assertEqual(len(list(limited)), 5)
+
+    def test_invalid_cursors(self):
+        """Garbage and cursors for the wrong kind of item are rejected."""
+        _, cursor = data_fetcher.get_user_workouts_page('runner', limit=1)
+        with self.assertRaises(ValueError):
+            data_fetcher.get_user_posts_page('runner', cursor)
+        with self.assertRaises(ValueError):
+            data_fetcher.get_user_workouts_page('runner', 'not a cursor!')
+
+    def test_invalid_limits(self):
+        """Pages must hold at least one item."""
+        for get_page in (data_fetcher.get_user_workouts_page, data_fetcher.get_user_posts_page):
+            for limit in (0, -1):
+                with self.subTest(get_page=get_page.__name__, limit=limit):
+                    with self.assertRaises(ValueError):
+                        get_page('runner', limit=limit)
+
+
+class TestFetchPageData(unittest.TestCase):
+    """Tests the fetch_page_data function."""
+
+    def test_fetches_every_part(self):
+        """All parts of the page are returned without errors."""
+        page = data_fetcher.fetch_page_data('user1')
+        self.assertEqual(page['errors'], {})
+        self.assertEqual(page['profile']['username'], 'remi_the_rems')
+        self.assertGreaterEqual(len(page['workouts']), 1)
+        self.assertEqual(len(page['posts']), 1)
+        self.assertIn('content', page['genai_advice'])
+        self.assertEqual(page['route'].shape[1], 2)
+
+    def test_fetches_run_concurrently(self):
+        """Page latency is the slowest fetch, not the sum of all of them."""
+        def slow(value):
+            def fetch(user_id):
+                time.sleep(0.2)
+                return value
+            return fetch
+
+        with mock.patch.multiple(
+                data_fetcher,
+                get_user_profile=slow({}), get_user_workouts=slow([]),
+                get_user_posts=slow([]), get_genai_advice=slow({})):
+            started = time.monotonic()
+            page = data_fetcher.fetch_page_data('user1')
+            elapsed = time.monotonic() - started
+        self.assertEqual(page['errors'], {})
+        self.assertLess(elapsed, 0.6)
+
+    def test_partial_results_on_failure_and_timeout(self):
+        """Failed and slow parts fall back to empty values."""
+        release = threading.Event()
+
+        def hang(user_id):
+            release.wait(5)
+            return {'content': 'too late'}
+
+        try:
+            with mock.patch.object(data_fetcher, 'get_genai_advice', hang):
+                page = data_fetcher.fetch_page_data(
+                    'missing_user', timeouts={'genai_advice': 0.1})
+        finally:
+            release.set()
+        self.assertIsNone(page['profile'])
+        self.assertIsInstance(page['errors']['profile'], ValueError)
+        self.assertIsNone(page['genai_advice'])
+        self.assertIsInstance(page['errors']['genai_advice'], TimeoutError)
+        self.assertIsInstance(page['workouts'], list)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
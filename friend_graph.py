@@ -0,0 +1,188 @@
+#############################################################################
+# friend_graph.py
+#
+# This file contains an index of who is friends with whom, for friendship
+# checks, mutual friend counts and friend suggestions.
+#
+# Profiles store 'friends' as lists, so checking one friendship or comparing
+# two users' friends means scanning them. FriendGraph keeps the same data as
+# compressed sparse rows (CSR): user i's friends are the sorted integer ids
+# indices[indptr[i]:indptr[i + 1]]. Two int arrays hold the whole graph, so
+# a million users with tens of millions of friendships fit in a few hundred
+# MB, and set operations on friends lists are NumPy operations on sorted
+# arrays.
+#
+# A friendship is one user listing another as a friend; the demo data lists
+# every friendship from both sides.
+#############################################################################
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# How many users' friend sets are kept for O(1) are_friends checks.
+FRIEND_SET_CACHE_SIZE = 4096
+
+
+class FriendGraph:
+    """An immutable friend graph over a fixed set of users.
+
+    Build one with from_users (a users dict), from_storage or from_edges.
+
+    Args:
+        user_ids: every user id; user_ids[i] is the user with index i.
+        indptr: int64 array of len(user_ids) + 1 row offsets into indices.
+        indices: int32 array of friend indices, sorted within each row.
+    """
+
+    def __init__(self, user_ids, indptr, indices):
+        self.user_ids = list(user_ids)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self._index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self._friend_sets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_edges(cls, user_ids, sources, targets):
+        """Builds a graph from parallel arrays of user indices.
+
+        Each (sources[k], targets[k]) pair means user sources[k] lists user
+        targets[k] as a friend. Duplicate pairs are ignored.
+        """
+        count = len(user_ids)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        # One int64 key per pair sorts rows and friends within rows in one
+        # go; duplicates are then next to each other. (A plain sort is much
+        # faster than np.unique's hash table on tens of millions of keys.)
+        keys = np.sort(sources * count + targets)
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        sources, targets = np.divmod(keys, count)
+        indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=count), out=indptr[1:])
+        return cls(user_ids, indptr, targets.astype(np.int32))
+
+    @classmethod
+    def from_users(cls, users):
+        """Builds a graph from a dict of profiles with 'friends' lists,
+        such as data_fetcher.users. Friends missing from the dict are added
+        as users without friends of their own."""
+        user_ids = list(users)
+        index = {user_id: i for i, user_id in enumerate(user_ids)}
+        sources, targets = [], []
+        for user_id, profile in users.items():
+            for friend_id in profile.get('friends', []):
+                if friend_id not in index:
+                    index[friend_id] = len(user_ids)
+                    user_ids.append(friend_id)
+                sources.append(index[user_id])
+                targets.append(index[friend_id])
+        return cls.from_edges(user_ids, sources, targets)
+
+    @classmethod
+    def from_storage(cls, storage):
+        """Builds a graph of every user and friendship in a Storage."""
+        user_ids, friendships = storage.get_friend_edges()
+        index = {user_id: i for i, user_id in enumerate(user_ids)}
+        pairs = np.array([(index[a], index[b]) for a, b in friendships], dtype=np.int64)
+        return cls.from_edges(user_ids, *pairs.reshape(-1, 2).T)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._index
+
+    @property
+    def nbytes(self):
+        """Memory used by the CSR arrays, in bytes."""
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def friends(self, user_id):
+        """Returns a user's friends' ids, in index order."""
+        return [self.user_ids[i] for i in self._row(self.index_of(user_id)).tolist()]
+
+    def friend_count(self, user_id):
+        """Returns how many friends a user has."""
+        i = self.index_of(user_id)
+        return int(self.indptr[i + 1] - self.indptr[i])
+
+    def are_friends(self, user_id, other_id):
+        """Returns whether user_id lists other_id as a friend.
+
+        The user's friends are turned into a set on first use and kept in a
+        small LRU cache, so repeated checks are O(1).
+        """
+        other = self._index.get(other_id)
+        return other is not None and other in self._friend_set(self.index_of(user_id))
+
+    def mutual_friend_count(self, user_id, other_id):
+        """Returns how many friends two users have in common.
+
+        Uses the same cached friend sets as are_friends.
+        """
+        return len(self._friend_set(self.index_of(user_id))
+                   & self._friend_set(self.index_of(other_id)))
+
+    def mutual_friends(self, user_id, other_id):
+        """Returns the ids of the friends two users have in common."""
+        mutual = np.intersect1d(
+            self._row(self.index_of(user_id)), self._row(self.index_of(other_id)),
+            assume_unique=True)
+        return [self.user_ids[i] for i in mutual.tolist()]
+
+    def suggest_friends(self, user_id, limit=10):
+        """Suggests friends of friends the user isn't friends with yet.
+
+        Returns:
+            Up to `limit` (user_id, mutual friend count) tuples, most mutual
+            friends first; ties are in index order.
+        """
+        i = self.index_of(user_id)
+        friends = self._row(i)
+        candidates = np.sort(self.indices[_gather(self.indptr, friends)])
+        # Each distinct candidate's run length in the sorted array is how
+        # many of the user's friends list them.
+        starts = np.flatnonzero(np.concatenate(([True], candidates[1:] != candidates[:-1])))
+        mutual = np.diff(np.append(starts, len(candidates)))
+        candidates = candidates[starts]
+        new = (candidates != i) & ~np.isin(candidates, friends, assume_unique=True)
+        candidates, mutual = candidates[new], mutual[new]
+        # Candidates are in index order, so a stable sort on the count keeps
+        # index order within ties.
+        top = np.argsort(-mutual, kind='stable')[:limit]
+        return [(self.user_ids[c], m) for c, m in zip(candidates[top].tolist(), mutual[top].tolist())]
+
+    def index_of(self, user_id):
+        """Returns a user's integer index. Raises ValueError if unknown."""
+        try:
+            return self._index[user_id]
+        except KeyError:
+            raise ValueError(f'User {user_id} not found.') from None
+
+    def _row(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def _friend_set(self, i):
+        with self._lock:
+            friends = self._friend_sets.get(i)
+            if friends is not None:
+                self._friend_sets.move_to_end(i)
+                return friends
+        friends = frozenset(self._row(i).tolist())
+        with self._lock:
+            self._friend_sets[i] = friends
+            while len(self._friend_sets) > FRIEND_SET_CACHE_SIZE:
+                self._friend_sets.popitem(last=False)
+        return friends
+
+
+def _gather(indptr, rows):
+    # Positions in `indices` of every entry of the given rows, concatenated,
+    # without a Python loop over the rows.
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
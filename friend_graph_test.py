@@ -0,0 +1,71 @@
+#############################################################################
+# friend_graph_test.py
+#
+# This file contains tests for friend_graph.py.
+#############################################################################
+
+import unittest
+
+import numpy as np
+
+import data_fetcher
+from friend_graph import FriendGraph
+
+
+class TestFriendGraph(unittest.TestCase):
+    """Tests FriendGraph queries on the demo users."""
+
+    def setUp(self):
+        self.graph = FriendGraph.from_users(data_fetcher.users)
+
+    def test_friends_and_checks(self):
+        """Friendships match the users dict."""
+        self.assertEqual(self.graph.friends('user3'), ['user1', 'user4'])
+        self.assertEqual(self.graph.friend_count('user1'), 3)
+        self.assertTrue(self.graph.are_friends('user1', 'user2'))
+        self.assertFalse(self.graph.are_friends('user2', 'user3'))
+        self.assertFalse(self.graph.are_friends('user2', 'nobody'))
+        with self.assertRaises(ValueError):
+            self.graph.friends('nobody')
+
+    def test_mutual_friends(self):
+        """Mutual friends are the intersection of two friends lists."""
+        self.assertEqual(self.graph.mutual_friends('user3', 'user4'), ['user1'])
+        self.assertEqual(self.graph.mutual_friend_count('user1', 'user3'), 1)
+        self.assertEqual(self.graph.mutual_friend_count('user2', 'user3'), 1)
+
+    def test_suggestions_ranked_by_overlap(self):
+        """Friends of friends are suggested, most mutual friends first."""
+        self.assertEqual(self.graph.suggest_friends('user2'), [('user3', 1), ('user4', 1)])
+        self.assertEqual(self.graph.suggest_friends('user1'), [])
+
+        users = {
+            'a': {'friends': ['b', 'c']},
+            'b': {'friends': ['a', 'd', 'e']},
+            'c': {'friends': ['a', 'e']},
+        }
+        graph = FriendGraph.from_users(users)
+        self.assertEqual(graph.suggest_friends('a'), [('e', 2), ('d', 1)])
+        self.assertEqual(graph.suggest_friends('a', limit=1), [('e', 2)])
+        # Friends only listed by others still exist, without friends.
+        self.assertEqual(graph.friends('d'), [])
+
+    def test_from_edges_drops_duplicates(self):
+        """Repeated pairs count once, and rows come out sorted."""
+        graph = FriendGraph.from_edges(['x', 'y', 'z'], [0, 0, 0, 2], [2, 1, 2, 0])
+        np.testing.assert_array_equal(graph.indptr, [0, 2, 2, 3])
+        self.assertEqual(graph.friends('x'), ['y', 'z'])
+
+    def test_from_storage_matches_users_dict(self):
+        """A graph built from storage matches one built from the dict."""
+        storage = data_fetcher.open_storage(':memory:')
+        try:
+            graph = FriendGraph.from_storage(storage)
+        finally:
+            storage.close()
+        for user_id in data_fetcher.users:
+            self.assertEqual(sorted(graph.friends(user_id)), sorted(self.graph.friends(user_id)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,307 @@
+#############################################################################
+# images.py
+#
+# This file contains the image proxy used for profile, post and advice
+# images.
+#
+# Posts and advice point at remote images, often full-size photos that are
+# shown at a fraction of their size. ImageCache downloads each URL once,
+# keeps the original on disk, and serves thumbnails resized to the width
+# they are shown at. Files are named by a hash of their content, so an image
+# that several URLs point at is stored once. Thumbnails are kept in a
+# bounded in-memory LRU cache and, with the originals, in a bounded
+# directory on disk that drops the least recently used files first.
+#
+# Downloads run on a small thread pool, and a render never waits for one:
+# until an image has been downloaded, its original URL is shown as before
+# (and the browser fetches it, in parallel with the page's other images),
+# and the thumbnail is used from the next rerun on.
+#############################################################################
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from metrics import instrumented
+
+# Where images are cached on disk.
+CACHE_DIRECTORY = os.environ.get(
+    'SDS_IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'sds-images'))
+
+# How many bytes of thumbnails are kept in memory, and how many bytes of
+# originals and thumbnails on disk.
+MEMORY_CACHE_BYTES = 32 * 2**20
+DISK_CACHE_BYTES = 512 * 2**20
+
+# Downloads larger than this are abandoned.
+MAX_IMAGE_BYTES = 20 * 2**20
+
+# How long (in seconds) a download may take, how long a render waits for
+# one (not at all, so a slow or unreachable host never holds up the page),
+# and how long a URL that failed to download is left alone.
+FETCH_TIMEOUT = 10.0
+FETCH_WAIT = 0.0
+FAILURE_TTL = 300.0
+
+# Thumbnails have this many pixels per displayed pixel, for high-density
+# screens.
+THUMBNAIL_SCALE = 2
+
+_URL_DIRECTORY = 'urls'
+
+
+class ImageCache:
+    """Downloads images once and serves resized copies of them.
+
+    Args:
+        directory: where originals and thumbnails are stored.
+        memory_bytes: the most bytes of thumbnails kept in memory.
+        disk_bytes: the most bytes of originals and thumbnails kept on disk.
+        fetch: downloads a URL and returns its bytes. Defaults to urllib.
+        wait: how long (in seconds) thumbnail() waits for a download.
+    """
+
+    def __init__(self, directory=CACHE_DIRECTORY, memory_bytes=MEMORY_CACHE_BYTES,
+                 disk_bytes=DISK_CACHE_BYTES, fetch=None, wait=FETCH_WAIT):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.wait = wait
+        self._fetch = fetch or _download
+        self._lock = threading.Lock()
+        # (content hash, pixel width) -> thumbnail bytes, least recent first
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        # file name -> size of everything on disk, least recent first
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        # url -> content hash of what it pointed at
+        self._hashes = {}
+        # url -> when it last failed to download
+        self._failures = {}
+        # url -> download in progress
+        self._downloads = {}
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='image-fetch')
+        os.makedirs(os.path.join(directory, _URL_DIRECTORY), exist_ok=True)
+        self._load_disk_index()
+
+    @instrumented('fetch', 'thumbnail')
+    def thumbnail(self, url, width):
+        """Returns an image resized to be shown `width` pixels wide.
+
+        Images are never enlarged. Returns None if the URL isn't http(s),
+        couldn't be downloaded, or is still downloading after `wait`
+        seconds (by default, if it isn't downloaded yet). The download
+        carries on in the background, so it is ready on a later call.
+        """
+        if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+            return None
+        pixels = width * THUMBNAIL_SCALE
+        content_hash = self._content_hash(url)
+        if content_hash is not None:
+            thumbnail = self._cached_thumbnail(content_hash, pixels)
+            if thumbnail is not None:
+                return thumbnail
+        with self._lock:
+            failed_at = self._failures.get(url)
+            if failed_at is not None and time.monotonic() - failed_at < FAILURE_TTL:
+                return None
+            download = self._downloads.get(url)
+            if download is None:
+                download = self._downloads[url] = self._executor.submit(self._download, url)
+        try:
+            content_hash = download.result(timeout=self.wait)
+        except Exception:
+            # Still downloading (FutureTimeoutError), or it failed and is
+            # now in _failures.
+            return None
+        return self._cached_thumbnail(content_hash, pixels)
+
+    def image_for(self, url, width):
+        """Returns what to pass to st.image: the thumbnail if there is one,
+        else `url` unchanged."""
+        return self.thumbnail(url, width) or url
+
+    def clear(self):
+        """Forgets every cached image, in memory and on disk."""
+        with self._lock:
+            for name in self._disk:
+                _remove(os.path.join(self.directory, name))
+            for name in os.listdir(os.path.join(self.directory, _URL_DIRECTORY)):
+                _remove(os.path.join(self.directory, _URL_DIRECTORY, name))
+            self._memory.clear()
+            self._memory_size = 0
+            self._disk.clear()
+            self._disk_size = 0
+            self._hashes.clear()
+            self._failures.clear()
+
+    def _content_hash(self, url):
+        # The hash of what the URL was downloaded as, if its original is
+        # still on disk.
+        with self._lock:
+            content_hash = self._hashes.get(url)
+        if content_hash is None:
+            try:
+                with open(self._url_path(url)) as file:
+                    content_hash = file.read().strip()
+            except OSError:
+                return None
+        with self._lock:
+            if content_hash not in self._disk:
+                self._hashes.pop(url, None)
+                return None
+            self._hashes[url] = content_hash
+        return content_hash
+
+    def _download(self, url):
+        # Runs on the thread pool. Stores the original and returns its hash.
+        try:
+            data = self._fetch(url)
+            content_hash = hashlib.sha256(data).hexdigest()
+            # Reject anything PIL can't read before it takes up disk space.
+            Image.open(io.BytesIO(data)).verify()
+            self._store(content_hash, data)
+            _write_atomically(self._url_path(url), content_hash.encode())
+            with self._lock:
+                self._hashes[url] = content_hash
+                self._failures.pop(url, None)
+            return content_hash
+        except Exception:
+            with self._lock:
+                self._failures[url] = time.monotonic()
+            raise
+        finally:
+            with self._lock:
+                self._downloads.pop(url, None)
+
+    def _cached_thumbnail(self, content_hash, pixels):
+        # From memory, from disk, or made from the original on disk.
+        key = (content_hash, pixels)
+        name = f'{content_hash}-{pixels}'
+        with self._lock:
+            thumbnail = self._memory.get(key)
+            if thumbnail is not None:
+                self._memory.move_to_end(key)
+                return thumbnail
+        thumbnail = self._read(name)
+        if thumbnail is None:
+            original = self._read(content_hash)
+            if original is None:
+                return None
+            thumbnail = _resize(original, pixels)
+            self._store(name, thumbnail)
+        with self._lock:
+            if key not in self._memory:
+                self._memory[key] = thumbnail
+                self._memory_size += len(thumbnail)
+            while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+                self._memory_size -= len(self._memory.popitem(last=False)[1])
+        return thumbnail
+
+    def _read(self, name):
+        # Reads a cached file and marks it as recently used.
+        with self._lock:
+            if name not in self._disk:
+                return None
+            self._disk.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _store(self, name, data):
+        _write_atomically(os.path.join(self.directory, name), data)
+        with self._lock:
+            self._disk_size += len(data) - self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                evicted, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                _remove(os.path.join(self.directory, evicted))
+
+    def _load_disk_index(self):
+        # Picks up files stored by earlier runs, least recently used first.
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_size += size
+
+    def _url_path(self, url):
+        return os.path.join(
+            self.directory, _URL_DIRECTORY, hashlib.sha256(url.encode()).hexdigest())
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Returns the process-wide ImageCache, created on first use."""
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCache()
+    return _image_cache
+
+
+def _download(url):
+    # Fetches a URL, giving up on anything larger than MAX_IMAGE_BYTES.
+    request = urllib.request.Request(url, headers={'User-Agent': 'sds-image-proxy'})
+    with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+        data = response.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f'{url} is larger than {MAX_IMAGE_BYTES} bytes.')
+    return data
+
+
+def _resize(data, pixels):
+    # Returns the image scaled down to `pixels` wide, as PNG if it has
+    # transparency and JPEG otherwise. Images that are already narrow enough,
+    # and animations, are returned as they are.
+    image = Image.open(io.BytesIO(data))
+    if image.width <= pixels or getattr(image, 'is_animated', False):
+        return data
+    image = ImageOps.exif_transpose(image)
+    height = max(1, round(image.height * pixels / image.width))
+    transparent = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    image = image.convert('RGBA' if transparent else 'RGB').resize((pixels, height), Image.LANCZOS)
+    output = io.BytesIO()
+    if transparent:
+        image.save(output, 'PNG', optimize=True)
+    else:
+        image.save(output, 'JPEG', quality=85, optimize=True)
+    return output.getvalue()
+
+
+def _write_atomically(path, data):
+    # Readers (including other processes) never see a half-written file.
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
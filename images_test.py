@@ -0,0 +1,160 @@
+#############################################################################
+# images_test.py
+#
+# This file contains tests for images.py.
+#############################################################################
+
+import collections
+import io
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from images import THUMBNAIL_SCALE, ImageCache
+
+
+def make_image(width, height, mode='RGB', format='JPEG'):
+    """Returns an encoded image of the given size."""
+    output = io.BytesIO()
+    Image.new(mode, (width, height), 'red').save(output, format)
+    return output.getvalue()
+
+
+class ImageServer:
+    """A local HTTP server standing in for image hosts.
+
+    Serves self.images (path -> bytes) and counts requests per path.
+    """
+
+    def __init__(self):
+        self.images = {}
+        self.requests = collections.Counter()
+        self.release = threading.Event()
+        self.release.set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests[self.path] += 1
+                server.release.wait()
+                data = server.images.get(self.path)
+                self.send_response(200 if data else 404)
+                self.end_headers()
+                self.wfile.write(data or b'not found')
+
+            def log_message(self, *args):
+                pass
+
+        self._http = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self._http.server_port}{path}'
+
+    def close(self):
+        self.release.set()
+        self._http.shutdown()
+        self._http.server_close()
+
+
+class TestImageCache(unittest.TestCase):
+    """Tests downloading, resizing and caching images."""
+
+    def setUp(self):
+        self.server = ImageServer()
+        self.server.images['/photo.jpg'] = make_image(2000, 1000)
+        self.server.images['/copy.jpg'] = self.server.images['/photo.jpg']
+        self.server.images['/icon.png'] = make_image(40, 40, 'RGBA', 'PNG')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.close()
+        self.directory.cleanup()
+
+    def make_cache(self, **kwargs):
+        return ImageCache(self.directory.name, **{'wait': 5.0, **kwargs})
+
+    def test_resizes_and_fetches_once(self):
+        """Each URL is downloaded once, whatever widths it's shown at."""
+        cache = self.make_cache()
+        url = self.server.url('/photo.jpg')
+        small = cache.thumbnail(url, 50)
+        self.assertEqual(Image.open(io.BytesIO(small)).size, (50 * THUMBNAIL_SCALE, 50))
+        self.assertIs(cache.thumbnail(url, 50), small)
+        large = Image.open(io.BytesIO(cache.thumbnail(url, 300)))
+        self.assertEqual((large.format, large.width), ('JPEG', 300 * THUMBNAIL_SCALE))
+        self.assertEqual(self.server.requests['/photo.jpg'], 1)
+
+    def test_never_enlarges(self):
+        """Small images are served as they are, transparency and all."""
+        cache = self.make_cache()
+        self.assertEqual(cache.thumbnail(self.server.url('/icon.png'), 300),
+                         self.server.images['/icon.png'])
+
+    def test_persists_across_instances(self):
+        """A new cache over the same directory doesn't download again."""
+        url = self.server.url('/photo.jpg')
+        thumbnail = self.make_cache().thumbnail(url, 50)
+        self.server.images.clear()
+        self.assertEqual(self.make_cache().thumbnail(url, 50), thumbnail)
+        self.assertEqual(self.server.requests['/photo.jpg'], 1)
+
+    def test_same_content_stored_once(self):
+        """URLs with identical content share one original and thumbnail."""
+        cache = self.make_cache()
+        cache.thumbnail(self.server.url('/photo.jpg'), 50)
+        cache.thumbnail(self.server.url('/copy.jpg'), 50)
+        files = [f for f in os.listdir(self.directory.name) if f != 'urls']
+        self.assertEqual(len(files), 2)
+
+    def test_bounds(self):
+        """Memory and disk stay under their byte limits, dropping the least
+        recently used images first."""
+        for index in range(4):
+            self.server.images[f'/{index}.jpg'] = make_image(1000 + index, 500)
+        original_size = len(self.server.images['/0.jpg'])
+        cache = self.make_cache(memory_bytes=1, disk_bytes=3 * original_size)
+        for index in range(4):
+            self.assertIsNotNone(cache.thumbnail(self.server.url(f'/{index}.jpg'), 100))
+        self.assertEqual(len(cache._memory), 1)
+        sizes = [os.path.getsize(os.path.join(self.directory.name, f))
+                 for f in os.listdir(self.directory.name) if f != 'urls']
+        self.assertLessEqual(sum(sizes), 3 * original_size)
+
+        # The first image was evicted, so showing it downloads it again.
+        cache.thumbnail(self.server.url('/0.jpg'), 100)
+        self.assertEqual(self.server.requests['/0.jpg'], 2)
+        self.assertEqual(self.server.requests['/3.jpg'], 1)
+
+    def test_failures_fall_back_to_url(self):
+        """Missing, non-image and non-http URLs are shown as given, and
+        failed URLs aren't retried straight away."""
+        cache = self.make_cache()
+        missing = self.server.url('/missing.jpg')
+        self.assertEqual(cache.image_for(missing, 50), missing)
+        self.assertEqual(cache.image_for(missing, 50), missing)
+        self.assertEqual(self.server.requests['/missing.jpg'], 1)
+        self.assertEqual(cache.image_for('pictures/me.png', 50), 'pictures/me.png')
+        self.assertIsNone(cache.image_for(None, 50))
+
+    def test_slow_download_finishes_in_background(self):
+        """By default a render doesn't wait for a download; a later one
+        gets the thumbnail."""
+        cache = ImageCache(self.directory.name)
+        url = self.server.url('/photo.jpg')
+        self.server.release.clear()
+        self.assertEqual(cache.image_for(url, 50), url)
+        self.assertEqual(cache.image_for(url, 50), url)
+        self.server.release.set()
+        cache.wait = 5.0
+        self.assertNotEqual(cache.image_for(url, 50), url)
+        self.assertEqual(self.server.requests['/photo.jpg'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
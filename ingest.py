@@ -0,0 +1,219 @@
+#############################################################################
+# ingest.py
+#
+# This file contains the write path for wearable data. A device sync's
+# sensor samples are read in large chunks (CSV, JSON Lines or Arrow),
+# converted to SensorSeries columns, and written to storage in big
+# executemany() batches; its workouts are written with ingest_workouts.
+#
+# Reading and writing run on separate threads connected by a small bounded
+# queue: if the database falls behind, the reader waits instead of piling up
+# parsed chunks in memory. If writing fails, the reader is told to stop, so
+# the error surfaces without parsing the rest of the file.
+#
+# pandas and pyarrow are only imported when a file is read, so the app
+# (which imports this module for its ingest listeners) doesn't load them at
+# startup.
+#############################################################################
+
+import functools
+import queue
+import threading
+
+import numpy as np
+
+from cache import invalidate_user
+from data_fetcher import get_storage
+from sensor_data import SENSOR_TYPES, SensorSeries, parse_timestamps
+
+# How many samples are parsed and written at a time.
+DEFAULT_BATCH_SIZE = 50_000
+
+# How many parsed batches may wait for the writer before the reader blocks.
+DEFAULT_MAX_PENDING_BATCHES = 4
+
+# Functions called with (user_id, workout_id) after each successful ingest,
+# e.g. to refresh the user's GenAI advice.
+_ingest_listeners = []
+
+# Marks the end of the stream on the queue between the two threads.
+_END_OF_STREAM = object()
+
+
+def add_ingest_listener(listener):
+    """Calls listener(user_id, workout_id) after every successful ingest."""
+    _ingest_listeners.append(listener)
+
+
+def remove_ingest_listener(listener):
+    """Stops calling a listener added with add_ingest_listener."""
+    if listener in _ingest_listeners:
+        _ingest_listeners.remove(listener)
+
+
+def frame_to_series(frame):
+    """Converts a DataFrame of samples to a SensorSeries.
+
+    The frame needs 'sensor_type', 'timestamp' and 'data' columns, the same
+    fields as the dicts get_user_sensor_data used to return. Timestamps may
+    be 'YYYY-MM-DD HH:MM:SS' strings or integer epoch seconds.
+    """
+    type_codes = _sensor_type_index().get_indexer(frame['sensor_type'])
+    if (type_codes < 0).any():
+        unknown = sorted(set(frame['sensor_type'][type_codes < 0]))
+        raise ValueError(f'Unknown sensor types {unknown}.')
+    timestamps = frame['timestamp'].to_numpy()
+    if not np.issubdtype(timestamps.dtype, np.integer):
+        timestamps = parse_timestamps(timestamps.astype(str))
+    return SensorSeries(timestamps, frame['data'].to_numpy(), type_codes)
+
+
+def read_csv(source, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields SensorSeries batches from a CSV file path or file object."""
+    import pandas as pd
+    for frame in pd.read_csv(source, chunksize=batch_size):
+        yield frame_to_series(frame)
+
+
+def read_jsonl(source, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields SensorSeries batches from a JSON Lines file path or file object."""
+    import pandas as pd
+    with pd.read_json(source, lines=True, chunksize=batch_size,
+                      dtype={'sensor_type': str, 'data': float},
+                      convert_dates=False) as reader:
+        for frame in reader:
+            yield frame_to_series(frame)
+
+
+def read_arrow(source, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields SensorSeries batches from an Arrow IPC (file or stream) source."""
+    import pyarrow as pa
+    try:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        batches = pa.ipc.open_stream(source)
+    for record_batch in batches:
+        for offset in range(0, record_batch.num_rows, batch_size):
+            yield frame_to_series(record_batch.slice(offset, batch_size).to_pandas())
+
+
+@functools.cache
+def _sensor_type_index():
+    # Looks up sensor type codes for a whole column at once.
+    import pandas as pd
+    return pd.Index(SENSOR_TYPES)
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+    'arrow': read_arrow,
+}
+
+
+def ingest_sensor_batches(user_id, workout_id, batches, storage=None,
+                          max_pending=DEFAULT_MAX_PENDING_BATCHES):
+    """Writes an iterable of SensorSeries batches for one workout.
+
+    Batches are produced on a background thread and written on this one.
+    Samples already stored for the same (workout, sensor type, timestamp)
+    are skipped, so re-sending a sync is harmless.
+
+    Returns:
+        A dict with the number of samples 'received', 'inserted', and
+        skipped as 'duplicates'.
+    """
+    storage = storage or get_storage()
+    pending = queue.Queue(maxsize=max_pending)
+    reader_error = []
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for batch in batches:
+                if stop.is_set():
+                    break
+                pending.put(batch)
+        except BaseException as error:
+            reader_error.append(error)
+        finally:
+            pending.put(_END_OF_STREAM)
+
+    reader = threading.Thread(target=produce, name=f'ingest-{workout_id}', daemon=True)
+    reader.start()
+    received = inserted = 0
+    try:
+        while True:
+            batch = pending.get()
+            if batch is _END_OF_STREAM:
+                break
+            received += len(batch)
+            inserted += storage.add_sensor_data(workout_id, batch)
+    finally:
+        # If writing failed, stop the reader after its current batch, and
+        # drain the queue so a put it is blocked on returns.
+        stop.set()
+        while reader.is_alive():
+            try:
+                pending.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        reader.join()
+        invalidate_user(user_id)
+    if reader_error:
+        raise reader_error[0]
+    for listener in list(_ingest_listeners):
+        listener(user_id, workout_id)
+    return {'received': received, 'inserted': inserted, 'duplicates': received - inserted}
+
+
+def ingest_workouts(user_id, workouts, storage=None):
+    """Writes a user's new or updated workouts, e.g. from a device sync.
+
+    The user's activity totals are updated in the same transaction (see
+    storage.py) and ingest listeners are called once per workout.
+    """
+    storage = storage or get_storage()
+    try:
+        storage.add_workouts(user_id, workouts)
+    finally:
+        invalidate_user(user_id)
+    for workout in workouts:
+        for listener in list(_ingest_listeners):
+            listener(user_id, workout['workout_id'])
+
+
+def ingest_sensor_file(user_id, workout_id, source, file_format,
+                       batch_size=DEFAULT_BATCH_SIZE, storage=None):
+    """Ingests a CSV, JSON Lines or Arrow file of samples for a workout.
+
+    Args:
+        user_id: the user the workout belongs to.
+        workout_id: the workout the samples were recorded during.
+        source: a file path or binary file object.
+        file_format: 'csv', 'jsonl' or 'arrow'.
+
+    Returns:
+        The counts from ingest_sensor_batches.
+    """
+    if file_format not in READERS:
+        raise ValueError(f'Unknown sensor file format {file_format}.')
+    return ingest_sensor_batches(
+        user_id, workout_id, READERS[file_format](source, batch_size), storage=storage)
+
+
+def ingest_sensor_records(user_id, workout_id, records,
+                          batch_size=DEFAULT_BATCH_SIZE, storage=None):
+    """Ingests an iterable of sample dicts, e.g. a device's live upload."""
+    def batches():
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == batch_size:
+                yield SensorSeries.from_records(chunk)
+                chunk = []
+        if chunk:
+            yield SensorSeries.from_records(chunk)
+
+    return ingest_sensor_batches(user_id, workout_id, batches(), storage=storage)
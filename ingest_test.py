@@ -0,0 +1,156 @@
+#############################################################################
+# ingest_test.py
+#
+# This file contains tests for ingest.py.
+#############################################################################
+
+import io
+import time
+import unittest
+
+import pandas as pd
+import pyarrow as pa
+
+import ingest
+from sensor_data import SensorSeries
+from storage import Storage
+
+CSV_SAMPLES = """sensor_type,timestamp,data
+heart_rate,2024-01-01 00:00:02,120.0
+heart_rate,2024-01-01 00:00:01,110.0
+pressure,2024-01-01 00:00:01,3.5
+heart_rate,2024-01-01 00:00:01,999.0
+"""
+
+
+class TestIngest(unittest.TestCase):
+    """Tests writing samples through the ingestion pipeline."""
+
+    def setUp(self):
+        self.storage = Storage(':memory:')
+        self.storage.add_user('u', {'full_name': 'U', 'username': 'u'})
+        self.storage.add_workouts('u', [{
+            'workout_id': 'w', 'start_timestamp': '2024-01-01 00:00:00',
+            'end_timestamp': '2024-01-01 01:00:00'}])
+
+    def tearDown(self):
+        self.storage.close()
+
+    def stored(self):
+        return self.storage.get_sensor_data('w').to_dicts()
+
+    def test_csv_with_duplicates(self):
+        """Repeated (sensor type, timestamp) samples are only stored once."""
+        counts = ingest.ingest_sensor_file(
+            'u', 'w', io.StringIO(CSV_SAMPLES), 'csv', batch_size=2, storage=self.storage)
+        self.assertEqual(counts, {'received': 4, 'inserted': 3, 'duplicates': 1})
+        self.assertEqual(
+            [(s['sensor_type'], s['data']) for s in self.stored()],
+            [('pressure', 3.5), ('heart_rate', 110.0), ('heart_rate', 120.0)])
+
+        # Re-sending the same sync inserts nothing new.
+        counts = ingest.ingest_sensor_file(
+            'u', 'w', io.StringIO(CSV_SAMPLES), 'csv', storage=self.storage)
+        self.assertEqual(counts['inserted'], 0)
+
+    def test_jsonl_and_arrow_match_csv(self):
+        """Every format stores the same samples."""
+        frame = pd.read_csv(io.StringIO(CSV_SAMPLES))
+        jsonl = io.StringIO(frame.to_json(orient='records', lines=True))
+        ingest.ingest_sensor_file('u', 'w', jsonl, 'jsonl', storage=self.storage)
+        from_jsonl = self.stored()
+
+        arrow = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        with pa.ipc.new_stream(arrow, table.schema) as writer:
+            writer.write_table(table)
+        other = Storage(':memory:')
+        other.add_user('u', {'full_name': 'U', 'username': 'u'})
+        other.add_workouts('u', [{'workout_id': 'w', 'start_timestamp': '',
+                                  'end_timestamp': ''}])
+        ingest.ingest_sensor_file(
+            'u', 'w', pa.BufferReader(arrow.getvalue()), 'arrow', storage=other)
+        self.assertEqual(other.get_sensor_data('w').to_dicts(), from_jsonl)
+        self.assertEqual(len(from_jsonl), 3)
+        other.close()
+
+    def test_records_and_epoch_timestamps(self):
+        """Dict records and integer timestamps are accepted."""
+        records = [{'sensor_type': 'gyroscope', 'timestamp': f'2024-01-01 00:00:0{i}',
+                    'data': float(i)} for i in range(5)]
+        counts = ingest.ingest_sensor_records('u', 'w', records, batch_size=2, storage=self.storage)
+        self.assertEqual(counts['inserted'], 5)
+        series = ingest.frame_to_series(pd.DataFrame(
+            {'sensor_type': ['heart_rate'], 'timestamp': [1704067200], 'data': [1.0]}))
+        self.assertEqual(series.timestamps.tolist(), [1704067200])
+
+    def test_unknown_format_and_sensor(self):
+        """Bad input is rejected with ValueError."""
+        with self.assertRaises(ValueError):
+            ingest.ingest_sensor_file('u', 'w', io.StringIO(''), 'xml', storage=self.storage)
+        bad = 'sensor_type,timestamp,data\nbarometer,2024-01-01 00:00:00,1\n'
+        with self.assertRaises(ValueError):
+            ingest.ingest_sensor_file('u', 'w', io.StringIO(bad), 'csv', storage=self.storage)
+
+    def test_reader_waits_for_writer(self):
+        """The reader never gets more than max_pending batches ahead."""
+        produced = []
+        lead = []
+
+        def batches():
+            for i in range(10):
+                produced.append(i)
+                yield SensorSeries([i], [1.0], [0])
+
+        original = self.storage.add_sensor_data
+
+        def slow_write(workout_id, batch):
+            time.sleep(0.01)
+            # Batches read but not yet written: those queued, the one being
+            # written and the one the reader is waiting to queue.
+            lead.append(len(produced) - int(batch.timestamps[0]))
+            return original(workout_id, batch)
+
+        self.storage.add_sensor_data = slow_write
+        counts = ingest.ingest_sensor_batches(
+            'u', 'w', batches(), storage=self.storage, max_pending=2)
+        self.assertEqual(counts['inserted'], 10)
+        self.assertLessEqual(max(lead), 2 + 2)
+
+    def test_writer_failure_stops_reader(self):
+        """A failed write stops reading instead of parsing every batch."""
+        produced = []
+
+        def batches():
+            for i in range(1000):
+                produced.append(i)
+                yield SensorSeries([i], [1.0], [0])
+
+        def failing_write(workout_id, batch):
+            raise RuntimeError('disk full')
+
+        self.storage.add_sensor_data = failing_write
+        with self.assertRaisesRegex(RuntimeError, 'disk full'):
+            ingest.ingest_sensor_batches('u', 'w', batches(), storage=self.storage, max_pending=2)
+        # The failed batch, those queued, and at most two the reader was on.
+        self.assertLessEqual(len(produced), 1 + 2 + 2)
+
+    def test_workouts_notify_listeners(self):
+        """ingest_workouts stores workouts and calls listeners for each."""
+        seen = []
+        ingest.add_ingest_listener(lambda user_id, workout_id: seen.append(workout_id))
+        try:
+            ingest.ingest_workouts('u', [
+                {'workout_id': 'w2', 'start_timestamp': '2024-01-02 00:00:00',
+                 'end_timestamp': '2024-01-02 00:30:00', 'steps': 10},
+                {'workout_id': 'w3', 'start_timestamp': '2024-01-03 00:00:00',
+                 'end_timestamp': '2024-01-03 00:30:00', 'steps': 20},
+            ], storage=self.storage)
+        finally:
+            ingest._ingest_listeners.pop()
+        self.assertEqual(seen, ['w2', 'w3'])
+        self.assertEqual(self.storage.get_rollups('u', 'month')[0]['steps'], 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,8 +6,22 @@
 #
 #############################################################################
 
+import os
+import re
+import threading
+
 import streamlit.components.v1 as components
 
+# Matches a template placeholder such as {{NAME}}
+PLACEHOLDER_PATTERN = re.compile(r'\{\{(.*?)\}\}')
+
+# Escapes quotes and the backslash character in one str.translate() call
+_ESCAPE_TABLE = str.maketrans({"'": "\\'", '"': '\\"', '\\': '\\\\'})
+
+# Compiled templates by file path, as (modification time, ComponentTemplate)
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+
 
 def load_html_file(file_path):
     # Read an html file
@@ -17,18 +31,52 @@ def load_html_file(file_path):
 
 def safe_string(string):
     # Make the string "safe" by escaping quotes and a backslash character
-    return ''.join(['\\' + c if c in ["'", '"', '\\'] else c for c in string])
+    return string.translate(_ESCAPE_TABLE)
+
+
+class ComponentTemplate:
+    # An HTML template split once into literal text and placeholder slots, so
+    # rendering is a single join instead of one replace() per data key.
+
+    def __init__(self, html):
+        # re.split alternates literal text and placeholder names:
+        # [text, name, text, name, ..., text]
+        parts = PLACEHOLDER_PATTERN.split(html)
+        self.literals = parts[0::2]
+        self.slots = parts[1::2]
+
+    def render(self, data):
+        # Fill every slot in one pass. Placeholders without data are kept
+        # as-is, like the original replace() loop did.
+        values = {str(key): safe_string(str(value)) for key, value in data.items()}
+        pieces = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            pieces.append(values.get(slot, '{{' + slot + '}}'))
+            pieces.append(literal)
+        return ''.join(pieces)
+
+
+def load_template(file_path):
+    # Return the compiled template for a file, re-reading it only when the
+    # file's modification time changes
+    mtime = os.stat(file_path).st_mtime_ns
+    cached = _template_cache.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    template = ComponentTemplate(load_html_file(file_path))
+    with _template_cache_lock:
+        _template_cache[file_path] = (mtime, template)
+    return template
+
+
+def render_component(data, component_name):
+    # Return the component's HTML with the templates replaced by the data
+    return load_template(f'custom_components/{component_name}.html').render(data)
 
 
 def create_component(data, component_name, height=None, width=None, scrolling=False):
-    # Read the HTML content from the file
-    component_html = load_html_file(f'custom_components/{component_name}.html')
-
-    # Replace the templates with the specified data
-    for key in data:
-        data_placeholder = "{{" + str(key) + "}}"
-        component_html = component_html.replace(
-            data_placeholder, safe_string(str(data[key])))
+    # Fill the component's HTML template with the specified data
+    component_html = render_component(data, component_name)
 
     # Have streamlit render the component
     components.html(component_html, width, height, scrolling)
@@ -0,0 +1,62 @@
+#############################################################################
+# internals_test.py
+#
+# This file contains tests for internals.py.
+#############################################################################
+
+import os
+import tempfile
+import unittest
+
+import internals
+
+
+class TestComponentTemplate(unittest.TestCase):
+    """Tests the compiled component templates."""
+
+    def test_render_fills_every_placeholder(self):
+        """Each placeholder is replaced, including repeated ones."""
+        template = internals.ComponentTemplate('<p>{{A}} and {{B}} and {{A}}</p>')
+        self.assertEqual(template.render({'A': 1, 'B': 'two'}), '<p>1 and two and 1</p>')
+
+    def test_missing_data_keeps_placeholder(self):
+        """Placeholders without data are left untouched."""
+        template = internals.ComponentTemplate('{{A}}-{{B}}')
+        self.assertEqual(template.render({'A': 'x'}), 'x-{{B}}')
+
+    def test_values_are_escaped(self):
+        """Quotes and backslashes in values are escaped."""
+        template = internals.ComponentTemplate('"{{NAME}}"')
+        self.assertEqual(template.render({'NAME': 'a\'b"c\\d'}), '"a\\\'b\\"c\\\\d"')
+
+    def test_safe_string(self):
+        """safe_string escapes the same characters as before."""
+        self.assertEqual(internals.safe_string('it\'s "x"\\'), 'it\\\'s \\"x\\"\\\\')
+
+    def test_render_component_matches_file(self):
+        """The example component renders the given name."""
+        html = internals.render_component({'NAME': 'Remi'}, 'my_custom_component')
+        self.assertIn('<p>Your name is: Remi</p>', html)
+
+
+class TestLoadTemplate(unittest.TestCase):
+    """Tests the template cache."""
+
+    def test_reloads_only_when_file_changes(self):
+        """The file is parsed once until its modification time changes."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'component.html')
+            with open(path, 'w') as file:
+                file.write('old {{X}}')
+            first = internals.load_template(path)
+            self.assertIs(internals.load_template(path), first)
+
+            with open(path, 'w') as file:
+                file.write('new {{X}}')
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            self.assertEqual(internals.load_template(path).render({'X': 1}), 'new 1')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,249 @@
+#############################################################################
+# leaderboards.py
+#
+# This file contains friends leaderboards: how a user ranks among their
+# friends by steps, distance or calories over a day, week or month.
+#
+# Storage already keeps every user's totals per period up to date as
+# workouts are written (the user_rollups table), so a leaderboard never
+# rescans workouts. On top of that, each leaderboard that has been shown is
+# kept in memory as a small sorted top-k list. When a workout is ingested,
+# the author's new totals are read (one row per period) and pushed into the
+# boards of every user who has them as a friend, so showing a leaderboard on
+# a page load is a dictionary lookup.
+#############################################################################
+
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import data_fetcher
+import ingest
+from storage import ROLLUP_PERIODS
+
+# The totals a leaderboard can rank by, in the order storage returns them.
+LEADERBOARD_METRICS = ('steps', 'distance', 'calories_burned')
+
+# How many places each leaderboard keeps.
+DEFAULT_TOP_K = 10
+
+# How many leaderboards are kept in memory; the least recently shown are
+# dropped first (and rebuilt from storage if they are shown again).
+MAX_BOARDS = 4096
+
+
+def period_start_for(day, period):
+    """Returns the 'YYYY-MM-DD' start of the day, week or month containing
+    `day` (a date), matching the periods in storage's user_rollups."""
+    if period == 'day':
+        start = day
+    elif period == 'week':
+        start = day - timedelta(days=day.weekday())
+    elif period == 'month':
+        start = day.replace(day=1)
+    else:
+        raise ValueError(f'Unknown rollup period {period}.')
+    return start.isoformat()
+
+
+class _Board:
+    # One viewer's leaderboard for one metric and period. entries holds up
+    # to k (-value, user_id) pairs in ascending order, i.e. best first.
+    __slots__ = ('members', 'entries', 'stale')
+
+    def __init__(self, members):
+        self.members = members
+        self.entries = []
+        self.stale = False
+
+
+class Leaderboards:
+    """Friends leaderboards kept up to date as workouts are ingested.
+
+    Args:
+        storage: where totals and friends are read from. Defaults to
+            data_fetcher's storage.
+        k: how many places each leaderboard has.
+        today: returns the current date, for the default period.
+    """
+
+    def __init__(self, storage=None, k=DEFAULT_TOP_K, today=date.today):
+        self._storage = storage
+        self.k = k
+        self._today = today
+        # (viewer, metric, period, period_start) -> _Board
+        self._boards = OrderedDict()
+        # (period, period_start) -> {user_id: (steps, distance, calories)}
+        self._totals = {}
+        # user_id -> keys of the boards the user appears on
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def storage(self):
+        return self._storage or data_fetcher.get_storage()
+
+    def top(self, user_id, metric='steps', period='week', period_start=None):
+        """Returns the user's leaderboard among themselves and their friends.
+
+        Args:
+            metric: one of LEADERBOARD_METRICS.
+            period: 'day', 'week' or 'month'.
+            period_start: the 'YYYY-MM-DD' start of the period. Defaults to
+                the current period.
+
+        Returns:
+            Up to k dicts with 'rank', 'user_id' and 'value', best first.
+            Ties are broken by user id.
+        """
+        if metric not in LEADERBOARD_METRICS:
+            raise ValueError(f'Unknown leaderboard metric {metric}.')
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f'Unknown rollup period {period}.')
+        if period_start is None:
+            period_start = period_start_for(self._today(), period)
+        key = (user_id, metric, period, period_start)
+        with self._lock:
+            board = self._boards.get(key)
+            if board is not None:
+                self._boards.move_to_end(key)
+        if board is None:
+            board = self._build(key)
+        elif board.stale:
+            self._rank(key, board)
+        with self._lock:
+            entries = list(board.entries)
+        return [
+            {'rank': rank, 'user_id': member, 'value': -negative}
+            for rank, (negative, member) in enumerate(entries, start=1)
+        ]
+
+    def record_workout(self, user_id, workout_id=None):
+        """Updates every shown leaderboard the user appears on.
+
+        This is an ingest listener (see ingest.add_ingest_listener): it reads
+        the user's new totals for each period those leaderboards cover and
+        moves the user up (or down) in each of them.
+        """
+        with self._lock:
+            keys = list(self._watchers.get(user_id, ()))
+        periods = {(period, period_start) for _, _, period, period_start in keys}
+        for period, period_start in periods:
+            totals = self.storage.get_rollups_for_users([user_id], period, period_start)
+            values = totals.get(user_id, (0, 0, 0))
+            with self._lock:
+                self._totals.setdefault((period, period_start), {})[user_id] = values
+                for key in keys:
+                    board = self._boards.get(key)
+                    if board is not None and key[2:] == (period, period_start):
+                        self._update(board, user_id, values[LEADERBOARD_METRICS.index(key[1])])
+
+    def forget(self, user_id):
+        """Drops the user's own leaderboards, e.g. after their friends change."""
+        with self._lock:
+            for key in [key for key in self._boards if key[0] == user_id]:
+                self._drop(key)
+
+    def clear(self):
+        """Drops every leaderboard."""
+        with self._lock:
+            self._boards.clear()
+            self._totals.clear()
+            self._watchers.clear()
+
+    def start(self):
+        """Starts updating leaderboards after each ingest."""
+        ingest.add_ingest_listener(self.record_workout)
+        return self
+
+    def stop(self):
+        """Stops updating leaderboards after ingests."""
+        ingest.remove_ingest_listener(self.record_workout)
+
+    def _build(self, key):
+        viewer, _, period, period_start = key
+        profile = self.storage.get_user(viewer)
+        if profile is None:
+            raise ValueError(f'User {viewer} not found.')
+        members = frozenset([viewer, *profile['friends']])
+        totals = self.storage.get_rollups_for_users(members, period, period_start)
+        board = _Board(members)
+        with self._lock:
+            period_totals = self._totals.setdefault((period, period_start), {})
+            for member in members:
+                period_totals[member] = totals.get(member, (0, 0, 0))
+                self._watchers.setdefault(member, set()).add(key)
+            self._boards[key] = board
+            while len(self._boards) > MAX_BOARDS:
+                self._drop(next(iter(self._boards)))
+        self._rank(key, board)
+        return board
+
+    def _rank(self, key, board):
+        # Recomputes a board from the cached totals of all its members.
+        _, metric, period, period_start = key
+        column = LEADERBOARD_METRICS.index(metric)
+        with self._lock:
+            totals = self._totals[(period, period_start)]
+            board.entries = sorted(
+                (-totals[member][column], member) for member in board.members)[:self.k]
+            board.stale = False
+
+    def _update(self, board, user_id, value):
+        # Moves one member to their new value. Values normally only grow,
+        # which never needs the rest of the members; if a member in the top
+        # k shrinks, someone outside it may overtake them, so the board is
+        # recomputed on its next read instead.
+        entries = board.entries
+        old = next((entry for entry in entries if entry[1] == user_id), None)
+        if old is not None:
+            if value < -old[0] and len(board.members) > self.k:
+                board.stale = True
+                return
+            entries.remove(old)
+        entry = (-value, user_id)
+        if len(entries) < self.k or entry < entries[-1]:
+            bisect.insort(entries, entry)
+            del entries[self.k:]
+
+    def _drop(self, key):
+        # Callers hold the lock. Members' totals are kept while any other
+        # board for the same period still shows them.
+        board = self._boards.pop(key)
+        period = key[2:]
+        period_totals = self._totals.get(period, {})
+        for member in board.members:
+            watched = self._watchers.get(member, set())
+            watched.discard(key)
+            if not any(other[2:] == period for other in watched):
+                period_totals.pop(member, None)
+            if not watched:
+                self._watchers.pop(member, None)
+        if not period_totals:
+            self._totals.pop(period, None)
+
+
+_leaderboards = None
+_leaderboards_lock = threading.Lock()
+
+
+def get_leaderboards():
+    """Returns the process-wide Leaderboards, started on first use."""
+    global _leaderboards
+    if _leaderboards is None:
+        with _leaderboards_lock:
+            if _leaderboards is None:
+                _leaderboards = Leaderboards().start()
+    return _leaderboards
+
+
+def get_friends_leaderboard(user_id, metric='steps', period='week', period_start=None):
+    """Returns the user's friends leaderboard with everyone's names.
+
+    Takes the same arguments as Leaderboards.top, and adds each entry's
+    'name' (the profile's full_name) to what it returns.
+    """
+    entries = get_leaderboards().top(user_id, metric, period, period_start)
+    profiles = data_fetcher.get_users_profiles(entry['user_id'] for entry in entries)
+    return [{**entry, 'name': profiles[entry['user_id']]['full_name']} for entry in entries]
@@ -0,0 +1,128 @@
+#############################################################################
+# leaderboards_test.py
+#
+# This file contains tests for leaderboards.py.
+#############################################################################
+
+import unittest
+from datetime import date
+from unittest import mock
+
+import data_fetcher
+import ingest
+import leaderboards
+from leaderboards import Leaderboards, period_start_for
+from storage import Storage
+
+
+def make_workout(workout_id, day, steps, distance=1.0):
+    return {
+        'workout_id': workout_id,
+        'start_timestamp': f'{day} 08:00:00',
+        'end_timestamp': f'{day} 09:00:00',
+        'distance': distance,
+        'steps': steps,
+        'calories_burned': steps // 10,
+    }
+
+
+class TestPeriods(unittest.TestCase):
+    """Tests period_start_for."""
+
+    def test_matches_rollup_periods(self):
+        """Weeks start on Monday and months on the 1st."""
+        day = date(2024, 1, 10)  # a Wednesday
+        self.assertEqual(period_start_for(day, 'day'), '2024-01-10')
+        self.assertEqual(period_start_for(day, 'week'), '2024-01-08')
+        self.assertEqual(period_start_for(day, 'month'), '2024-01-01')
+        with self.assertRaises(ValueError):
+            period_start_for(day, 'year')
+
+
+class TestLeaderboards(unittest.TestCase):
+    """Tests building and incrementally updating leaderboards."""
+
+    def setUp(self):
+        self.storage = Storage(':memory:')
+        with self.storage.write() as connection:
+            self.storage.add_user('me', {'full_name': 'Me', 'username': 'me',
+                                         'friends': ['a', 'b', 'c']}, connection)
+            for name in 'abc':
+                self.storage.add_user(name, {'full_name': name.upper(), 'username': name,
+                                             'friends': ['me']}, connection)
+        for user_id, steps in [('me', 500), ('a', 900), ('b', 100)]:
+            self.storage.add_workouts(user_id, [make_workout(f'{user_id}-1', '2024-01-09', steps)])
+        self.boards = Leaderboards(self.storage, k=3, today=lambda: date(2024, 1, 10)).start()
+
+    def tearDown(self):
+        self.boards.stop()
+        self.storage.close()
+
+    def ranking(self, user_id='me', metric='steps'):
+        return [(entry['user_id'], entry['value']) for entry in self.boards.top(user_id, metric)]
+
+    def test_ranks_user_and_friends(self):
+        """The current week is ranked best first, cut to k places."""
+        self.assertEqual(self.ranking(), [('a', 900), ('me', 500), ('b', 100)])
+        self.assertEqual(self.boards.top('me')[0]['rank'], 1)
+        self.assertEqual(self.ranking('a'), [('a', 900), ('me', 500)])
+        self.assertEqual(self.ranking(metric='distance')[0], ('a', 1.0))
+
+    def test_ingest_updates_without_rebuilding(self):
+        """New workouts move users on every shown board that has them."""
+        self.ranking()
+        self.ranking('c')
+        with mock.patch.object(self.storage, 'get_rollups_for_users',
+                               wraps=self.storage.get_rollups_for_users) as reads:
+            ingest.ingest_workouts('c', [make_workout('c-1', '2024-01-11', 2000)], self.storage)
+            self.assertEqual(self.ranking(), [('c', 2000), ('a', 900), ('me', 500)])
+            self.assertEqual(self.ranking('c'), [('c', 2000), ('me', 500)])
+        # One single-user read for the ingested user's week, nothing else.
+        reads.assert_called_once_with(['c'], 'week', '2024-01-08')
+
+    def test_other_periods_are_untouched(self):
+        """A workout in another week doesn't change this week's board."""
+        self.ranking()
+        ingest.ingest_workouts('b', [make_workout('b-2', '2024-02-01', 5000)], self.storage)
+        self.assertEqual(self.ranking(), [('a', 900), ('me', 500), ('b', 100)])
+
+    def test_shrinking_leader_is_recomputed(self):
+        """If someone in the top k drops, outsiders can overtake them."""
+        self.ranking()
+        ingest.ingest_workouts('c', [make_workout('c-1', '2024-01-09', 50)], self.storage)
+        ingest.ingest_workouts('a', [make_workout('a-1', '2024-01-09', 10)], self.storage)
+        self.assertEqual(self.ranking(), [('me', 500), ('b', 100), ('c', 50)])
+
+    def test_forget_and_unknown_users(self):
+        """Forgotten boards are rebuilt; unknown users and metrics fail."""
+        self.ranking()
+        self.boards.forget('me')
+        self.assertEqual(self.ranking(), [('a', 900), ('me', 500), ('b', 100)])
+        with self.assertRaises(ValueError):
+            self.boards.top('nobody')
+        with self.assertRaises(ValueError):
+            self.boards.top('me', metric='heart_rate')
+
+
+class TestFriendsLeaderboard(unittest.TestCase):
+    """Tests get_friends_leaderboard on the demo data."""
+
+    def setUp(self):
+        data_fetcher.use_storage(data_fetcher.open_storage(':memory:'))
+        leaderboards.get_leaderboards().clear()
+
+    def tearDown(self):
+        leaderboards.get_leaderboards().clear()
+        data_fetcher.use_storage(None)
+
+    def test_names_are_added(self):
+        """Entries carry each user's full name."""
+        entries = leaderboards.get_friends_leaderboard('user1', period_start='2024-01-01')
+        self.assertEqual(len(entries), 4)
+        self.assertIn('Remi', [entry['name'] for entry in entries])
+        values = [entry['value'] for entry in entries]
+        self.assertEqual(values, sorted(values, reverse=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+#############################################################################
+# live.py
+#
+# This file contains the data side of the live workout view: samples that
+# are still coming in, in the same {'sensor_type', 'timestamp', 'data'}
+# shape get_user_sensor_data returns.
+#
+# Each sensor type's samples go into a fixed-size NumPy ring buffer, so a
+# one-hour session uses as much memory as a one-minute one; only the most
+# recent LIVE_CAPACITY samples per sensor are kept for charts. Statistics are
+# kept online instead (Welford's mean and variance, minimum and maximum), so
+# they still cover every sample, including the ones the buffer has dropped.
+#
+# Readers keep a cursor (how many samples they have seen) and ask for what
+# came after it, so modules.display_live_workout only rebuilds the chart data
+# of sensors with new samples, and only from their latest points.
+#############################################################################
+
+import threading
+import time
+
+import numpy as np
+
+from sensor_data import SENSOR_TYPES, SensorSeries
+
+# How many of the latest samples are kept per sensor type.
+LIVE_CAPACITY = 3600
+
+
+class RingBuffer:
+    """The latest `capacity` (timestamp, value) samples of one sensor.
+
+    Attributes:
+        capacity: how many samples are kept.
+        total: how many samples were ever appended. A reader that has seen
+            `total` samples can pass it to since() later to get only the
+            samples appended in the meantime.
+    """
+
+    __slots__ = ('capacity', 'total', '_timestamps', '_values')
+
+    def __init__(self, capacity=LIVE_CAPACITY):
+        if capacity < 1:
+            raise ValueError('A ring buffer must hold at least one sample.')
+        self.capacity = capacity
+        self.total = 0
+        self._timestamps = np.zeros(capacity, dtype=np.int64)
+        self._values = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def nbytes(self):
+        """Memory used by the buffer's columns, in bytes (never grows)."""
+        return self._timestamps.nbytes + self._values.nbytes
+
+    def extend(self, timestamps, values):
+        """Appends samples, overwriting the oldest ones once full."""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        count = len(values)
+        if count == 0:
+            return
+        # Of a batch bigger than the buffer, only its tail would survive.
+        kept = min(count, self.capacity)
+        start = (self.total + count - kept) % self.capacity
+        first = min(kept, self.capacity - start)
+        self._timestamps[start:start + first] = timestamps[count - kept:count - kept + first]
+        self._values[start:start + first] = values[count - kept:count - kept + first]
+        # What doesn't fit before the end of the arrays wraps around.
+        self._timestamps[:kept - first] = timestamps[count - kept + first:]
+        self._values[:kept - first] = values[count - kept + first:]
+        self.total += count
+
+    def since(self, cursor=0):
+        """Returns the (timestamps, values) appended after the first
+        `cursor` samples, oldest first. Samples already overwritten are
+        left out, so a reader that fell behind gets the whole buffer."""
+        count = min(self.total - max(cursor, 0), len(self))
+        if count <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        indexes = np.arange(self.total - count, self.total) % self.capacity
+        return self._timestamps[indexes], self._values[indexes]
+
+    def to_arrays(self):
+        """Returns every kept (timestamps, values), oldest first."""
+        return self.since(0)
+
+
+class RunningStats:
+    """Count, mean, variance, minimum and maximum of every value seen.
+
+    Values are added in batches and merged with Welford's (Chan's parallel)
+    update, which stays accurate over long sessions where summing squares
+    would not.
+    """
+
+    __slots__ = ('count', 'mean', 'minimum', 'maximum', '_squares')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.minimum = None
+        self.maximum = None
+        # Sum of squared differences from the mean (Welford's M2).
+        self._squares = 0.0
+
+    def update(self, values):
+        """Adds a batch of values."""
+        values = np.asarray(values, dtype=np.float64)
+        count = len(values)
+        if count == 0:
+            return
+        mean = float(values.mean())
+        squares = float(np.square(values - mean).sum())
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._squares += squares + delta * delta * self.count * count / total
+        self.count = total
+        minimum, maximum = float(values.min()), float(values.max())
+        self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+
+    @property
+    def variance(self):
+        """The sample variance, or None before there are two values."""
+        return self._squares / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def std(self):
+        """The sample standard deviation, or None before there are two values."""
+        variance = self.variance
+        return None if variance is None else variance ** 0.5
+
+
+class LiveWorkout:
+    """A workout in progress: a ring buffer and running statistics for each
+    sensor type it has samples of.
+
+    Samples can be pushed from one thread (e.g. whatever receives them from
+    the device) while the page reads them from another.
+    """
+
+    def __init__(self, capacity=LIVE_CAPACITY):
+        self.capacity = capacity
+        self._buffers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def push(self, samples):
+        """Adds samples: a SensorSeries or an iterable of sample dicts."""
+        if not isinstance(samples, SensorSeries):
+            samples = SensorSeries.from_records(samples)
+        with self._lock:
+            for code in np.unique(samples.type_codes):
+                mask = samples.type_codes == code
+                sensor_type = SENSOR_TYPES[code]
+                if sensor_type not in self._buffers:
+                    self._buffers[sensor_type] = RingBuffer(self.capacity)
+                    self._stats[sensor_type] = RunningStats()
+                values = samples.values[mask]
+                self._buffers[sensor_type].extend(samples.timestamps[mask], values)
+                self._stats[sensor_type].update(values)
+
+    @property
+    def sensor_types(self):
+        """Sensor types with samples so far, in SENSOR_TYPES order."""
+        with self._lock:
+            return [name for name in SENSOR_TYPES if name in self._buffers]
+
+    @property
+    def nbytes(self):
+        """Memory used by the buffered samples, in bytes."""
+        with self._lock:
+            return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    @property
+    def max_heart_rate(self):
+        """The highest heart rate so far, or None without heart rate samples."""
+        with self._lock:
+            stats = self._stats.get('heart_rate')
+            return stats.maximum if stats else None
+
+    def stats(self, sensor_type):
+        """Returns a dict of the sensor's 'count', 'mean', 'std', 'min', 'max'
+        and 'latest' value so far. Values are None while unknown."""
+        with self._lock:
+            stats = self._stats.get(sensor_type)
+            if stats is None:
+                return {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None,
+                        'latest': None}
+            _, latest = self._buffers[sensor_type].since(stats.count - 1)
+            return {'count': stats.count, 'mean': stats.mean, 'std': stats.std,
+                    'min': stats.minimum, 'max': stats.maximum, 'latest': float(latest[-1])}
+
+    def total(self, sensor_type):
+        """Returns how many of the sensor's samples were ever pushed."""
+        with self._lock:
+            buffer = self._buffers.get(sensor_type)
+            return buffer.total if buffer else 0
+
+    def since(self, sensor_type, cursor=0):
+        """Returns the sensor's samples after the first `cursor`, as
+        (timestamps, values, new cursor). Pass the new cursor next time to
+        get only the samples pushed in between (see RingBuffer.since)."""
+        with self._lock:
+            buffer = self._buffers.get(sensor_type)
+            if buffer is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), 0
+            timestamps, values = buffer.since(cursor)
+            return timestamps, values, buffer.total
+
+
+class Replay:
+    """Pushes a recorded workout's samples into a LiveWorkout as if they were
+    arriving now, `speed` times faster than they were recorded.
+
+    Used to demo the live view without a device: call push_due() every
+    refresh.
+    """
+
+    def __init__(self, samples, live, speed=1.0, clock=time.monotonic):
+        if not isinstance(samples, SensorSeries):
+            samples = SensorSeries.from_records(samples)
+        self.samples = samples.sorted()
+        self.live = live
+        self.speed = speed
+        self._clock = clock
+        self._started = clock()
+        self._pushed = 0
+
+    @property
+    def done(self):
+        """Whether every sample has been pushed."""
+        return self._pushed == len(self.samples)
+
+    def push_due(self):
+        """Pushes the samples recorded by now. Returns how many there were."""
+        if self.done:
+            return 0
+        elapsed = (self._clock() - self._started) * self.speed
+        due = self.samples.timestamps[0] + elapsed
+        end = int(np.searchsorted(self.samples.timestamps, due, side='right'))
+        pushed = end - self._pushed
+        if pushed > 0:
+            self.live.push(self.samples[self._pushed:end])
+            self._pushed = end
+        return max(pushed, 0)
@@ -0,0 +1,144 @@
+#############################################################################
+# live_test.py
+#
+# This file contains tests for live.py.
+#############################################################################
+
+import unittest
+
+import numpy as np
+
+from live import LiveWorkout, Replay, RingBuffer, RunningStats
+from sensor_data import SensorSeries, format_timestamps, sensor_code
+
+
+def heart_rate_samples(start, values):
+    """Returns one heart rate sample dict per value, a second apart."""
+    timestamps = format_timestamps(np.arange(start, start + len(values)))
+    return [{'sensor_type': 'heart_rate', 'timestamp': timestamp, 'data': float(value)}
+            for timestamp, value in zip(timestamps.tolist(), values)]
+
+
+class TestRingBuffer(unittest.TestCase):
+    """Tests the fixed-size sample buffer."""
+
+    def test_keeps_the_latest_samples(self):
+        """Once full, the oldest samples are overwritten, in any batch size."""
+        for batch in (1, 3, 5, 12):
+            with self.subTest(batch=batch):
+                buffer = RingBuffer(5)
+                for start in range(0, 12, batch):
+                    stop = min(start + batch, 12)
+                    buffer.extend(np.arange(start, stop), np.arange(start, stop) * 10.0)
+                timestamps, values = buffer.to_arrays()
+                self.assertEqual(timestamps.tolist(), [7, 8, 9, 10, 11])
+                self.assertEqual(values.tolist(), [70.0, 80.0, 90.0, 100.0, 110.0])
+                self.assertEqual((len(buffer), buffer.total), (5, 12))
+
+    def test_since(self):
+        """A cursor gets only newer samples; a stale one gets the buffer."""
+        buffer = RingBuffer(4)
+        buffer.extend([1, 2, 3], [1.0, 2.0, 3.0])
+        cursor = buffer.total
+        self.assertEqual(len(buffer.since(cursor)[0]), 0)
+        buffer.extend([4, 5], [4.0, 5.0])
+        self.assertEqual(buffer.since(cursor)[0].tolist(), [4, 5])
+        buffer.extend([6, 7, 8], [6.0, 7.0, 8.0])
+        self.assertEqual(buffer.since(cursor)[0].tolist(), [5, 6, 7, 8])
+
+    def test_invalid_capacity(self):
+        """A buffer must have room for a sample."""
+        with self.assertRaises(ValueError):
+            RingBuffer(0)
+
+
+class TestRunningStats(unittest.TestCase):
+    """Tests the online statistics."""
+
+    def test_matches_numpy(self):
+        """Batched updates give the statistics of all values at once."""
+        values = np.random.default_rng(7).normal(140.0, 12.0, 1000)
+        stats = RunningStats()
+        for batch in np.array_split(values, 17):
+            stats.update(batch)
+        self.assertEqual(stats.count, 1000)
+        self.assertAlmostEqual(stats.mean, values.mean())
+        self.assertAlmostEqual(stats.variance, values.var(ddof=1))
+        self.assertAlmostEqual(stats.std, values.std(ddof=1))
+        self.assertEqual((stats.minimum, stats.maximum), (values.min(), values.max()))
+
+    def test_large_offset(self):
+        """The variance stays accurate around a large mean."""
+        stats = RunningStats()
+        stats.update(1e9 + np.array([4.0, 7.0]))
+        stats.update(1e9 + np.array([13.0, 16.0]))
+        self.assertAlmostEqual(stats.variance, 30.0)
+
+    def test_empty(self):
+        """Empty batches change nothing; one value has no variance."""
+        stats = RunningStats()
+        stats.update([])
+        stats.update([5.0])
+        self.assertEqual((stats.count, stats.mean, stats.variance), (1, 5.0, None))
+
+
+class TestLiveWorkout(unittest.TestCase):
+    """Tests pushing samples into and reading them from a live workout."""
+
+    def test_push_sample_dicts(self):
+        """Samples are split by sensor type; statistics cover every sample."""
+        live = LiveWorkout(capacity=10)
+        values = [100, 150, 120] * 10
+        live.push(heart_rate_samples(1_700_000_000, values))
+        live.push([{'sensor_type': 'pressure', 'timestamp': '2024-01-01 00:00:00', 'data': 3.0}])
+
+        self.assertEqual(live.sensor_types, ['pressure', 'heart_rate'])
+        self.assertEqual(live.max_heart_rate, 150.0)
+        stats = live.stats('heart_rate')
+        self.assertEqual((stats['count'], stats['latest'], stats['min']), (30, 120.0, 100.0))
+        self.assertAlmostEqual(stats['mean'], np.mean(values))
+        self.assertAlmostEqual(stats['std'], np.std(values, ddof=1))
+        self.assertIsNone(live.stats('gyroscope')['mean'])
+
+        timestamps, _, cursor = live.since('heart_rate')
+        self.assertEqual(len(timestamps), 10)
+        self.assertEqual(cursor, 30)
+        live.push(heart_rate_samples(1_700_000_030, [180]))
+        self.assertEqual(live.since('heart_rate', cursor)[1].tolist(), [180.0])
+        self.assertEqual(live.max_heart_rate, 180.0)
+
+    def test_constant_memory(self):
+        """An hour of samples takes no more memory than a minute of them."""
+        live = LiveWorkout(capacity=60)
+        live.push(heart_rate_samples(0, np.full(60, 90.0)))
+        nbytes = live.nbytes
+        for minute in range(1, 60):
+            live.push(heart_rate_samples(minute * 60, np.full(60, 90.0 + minute)))
+        self.assertEqual(live.nbytes, nbytes)
+        self.assertEqual(live.stats('heart_rate')['count'], 3600)
+        self.assertEqual(live.max_heart_rate, 149.0)
+
+
+class TestReplay(unittest.TestCase):
+    """Tests replaying a recorded workout into a live one."""
+
+    def test_pushes_samples_as_they_come_due(self):
+        """Samples are pushed once their recorded time has passed, in order."""
+        now = [0.0]
+        samples = SensorSeries(
+            [100, 160, 130, 220], [90.0, 110.0, 100.0, 120.0], [sensor_code('heart_rate')] * 4)
+        live = LiveWorkout()
+        replay = Replay(samples, live, speed=60, clock=lambda: now[0])
+
+        self.assertEqual(replay.push_due(), 1)
+        now[0] = 1.0
+        self.assertEqual(replay.push_due(), 2)
+        self.assertEqual(replay.push_due(), 0)
+        now[0] = 10.0
+        self.assertEqual(replay.push_due(), 1)
+        self.assertTrue(replay.done)
+        self.assertEqual(live.since('heart_rate')[0].tolist(), [100, 130, 160, 220])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,254 @@
+#############################################################################
+# metrics.py
+#
+# This file contains the app's instrumentation: latency histograms, call
+# counts and payload sizes for the data_fetcher and display functions.
+#
+# Instrumentation is off unless the SDS_METRICS environment variable is set
+# to 1 when the app starts. While it is off, @instrumented returns functions
+# unchanged and timer() returns a shared do-nothing context manager, so it
+# costs nothing on the hot path.
+#
+# Recorded metrics can be read as Prometheus text (render_prometheus, also
+# served over HTTP on SDS_METRICS_PORT if that is set) or as a summary table
+# for the app's debug panel (Registry.snapshot).
+#############################################################################
+
+import bisect
+import contextlib
+import functools
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get('SDS_METRICS') == '1'
+
+# Port for the Prometheus text endpoint, or None for no endpoint.
+METRICS_PORT = int(os.environ['SDS_METRICS_PORT']) if os.environ.get('SDS_METRICS_PORT') else None
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+_NOT_SIZED = object()
+_disabled_timer = contextlib.nullcontext()
+
+
+class _Series:
+    # Everything recorded for one (kind, name): a latency histogram, an
+    # error count and the total and largest payload, in items.
+    __slots__ = ('bucket_counts', 'count', 'total_seconds', 'errors',
+                 'payload_count', 'payload_total', 'payload_max')
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.errors = 0
+        self.payload_count = 0
+        self.payload_total = 0
+        self.payload_max = 0
+
+    def quantile(self, q):
+        # Estimated like Prometheus' histogram_quantile: find the bucket the
+        # q-th observation falls in and interpolate linearly inside it.
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index]
+                if math.isinf(upper):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return None
+
+
+class Registry:
+    """Collects measurements, keyed by a kind ('fetch', 'display', ...) and
+    a name (usually the function's name)."""
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, name, seconds, error=False, payload=None):
+        """Records one call that took `seconds`."""
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get((kind, name))
+            if series is None:
+                series = self._series[(kind, name)] = _Series()
+            series.bucket_counts[bucket] += 1
+            series.count += 1
+            series.total_seconds += seconds
+            series.errors += error
+            if payload is not None:
+                series.payload_count += 1
+                series.payload_total += payload
+                series.payload_max = max(series.payload_max, payload)
+
+    def wrap(self, function, kind, name=None):
+        """Returns function wrapped to record every call in this registry.
+
+        Fetchers ('fetch') are measured by the size of what they return;
+        other kinds by the size of their first argument, e.g. the list a
+        display function is given.
+        """
+        name = name or function.__name__
+        clock = self._clock
+        sized_result = kind == 'fetch'
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                self.observe(kind, name, clock() - started, error=True)
+                raise
+            payload = payload_size(result if sized_result else (args[0] if args else None))
+            self.observe(kind, name, clock() - started, payload=payload)
+            return result
+
+        return wrapper
+
+    @contextlib.contextmanager
+    def timer(self, name, kind='block'):
+        """Records how long the body of a with block takes."""
+        started = self._clock()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(kind, name, self._clock() - started, error=error)
+
+    def snapshot(self):
+        """Returns a summary row (a dict) for every series, slowest total
+        time first, e.g. for a debug panel."""
+        with self._lock:
+            rows = [
+                {
+                    'kind': kind,
+                    'name': name,
+                    'calls': series.count,
+                    'errors': series.errors,
+                    'total_ms': series.total_seconds * 1e3,
+                    'mean_ms': series.total_seconds / series.count * 1e3,
+                    'p50_ms': series.quantile(0.5) * 1e3,
+                    'p95_ms': series.quantile(0.95) * 1e3,
+                    'mean_payload': (series.payload_total / series.payload_count
+                                     if series.payload_count else None),
+                    'max_payload': series.payload_max if series.payload_count else None,
+                }
+                for (kind, name), series in self._series.items()
+            ]
+        return sorted(rows, key=lambda row: -row['total_ms'])
+
+    def render_prometheus(self):
+        """Returns every series in the Prometheus text exposition format."""
+        lines = [
+            '# HELP sds_call_duration_seconds Time spent in instrumented calls.',
+            '# TYPE sds_call_duration_seconds histogram',
+        ]
+        with self._lock:
+            series_items = sorted(self._series.items())
+            for (kind, name), series in series_items:
+                labels = f'kind="{_escape(kind)}",name="{_escape(name)}"'
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, series.bucket_counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if math.isinf(bound) else repr(bound)
+                    lines.append(f'sds_call_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'sds_call_duration_seconds_sum{{{labels}}} {series.total_seconds!r}')
+                lines.append(f'sds_call_duration_seconds_count{{{labels}}} {series.count}')
+            for metric, help_text, field in [
+                ('sds_call_errors_total', 'Instrumented calls that raised.', 'errors'),
+                ('sds_payload_items_total', 'Items returned by fetchers or passed to displays.',
+                 'payload_total'),
+                ('sds_payload_items_max', 'Largest payload seen, in items.', 'payload_max'),
+            ]:
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} {"counter" if metric.endswith("_total") else "gauge"}')
+                for (kind, name), series in series_items:
+                    labels = f'kind="{_escape(kind)}",name="{_escape(name)}"'
+                    lines.append(f'{metric}{{{labels}}} {getattr(series, field)}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """Forgets everything recorded so far."""
+        with self._lock:
+            self._series.clear()
+
+
+# The registry @instrumented and timer() record into.
+registry = Registry()
+
+
+def instrumented(kind, name=None):
+    """Decorator that records a function's calls in `registry`.
+
+    Returns the function itself, untouched, when instrumentation is off.
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+        return registry.wrap(function, kind, name)
+    return decorator
+
+
+def timer(name, kind='block'):
+    """Times a with block in `registry`; does nothing when off."""
+    if not ENABLED:
+        return _disabled_timer
+    return registry.timer(name, kind)
+
+
+def render_prometheus():
+    """Returns `registry` in the Prometheus text format."""
+    return registry.render_prometheus()
+
+
+def payload_size(value):
+    """Returns how many items a value holds, or None if it isn't sized."""
+    size = getattr(type(value), '__len__', _NOT_SIZED)
+    if size is _NOT_SIZED or isinstance(value, str):
+        return None
+    return len(value)
+
+
+def start_http_server(port, host=''):
+    """Serves render_prometheus() at http://host:port/metrics on a
+    background thread. Returns the server (call shutdown() to stop it)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def _escape(value):
+    # Label values escape backslashes, quotes and newlines.
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
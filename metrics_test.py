@@ -0,0 +1,127 @@
+#############################################################################
+# metrics_test.py
+#
+# This file contains tests for metrics.py.
+#############################################################################
+import itertools
+import unittest
+import urllib.request
+from unittest import mock
+
+import metrics
+
+
+class FakeClock:
+    """A clock that advances by `step` seconds every time it is read."""
+
+    def __init__(self, step):
+        self.ticks = itertools.count()
+        self.step = step
+
+    def __call__(self):
+        return next(self.ticks) * self.step
+
+
+class TestRegistry(unittest.TestCase):
+    """Tests recording calls and blocks in a Registry."""
+
+    def setUp(self):
+        self.registry = metrics.Registry(clock=FakeClock(0.003))
+
+    def test_wrapped_calls(self):
+        """Calls are counted, timed and sized by what fetchers return."""
+        fetch = self.registry.wrap(lambda n: list(range(n)), 'fetch', 'numbers')
+        self.assertEqual(fetch(3), [0, 1, 2])
+        fetch(5)
+        [row] = self.registry.snapshot()
+        self.assertEqual((row['kind'], row['name'], row['calls'], row['errors']),
+                         ('fetch', 'numbers', 2, 0))
+        self.assertAlmostEqual(row['total_ms'], 6.0)
+        self.assertEqual((row['mean_payload'], row['max_payload']), (4, 5))
+        # Both calls took 3 ms, which is in the 2.5-5 ms bucket.
+        self.assertTrue(2.5 <= row['p50_ms'] <= row['p95_ms'] <= 5)
+
+    def test_displays_are_sized_by_their_argument(self):
+        """Display functions report the size of what they were given."""
+        display = self.registry.wrap(lambda items, title='': None, 'display', 'show')
+        display([1, 2, 3, 4], title='x')
+        self.assertEqual(self.registry.snapshot()[0]['max_payload'], 4)
+
+    def test_errors_are_counted_and_raised(self):
+        """Exceptions propagate and count as errors."""
+        def broken():
+            raise ValueError('nope')
+        with self.assertRaises(ValueError):
+            self.registry.wrap(broken, 'fetch')()
+        with self.assertRaises(KeyError):
+            with self.registry.timer('block'):
+                raise KeyError('x')
+        self.assertEqual([row['errors'] for row in self.registry.snapshot()], [1, 1])
+
+    def test_prometheus_text(self):
+        """Histograms are cumulative and labelled by kind and name."""
+        self.registry.observe('fetch', 'get "x"', 0.0002, payload=2)
+        self.registry.observe('fetch', 'get "x"', 0.02, payload=7)
+        text = self.registry.render_prometheus()
+        labels = 'kind="fetch",name="get \\"x\\""'
+        self.assertIn('# TYPE sds_call_duration_seconds histogram', text)
+        self.assertIn(f'sds_call_duration_seconds_bucket{{{labels},le="0.0005"}} 1', text)
+        self.assertIn(f'sds_call_duration_seconds_bucket{{{labels},le="0.025"}} 2', text)
+        self.assertIn(f'sds_call_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'sds_call_duration_seconds_count{{{labels}}} 2', text)
+        self.assertIn(f'sds_payload_items_total{{{labels}}} 9', text)
+        self.assertIn(f'sds_payload_items_max{{{labels}}} 7', text)
+
+    def test_payload_size(self):
+        """Sized values report their length; strings and scalars don't."""
+        self.assertEqual(metrics.payload_size({'a': 1, 'b': 2}), 2)
+        self.assertIsNone(metrics.payload_size('text'))
+        self.assertIsNone(metrics.payload_size(None))
+
+
+class TestSwitch(unittest.TestCase):
+    """Tests turning instrumentation on and off."""
+
+    def setUp(self):
+        metrics.registry.clear()
+
+    def tearDown(self):
+        metrics.registry.clear()
+
+    def test_disabled_returns_function_unchanged(self):
+        """With instrumentation off, nothing wraps the function."""
+        def fetch():
+            return []
+        with mock.patch.object(metrics, 'ENABLED', False):
+            self.assertIs(metrics.instrumented('fetch')(fetch), fetch)
+            with metrics.timer('block'):
+                pass
+        self.assertEqual(metrics.registry.snapshot(), [])
+
+    def test_enabled_records_in_registry(self):
+        """With instrumentation on, calls land in the shared registry."""
+        with mock.patch.object(metrics, 'ENABLED', True):
+            fetch = metrics.instrumented('fetch')(lambda: [1])
+            fetch()
+            with metrics.timer('block'):
+                pass
+        self.assertEqual(
+            {(row['kind'], row['name']) for row in metrics.registry.snapshot()},
+            {('fetch', '<lambda>'), ('block', 'block')})
+
+    def test_http_endpoint(self):
+        """The endpoint serves the registry as Prometheus text."""
+        metrics.registry.observe('fetch', 'served', 0.001)
+        server = metrics.start_http_server(0, host='127.0.0.1')
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url, timeout=5) as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('name="served"', body)
+
+
+if __name__ == "__main__":
+    unittest.main()
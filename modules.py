@@ -7,13 +7,56 @@
 # function other than the example.
 #############################################################################
 
-from datetime import datetime
+import functools
+from images import get_image_cache
 from internals import create_component
-import pandas as pd
+from metrics import instrumented
+from records import Workout, parse_timestamp
 import streamlit as st
 
+# Session state key holding how many recent workouts are currently shown;
+# the user's id is appended so each user keeps a count of their own.
+RECENT_WORKOUTS_SHOWN_KEY = "recent_workouts_shown"
+
+# How each leaderboard metric's values are shown.
+LEADERBOARD_FORMATS = {
+    "steps": "{:,} steps",
+    "distance": "{:,.1f} mi",
+    "calories_burned": "{:,} cal",
+}
+
+# How wide (in pixels) profile, post and advice images are shown. Images
+# are served as thumbnails of about this size (see images.py).
+PROFILE_IMAGE_WIDTH = 50
+POST_IMAGE_WIDTH = 720
+ADVICE_IMAGE_WIDTH = 720
+
+# How often (in seconds) the live workout view shows newly pushed samples.
+LIVE_REFRESH_SECONDS = 1.0
+
+# How many of each sensor's latest samples the live workout charts show.
+LIVE_CHART_POINTS = 600
+
+
+def display_section(display_function, *args, **kwargs):
+    """Displays a display_* function's output as an isolated section.
+
+    The section is a Streamlit fragment: using a widget inside it (like
+    "Load more" in display_recent_workouts) reruns only this section, with
+    the arguments it was last given, instead of the whole page.
+    """
+    _fragment(display_function)(*args, **kwargs)
+
+
+@functools.cache
+def _fragment(display_function):
+    # One fragment per display function. Streamlit tells fragments apart by
+    # function and position on the page, so a function can be shown twice.
+    return st.fragment(display_function)
+
 
 # This one has been written for you as an example. You may change it as wanted.
+@instrumented("display")
 def display_my_custom_component(value):
     """Displays a 'my custom component' which showcases an example of how custom
     components work.
@@ -32,6 +75,7 @@ def display_my_custom_component(value):
     create_component(data, html_file_name)
 
 
+@instrumented("display")
 def display_post(username, user_image, timestamp, content, post_image):
     """
     Displays a post with a large content font and a profile header where 
@@ -44,7 +88,8 @@ def display_post(username, user_image, timestamp, content, post_image):
         with col1:
             if user_image:
                 # Set width to 40-50 to keep it from overpowering the text
-                st.image(user_image, width=50) 
+                st.image(get_image_cache().image_for(user_image, PROFILE_IMAGE_WIDTH),
+                         width=PROFILE_IMAGE_WIDTH)
         with col2:
             # Using st.markdown for the username to keep it smaller/balanced
             st.markdown(f"#### {username}")
@@ -55,7 +100,8 @@ def display_post(username, user_image, timestamp, content, post_image):
 
         # 3. Post Image
         if post_image:
-            st.image(post_image, use_container_width=True)
+            st.image(get_image_cache().image_for(post_image, POST_IMAGE_WIDTH),
+                     use_container_width=True)
 
         # 4. Timestamp
         st.markdown(
@@ -64,12 +110,18 @@ def display_post(username, user_image, timestamp, content, post_image):
         )
 
 
-def display_activity_summary(workouts_list):
+@instrumented("display")
+def display_activity_summary(workouts_list, totals=None, route=None):
     """Displays an 'activity summary' that showcases data about the user's
     latest workout.
 
     Args:
         workouts_list: the list of the user's workouts 
+        totals: optional totals for the latest week, as returned by
+            data_fetcher.get_user_activity_totals
+        route: optional map data of the latest workout's route, as
+            returned by data_fetcher.get_workout_route_map. Without it, the
+            map only shows the start and end points.
     """
     st.header("Activity Summary")
 
@@ -77,45 +129,75 @@ def display_activity_summary(workouts_list):
         st.text("No workout history found.")
         return
 
-    latest_workout = workouts_list[-1]
-    DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+    # Imported here so loading the app doesn't wait for pandas (see startup.py).
+    import pandas as pd
 
-    start = datetime.strptime(latest_workout['start_timestamp'], DATE_FORMAT)
-    end = datetime.strptime(latest_workout['end_timestamp'], DATE_FORMAT)
+    # Workouts from data_fetcher are already Workout records, with their
+    # timestamps parsed and duration computed; plain dicts are converted.
+    latest_workout = Workout.from_dict(workouts_list[-1])
 
-    st.caption(start.strftime('%B %d, %Y'))
-
-    latest_workout_duration_mins = int((end - start).total_seconds() / 60)
+    if latest_workout.start is not None:
+        st.caption(latest_workout.start.strftime('%B %d, %Y'))
+    else:
+        st.caption(latest_workout.start_timestamp)
 
     # Metrics
+    duration = latest_workout.duration_minutes
     cols = st.columns(4)
     metrics = [
-        ("Duration", f"{latest_workout_duration_mins} mins"),
-        ("Total Steps", latest_workout.get('steps', 0)),
-        ("Distance", f"{latest_workout.get('distance', 0)} mi"),
-        ("Calories Burned", f"{latest_workout.get('calories_burned', 0)} cal")
+        # Workouts with unparseable timestamps have no known duration.
+        ("Duration", "—" if duration is None else f"{duration} mins"),
+        ("Total Steps", latest_workout.steps),
+        ("Distance", f"{latest_workout.distance} mi"),
+        ("Calories Burned", f"{latest_workout.calories_burned} cal")
     ]
 
     for col, (label, value) in zip(cols, metrics):
         col.metric(label, value, border=True)
 
-    # Coordinate Map
-    start_coords = latest_workout['start_lat_lng']
-    end_coords = latest_workout['end_lat_lng']
-
-    map_data = pd.DataFrame([
-        {"lat": start_coords[0], "lon": start_coords[1], "name": "Start"},
-        {"lat": end_coords[0], "lon": end_coords[1], "name": "End"}
-    ])
-    st.map(map_data)
-
-
-def display_recent_workouts(workouts_list):
+    # Totals for the week
+    if totals:
+        week_start = parse_timestamp(totals['period_start'])
+        st.caption(f"Week of {week_start.strftime('%B %d, %Y')}")
+        cols = st.columns(4)
+        metrics = [
+            ("Workouts", totals['workouts']),
+            ("Total Steps", totals['steps']),
+            ("Distance", f"{totals['distance']:.1f} mi"),
+            ("Calories Burned", f"{totals['calories_burned']} cal")
+        ]
+        for col, (label, value) in zip(cols, metrics):
+            col.metric(label, value, border=True)
+
+    # Coordinate Map. Stored routes are already simplified to a few hundred
+    # points, so they can be drawn as they are.
+    if route is not None and len(route):
+        map_data = route
+    else:
+        # Workouts recorded without coordinates have no points to show.
+        points = [("Start", latest_workout.start_lat_lng), ("End", latest_workout.end_lat_lng)]
+        map_data = pd.DataFrame([
+            {"lat": coords[0], "lon": coords[1], "name": name}
+            for name, coords in points if coords
+        ])
+    if len(map_data):
+        st.map(map_data)
+
+
+@instrumented("display")
+def display_recent_workouts(workouts_list, page_size=None, lazy=False, user_id=None):
     """
     Displays a list of recent workouts in a structured Streamlit layout.
 
     Args:
-        workouts_list (list[dict] or None): List of workout data dictionaries.
+        workouts_list (list[Workout] or None): List of workout records, or
+            dictionaries with the same keys.
+        page_size (int or None): If given, only this many workouts are shown
+            at first, with a "Load more" button that shows the next page.
+        lazy (bool): If True, a workout's details are only rendered while
+            its expander is open, so collapsed workouts cost almost nothing.
+        user_id (str or None): Whose workouts these are, so that switching
+            users doesn't carry over how many were loaded.
 
     Returns:
         None
@@ -126,56 +208,115 @@ def display_recent_workouts(workouts_list):
     if not workouts_list:
         st.info("No recent workouts yet.")
         return
-    
-    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-    for i, w in enumerate(reversed(workouts_list)):
+    shown_key = f"{RECENT_WORKOUTS_SHOWN_KEY}_{user_id}"
+    shown = len(workouts_list)
+    if page_size is not None:
+        shown = min(shown, st.session_state.get(shown_key, page_size))
+
+    for i, w in enumerate(reversed(workouts_list[-shown:])):
         workout_number = i
 
-        start_raw = w.get("start_timestamp", "")
-        end_raw = w.get("end_timestamp", "")
+        if lazy:
+            expander = st.expander(
+                f"Workout {workout_number}", expanded=(workout_number == 0),
+                key=f"recent_workout_{workout_number}_{w.get('workout_id', '')}",
+                on_change="rerun")
+        else:
+            expander = st.expander(f"Workout {workout_number}", expanded=(workout_number == 0))
+
+        with expander:
+            if lazy and not expander.open:
+                continue
+            _display_workout_details(workout_number, w)
+
+    if shown < len(workouts_list):
+        st.button(
+            f"Load more ({len(workouts_list) - shown} older)",
+            on_click=_show_more_workouts, args=(shown_key, shown, page_size))
+
+
+def _show_more_workouts(shown_key, shown, page_size):
+    # "Load more" callback: show one more page on the next rerun.
+    st.session_state[shown_key] = shown + page_size
+
 
-        try:
-            start_dt = datetime.strptime(start_raw, DATE_FORMAT)
-            end_dt = datetime.strptime(end_raw, DATE_FORMAT)
+@functools.lru_cache(maxsize=4096)
+def _workout_time_fields(start, end):
+    # Timestamps never change for a workout, so each pair is only formatted
+    # once per process instead of on every rerun.
+    date_str = start.strftime("%b %d, %Y")
+    time_str = f"{start.strftime('%I:%M %p')} – {end.strftime('%I:%M %p')}"
+    return date_str, time_str
 
-            date_str = start_dt.strftime("%b %d, %Y")          
-            time_str = f"{start_dt.strftime('%I:%M %p')} – {end_dt.strftime('%I:%M %p')}"  
-            duration_mins = int((end_dt - start_dt).total_seconds() / 60)
-        except Exception:
-            date_str = start_raw
-            time_str = end_raw
-            duration_mins = None
 
-        with st.expander(f"Workout {workout_number}", expanded=(workout_number == 0)):
-            st.markdown(f"### Workout {workout_number}")
+def _display_workout_details(workout_number, w):
+    # The body of one workout's expander in display_recent_workouts.
+    w = Workout.from_dict(w)
+    if w.start is not None and w.end is not None:
+        date_str, time_str = _workout_time_fields(w.start, w.end)
+        duration_mins = w.duration_minutes
+    else:
+        date_str, time_str, duration_mins = w.start_timestamp, w.end_timestamp, None
 
-            st.caption(date_str)
-            if duration_mins is not None:
-                st.caption(f"{time_str} • {duration_mins} min")
-            else:
-                st.caption(f"{time_str}")
+    st.markdown(f"### Workout {workout_number}")
 
-            c1, c2, c3 = st.columns(3)
-            c1.metric("Distance", f"{w.get('distance', 0)} mi")
-            c2.metric("Steps", w.get("steps", 0))
-            c3.metric("Calories", f"{w.get('calories_burned', 0)} cal")
+    st.caption(date_str)
+    if duration_mins is not None:
+        st.caption(f"{time_str} • {duration_mins} min")
+    else:
+        st.caption(f"{time_str}")
 
-            start_coords = w.get("start_lat_lng")
-            end_coords = w.get("end_lat_lng")
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Distance", f"{w.distance} mi")
+    c2.metric("Steps", w.steps)
+    c3.metric("Calories", f"{w.calories_burned} cal")
 
-            if start_coords:
-                st.write(f"**Start:** {start_coords[0]:.5f}, {start_coords[1]:.5f}")
-            if end_coords:
-                st.write(f"**End:** {end_coords[0]:.5f}, {end_coords[1]:.5f}")
+    start_coords = w.start_lat_lng
+    end_coords = w.end_lat_lng
 
+    if start_coords:
+        st.write(f"**Start:** {start_coords[0]:.5f}, {start_coords[1]:.5f}")
+    if end_coords:
+        st.write(f"**End:** {end_coords[0]:.5f}, {end_coords[1]:.5f}")
 
+
+@instrumented("display")
+def display_leaderboard(entries, metric="steps", highlight_user_id=None):
+    """
+    Displays a leaderboard of the user and their friends.
+
+    Args:
+        entries (list[dict]): Rows with 'rank', 'user_id', 'name' and
+            'value', best first, as returned by
+            leaderboards.get_friends_leaderboard.
+        metric (str): What the rows are ranked by: "steps", "distance" or
+            "calories_burned".
+        highlight_user_id (str or None): The current user, whose row is
+            shown in bold.
+    """
+    st.subheader("Friends Leaderboard")
+
+    if not entries:
+        st.info("No activity from you or your friends yet.")
+        return
+
+    value_format = LEADERBOARD_FORMATS[metric]
+    for entry in entries:
+        line = f"{entry['rank']}. {entry['name']} — {value_format.format(entry['value'])}"
+        if entry["user_id"] == highlight_user_id:
+            line = f"**{line}**"
+        st.markdown(line)
+
+
+@instrumented("display")
 def display_genai_advice(timestamp, content, image):
     """
     Renders a formatted AI advice card.
 
     Args:
-        timestamp (str): A date string in the format "YYYY-MM-DD HH:MM:SS".
+        timestamp (str or datetime): A date string in the format
+            "YYYY-MM-DD HH:MM:SS", or an Advice record's created_at.
         content (str): The primary advice or insight text to be displayed. 
             If empty, the function returns early without rendering.
         image (str): A URL to display alongside the advice. Can be None.
@@ -186,13 +327,83 @@ def display_genai_advice(timestamp, content, image):
         st.info("No insights to display right now. Check in again later.")
         return
 
-    date = (
-        datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
-        .strftime("%b %d, %Y")
-        )
-
-    st.caption(date)
+    created_at = parse_timestamp(timestamp)
+    st.caption(created_at.strftime("%b %d, %Y") if created_at else timestamp)
     st.info(content, icon='🤖')
 
     if image:
-        st.image(image)
+        st.image(get_image_cache().image_for(image, ADVICE_IMAGE_WIDTH))
+
+
+def display_live_workout(live, charts=None):
+    """
+    Displays a workout in progress: heart rate figures and a chart per sensor.
+
+    This draws the workout as it is now; call it again (e.g. from a fragment
+    with run_every) to show newer samples. Each chart only shows its sensor's
+    latest LIVE_CHART_POINTS samples, so an update costs the same an hour
+    into a session as it does at the start. The figures cover the whole
+    session (see live.py).
+
+    Args:
+        live (live.LiveWorkout): The workout, which samples are pushed into.
+        charts (dict or None): Kept between calls (e.g. in session state),
+            so a chart's data is only rebuilt when its sensor has new samples.
+
+    Returns:
+        None
+    """
+    st.header("Live Workout")
+    _display_live_figures(live)
+    if charts is None:
+        charts = {}
+    for sensor_type in live.sensor_types:
+        st.line_chart(_live_chart_data(charts, live, sensor_type), height=200)
+
+
+def _display_live_figures(live):
+    heart_rate = live.stats("heart_rate")
+    if not heart_rate["count"]:
+        st.caption("Waiting for heart rate samples...")
+        return
+    cols = st.columns(4)
+    average = f"{heart_rate['mean']:.0f} bpm"
+    if heart_rate["std"] is not None:
+        average += f" ± {heart_rate['std']:.0f}"
+    figures = [
+        ("Heart Rate", f"{heart_rate['latest']:.0f} bpm"),
+        ("Average", average),
+        ("Max Heart Rate", f"{live.max_heart_rate:.0f} bpm"),
+        ("Samples", heart_rate["count"]),
+    ]
+    for col, (label, value) in zip(cols, figures):
+        col.metric(label, value, border=True)
+
+
+def _live_chart_data(charts, live, sensor_type):
+    # charts maps a sensor type to (how many of its samples had been pushed,
+    # the chart data built then), which is reused until more are pushed.
+    import pandas as pd
+    total = live.total(sensor_type)
+    cached = charts.get(sensor_type)
+    if cached is not None and cached[0] == total:
+        return cached[1]
+    timestamps, values, total = live.since(sensor_type, total - LIVE_CHART_POINTS)
+    frame = pd.DataFrame({sensor_type: values}, index=pd.to_datetime(timestamps, unit="s"))
+    charts[sensor_type] = (total, frame)
+    return frame
+
+
+def display_metrics_panel(rows):
+    """
+    Displays a debug panel of how long fetchers and displays take.
+
+    Args:
+        rows (list[dict]): Summary rows as returned by
+            metrics.registry.snapshot(), slowest total time first.
+    """
+    with st.expander("Performance"):
+        if not rows:
+            st.caption("Nothing has been measured yet.")
+            return
+        st.dataframe(rows, hide_index=True)
@@ -6,12 +6,22 @@
 # You will write these tests in Unit 2.
 #############################################################################
 
+import tempfile
+import time
 import unittest
+from unittest import mock
+import numpy as np
+import streamlit as st
+from streamlit.dataframe_util import convert_arrow_bytes_to_pandas_df
 from streamlit.testing.v1 import AppTest
+import modules
+from images import ImageCache
+from images_test import ImageServer
 from modules import display_post, display_activity_summary, display_genai_advice, display_recent_workouts
 
 # Write your tests below
 
+
 class TestDisplayPost(unittest.TestCase):
     """Tests the display_post function."""
 
@@ -62,6 +72,26 @@ class TestDisplayPost(unittest.TestCase):
         # Verify no crashes occurred
         self.assertFalse(at.exception)
 
+    def test_slow_image_host(self):
+        """A post is shown right away even if its images' host is slow."""
+        def app(user_image, post_image):
+            from modules import display_post
+            display_post("User", user_image, "2024-01-01 00:00:00", "Workout content", post_image)
+
+        server = ImageServer()
+        server.release.clear()
+        self.addCleanup(server.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        urls = (server.url("/pfp.png"), server.url("/workout.png"))
+        with mock.patch("modules.get_image_cache", return_value=ImageCache(directory.name)):
+            started = time.perf_counter()
+            at = AppTest.from_function(app, args=urls).run()
+            elapsed = time.perf_counter() - started
+
+        self.assertFalse(at.exception)
+        self.assertLess(elapsed, 1.0)
+
     def test_display_post_missing_images(self):
         """Edge Case: Verifies fallback behavior when images are None."""
         def app():
@@ -131,6 +161,63 @@ class TestDisplayActivitySummary(unittest.TestCase):
         assert at.metric[3].label == "Calories Burned"
         assert at.metric[3].value == "350 cal"
 
+    def test_stored_duration_and_weekly_totals(self):
+        """Stored durations are used as-is and weekly totals are shown."""
+        workout = dict(self.mock_workouts[0], duration_seconds=600)
+        totals = {"period_start": "2026-02-16", "workouts": 3, "duration_seconds": 5400,
+                  "distance": 7.25, "steps": 12000, "calories_burned": 900}
+        script = f"""
+            from modules import display_activity_summary
+            display_activity_summary({[workout]}, {totals})
+        """
+        at = AppTest.from_string(script).run()
+
+        assert at.metric[0].value == "10 mins"
+        assert at.caption[1].value == "Week of February 16, 2026"
+        assert at.metric[4].label == "Workouts"
+        assert at.metric[4].value == "3"
+        assert at.metric[6].value == "7.2 mi"
+
+    def test_route_is_drawn_on_the_map(self):
+        """A stored route replaces the start/end points on the map."""
+        script = f"""
+            import numpy as np
+            import pandas as pd
+            from modules import display_activity_summary
+            route = pd.DataFrame({{"lat": np.linspace(34.0, 34.1, 300), "lon": np.full(300, -118.2)}})
+            display_activity_summary({self.mock_workouts}, route=route)
+        """
+        at = AppTest.from_string(script).run()
+
+        self.assertFalse(at.exception)
+        chart = at.get("deck_gl_json_chart")[0]
+        self.assertIn("34.1", chart.proto.json)
+
+    def test_workout_without_coordinates(self):
+        """Without coordinates or a route, no map is drawn."""
+        workout = dict(self.mock_workouts[0], start_lat_lng=None, end_lat_lng=None)
+        script = f"""
+            from modules import display_activity_summary
+            display_activity_summary({[workout]})
+        """
+        at = AppTest.from_string(script).run()
+
+        self.assertFalse(at.exception)
+        self.assertEqual(len(at.metric), 4)
+        self.assertFalse(at.get("deck_gl_json_chart"))
+
+    def test_workout_with_unknown_duration(self):
+        """A workout whose timestamps can't be parsed shows no duration."""
+        workout = dict(self.mock_workouts[0], start_timestamp="", end_timestamp="")
+        script = f"""
+            from modules import display_activity_summary
+            display_activity_summary({[workout]})
+        """
+        at = AppTest.from_string(script).run()
+
+        self.assertFalse(at.exception)
+        self.assertEqual(at.metric[0].value, "—")
+
 
 class TestDisplayGenAiAdvice(unittest.TestCase):
     """Tests the display_genai_advice function."""
@@ -248,6 +335,232 @@ class TestDisplayRecentWorkouts(unittest.TestCase):
 
         self.assertEqual(len(at.metric), 6)
 
+    def test_page_size_and_load_more(self):
+        """Only one page renders until "Load more" is clicked."""
+        def app():
+            from modules import display_recent_workouts
+
+            workouts = [
+                {
+                    "workout_id": f"w{i}",
+                    "start_timestamp": f"2026-02-{i + 1:02d} 10:00:00",
+                    "end_timestamp": f"2026-02-{i + 1:02d} 10:30:00",
+                    "distance": 1.0,
+                    "steps": 1000 + i,
+                    "calories_burned": 100,
+                }
+                for i in range(5)
+            ]
+            display_recent_workouts(workouts, page_size=2)
+
+        at = AppTest.from_function(app).run()
+
+        self.assertEqual(len(at.expander), 2)
+        # Newest workouts are shown first.
+        self.assertEqual(at.metric[1].value, "1004")
+        self.assertIn("3 older", at.button[0].label)
+
+        at.button[0].click().run()
+        self.assertEqual(len(at.expander), 4)
+
+        at.button[0].click().run()
+        self.assertEqual(len(at.expander), 5)
+        self.assertEqual(len(at.button), 0)
+
+    def test_loaded_count_is_per_user(self):
+        """Another user's page starts at one page, whatever was loaded before."""
+        def app():
+            import streamlit as st
+            from modules import display_recent_workouts
+
+            workouts = [
+                {"workout_id": f"w{i}", "start_timestamp": f"2026-02-{i + 1:02d} 10:00:00"}
+                for i in range(5)
+            ]
+            display_recent_workouts(workouts, page_size=2, user_id=st.session_state.get("user", "a"))
+
+        at = AppTest.from_function(app).run()
+        at.button[0].click().run()
+        self.assertEqual(len(at.expander), 4)
+
+        at.session_state["user"] = "b"
+        at.run()
+        self.assertEqual(len(at.expander), 2)
+
+    def test_lazy_renders_only_open_expanders(self):
+        """With lazy=True, collapsed workouts have no rendered body."""
+        def app():
+            from modules import display_recent_workouts
+
+            workouts = [
+                {"workout_id": f"w{i}", "start_timestamp": "2026-02-19 10:00:00",
+                 "end_timestamp": "2026-02-19 10:30:00", "steps": i}
+                for i in range(3)
+            ]
+            display_recent_workouts(workouts, lazy=True)
+
+        at = AppTest.from_function(app).run()
+
+        self.assertFalse(at.exception)
+        self.assertEqual(len(at.expander), 3)
+        self.assertEqual(len(at.metric), 3)
+
+
+    def test_stored_workout_without_coordinates(self):
+        """A workout stored without coordinates shows no start or end."""
+        def app():
+            from modules import display_recent_workouts
+            from storage import Storage
+
+            storage = Storage(":memory:")
+            storage.add_user("user", {"full_name": "User", "username": "user"})
+            storage.add_workouts("user", [{
+                "workout_id": "w1", "start_timestamp": "2026-02-19 10:00:00",
+                "end_timestamp": "2026-02-19 10:45:00", "steps": 5000}])
+            display_recent_workouts(storage.get_workouts("user"))
+
+        at = AppTest.from_function(app).run()
+
+        self.assertFalse(at.exception)
+        self.assertEqual(at.metric[1].value, "5000")
+        self.assertFalse([m for m in at.markdown if "**Start:**" in m.value])
+
+class TestDisplayLeaderboard(unittest.TestCase):
+    """Tests the display_leaderboard function."""
+
+    def test_rows_and_highlight(self):
+        """Each entry is a ranked row; the current user's row is bold."""
+        def app():
+            from modules import display_leaderboard
+            display_leaderboard([
+                {"rank": 1, "user_id": "a", "name": "Ann", "value": 12000},
+                {"rank": 2, "user_id": "me", "name": "Me", "value": 800},
+            ], "steps", highlight_user_id="me")
+
+        at = AppTest.from_function(app).run()
+
+        self.assertEqual(at.subheader[0].value, "Friends Leaderboard")
+        self.assertEqual(at.markdown[0].value, "1. Ann — 12,000 steps")
+        self.assertEqual(at.markdown[1].value, "**2. Me — 800 steps**")
+
+    def test_empty(self):
+        """With no entries, an info message is shown."""
+        def app():
+            from modules import display_leaderboard
+            display_leaderboard([], "distance")
+
+        at = AppTest.from_function(app).run()
+
+        self.assertEqual(at.info[0].value, "No activity from you or your friends yet.")
+
+
+class TestDisplaySection(unittest.TestCase):
+    """Tests the display_section function."""
+
+    def test_section_is_a_fragment(self):
+        """Sections render like the display function, inside a fragment."""
+        def app():
+            from modules import display_recent_workouts, display_section
+
+            workouts = [
+                {"workout_id": f"w{i}", "start_timestamp": f"2026-02-{i + 1:02d} 10:00:00",
+                 "end_timestamp": f"2026-02-{i + 1:02d} 10:30:00", "steps": i}
+                for i in range(3)
+            ]
+            display_section(display_recent_workouts, workouts, page_size=2)
+
+        with mock.patch("modules.st.fragment", wraps=st.fragment) as fragment:
+            modules._fragment.cache_clear()
+            at = AppTest.from_function(app).run()
+            self.assertEqual(len(at.expander), 2)
+            at.button[0].click().run()
+            self.assertEqual(len(at.expander), 3)
+        modules._fragment.cache_clear()
+
+        # One fragment per display function, however often it is shown.
+        fragment.assert_called_once_with(modules.display_recent_workouts)
+
+
+class TestDisplayLiveWorkout(unittest.TestCase):
+    """Tests the display_live_workout function."""
+
+    def test_updates(self):
+        """Figures cover every sample; charts show only the latest ones."""
+        def app():
+            from live import LiveWorkout
+            from live_test import heart_rate_samples
+            from modules import display_live_workout
+
+            live = LiveWorkout(capacity=8)
+            charts = {}
+            live.push(heart_rate_samples(0, [100, 120, 110]))
+            display_live_workout(live, charts)
+            live.push(heart_rate_samples(3, [130, 125, 150]))
+            display_live_workout(live, charts)
+
+        with mock.patch("modules.LIVE_CHART_POINTS", 4):
+            at = AppTest.from_function(app).run()
+
+        self.assertFalse(at.exception)
+        self.assertEqual([m.value for m in at.metric][-4:], ["150 bpm", "122 bpm ± 17", "150 bpm", "6"])
+        chart = at.get("vega_lite_chart")[-1]
+        data = convert_arrow_bytes_to_pandas_df(chart.proto.datasets[0].data.data)
+        self.assertEqual(data["heart_rate"].tolist(), [110.0, 130.0, 125.0, 150.0])
+
+    def test_reuses_unchanged_chart_data(self):
+        """A sensor's chart data is only rebuilt once it has new samples."""
+        from live import LiveWorkout
+        from live_test import heart_rate_samples
+        from modules import _live_chart_data
+
+        live = LiveWorkout()
+        charts = {}
+        live.push(heart_rate_samples(0, [100, 120]))
+        frame = _live_chart_data(charts, live, "heart_rate")
+        self.assertIs(_live_chart_data(charts, live, "heart_rate"), frame)
+        live.push(heart_rate_samples(2, [130]))
+        self.assertEqual(_live_chart_data(charts, live, "heart_rate")["heart_rate"].tolist(),
+                         [100.0, 120.0, 130.0])
+
+    def test_waiting(self):
+        """Before any heart rate samples arrive, a caption says so."""
+        def app():
+            from live import LiveWorkout
+            from modules import display_live_workout
+            display_live_workout(LiveWorkout())
+
+        at = AppTest.from_function(app).run()
+
+        self.assertEqual(at.caption[0].value, "Waiting for heart rate samples...")
+        self.assertFalse(at.get("vega_lite_chart"))
+
+
+class TestDisplayMetricsPanel(unittest.TestCase):
+    """Tests the display_metrics_panel function."""
+
+    def test_rows_in_a_table(self):
+        """Summary rows are shown as a table inside an expander."""
+        def app():
+            from modules import display_metrics_panel
+            display_metrics_panel([
+                {"kind": "fetch", "name": "get_user_workouts", "calls": 2, "p95_ms": 1.5},
+            ])
+
+        at = AppTest.from_function(app).run()
+
+        self.assertEqual(at.expander[0].label, "Performance")
+        self.assertEqual(at.dataframe[0].value["name"].tolist(), ["get_user_workouts"])
+
+    def test_empty(self):
+        """Before anything is measured, a caption says so."""
+        def app():
+            from modules import display_metrics_panel
+            display_metrics_panel([])
+
+        at = AppTest.from_function(app).run()
+
+        self.assertEqual(at.caption[0].value, "Nothing has been measured yet.")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,173 @@
+#############################################################################
+# records.py
+#
+# This file contains the typed records data_fetcher returns for workouts,
+# posts, advice and sensor samples.
+#
+# Each record parses its 'YYYY-MM-DD HH:MM:SS' timestamps once, when it is
+# created, and precomputes derived values such as a workout's duration, so
+# display code never has to reparse strings on a rerun. Records use
+# __slots__ to keep long histories small. Like everything data_fetcher
+# caches, they are shared between callers and must not be modified.
+#
+# Records can also be read like the dicts data_fetcher used to return
+# (record['steps'], record.get('distance', 0)), so older code keeps working.
+#############################################################################
+
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_timestamp(timestamp):
+    """Parses a 'YYYY-MM-DD HH:MM:SS' string, or returns None if it can't.
+
+    datetime.fromisoformat is implemented in C and is several times faster
+    than strptime for this format.
+    """
+    if isinstance(timestamp, datetime):
+        return timestamp
+    try:
+        return datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+
+
+class _DictAccess:
+    # Read-only dict-style access to a record's public fields.
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self._keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._keys()
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._keys() else default
+
+    def keys(self):
+        return self._keys()
+
+    def to_dict(self):
+        """Returns the record as the dict data_fetcher used to return."""
+        return {key: getattr(self, key) for key in self._keys()}
+
+    @classmethod
+    def _keys(cls):
+        # The dict keys are the fields that are passed in, not the derived
+        # ones computed in __post_init__.
+        keys = cls.__dict__.get('_key_cache')
+        if keys is None:
+            keys = tuple(f.name for f in fields(cls) if f.init)
+            setattr(cls, '_key_cache', keys)
+        return keys
+
+
+@dataclass(slots=True)
+class Workout(_DictAccess):
+    """A workout, with start/end parsed and its duration precomputed.
+
+    start and end are None when the timestamps can't be parsed, and
+    duration_seconds is then None unless it was given.
+    """
+    workout_id: str
+    start_timestamp: str
+    end_timestamp: str
+    start_lat_lng: tuple = None
+    end_lat_lng: tuple = None
+    distance: float = 0
+    steps: int = 0
+    calories_burned: int = 0
+    duration_seconds: int = None
+    start: datetime = field(init=False, repr=False, compare=False)
+    end: datetime = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        start = parse_timestamp(self.start_timestamp)
+        end = parse_timestamp(self.end_timestamp)
+        self.start = start
+        self.end = end
+        if self.duration_seconds is None and start is not None and end is not None:
+            self.duration_seconds = int((end - start).total_seconds())
+
+    @property
+    def duration_minutes(self):
+        """Whole minutes the workout lasted, or None if unknown."""
+        if self.duration_seconds is None:
+            return None
+        return int(self.duration_seconds / 60)
+
+    @classmethod
+    def from_dict(cls, workout):
+        """Builds a Workout from a workout dict (or returns a Workout as-is)."""
+        if isinstance(workout, cls):
+            return workout
+        return cls(
+            workout_id=workout.get('workout_id'),
+            start_timestamp=workout.get('start_timestamp', ''),
+            end_timestamp=workout.get('end_timestamp', ''),
+            start_lat_lng=workout.get('start_lat_lng'),
+            end_lat_lng=workout.get('end_lat_lng'),
+            distance=workout.get('distance', 0),
+            steps=workout.get('steps', 0),
+            calories_burned=workout.get('calories_burned', 0),
+            duration_seconds=workout.get('duration_seconds'),
+        )
+
+
+@dataclass(slots=True)
+class Post(_DictAccess):
+    """A post, with its timestamp parsed as posted_at."""
+    user_id: str
+    post_id: str
+    timestamp: str
+    content: str
+    image: str = None
+    posted_at: datetime = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.posted_at = parse_timestamp(self.timestamp)
+
+    @classmethod
+    def from_dict(cls, post):
+        """Builds a Post from a post dict (or returns a Post as-is)."""
+        if isinstance(post, cls):
+            return post
+        return cls(post['user_id'], post['post_id'], post['timestamp'],
+                   post['content'], post.get('image'))
+
+
+@dataclass(slots=True)
+class Advice(_DictAccess):
+    """A piece of GenAI advice, with its timestamp parsed as created_at."""
+    advice_id: str
+    timestamp: str
+    content: str
+    image: str = None
+    created_at: datetime = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.created_at = parse_timestamp(self.timestamp)
+
+    @classmethod
+    def from_dict(cls, advice):
+        """Builds an Advice from an advice dict (or returns an Advice as-is)."""
+        if isinstance(advice, cls):
+            return advice
+        return cls(advice['advice_id'], advice['timestamp'], advice['content'],
+                   advice.get('image'))
+
+
+@dataclass(slots=True)
+class SensorSample(_DictAccess):
+    """One sensor reading, as stored in a SensorSeries."""
+    sensor_type: str
+    timestamp: str
+    data: float
@@ -0,0 +1,100 @@
+#############################################################################
+# records_test.py
+#
+# This file contains tests for records.py.
+#############################################################################
+
+import unittest
+from datetime import datetime
+
+from records import Advice, Post, SensorSample, Workout, parse_timestamp
+from sensor_data import SensorSeries
+
+
+class TestParseTimestamp(unittest.TestCase):
+    """Tests the parse_timestamp function."""
+
+    def test_parses_storage_format(self):
+        """'YYYY-MM-DD HH:MM:SS' strings become datetimes."""
+        self.assertEqual(parse_timestamp('2024-01-02 03:04:05'), datetime(2024, 1, 2, 3, 4, 5))
+
+    def test_unparseable_is_none(self):
+        """Bad or missing timestamps give None instead of raising."""
+        self.assertIsNone(parse_timestamp('yesterday'))
+        self.assertIsNone(parse_timestamp(None))
+
+
+class TestWorkout(unittest.TestCase):
+    """Tests the Workout record."""
+
+    def setUp(self):
+        self.workout = {
+            'workout_id': 'w1',
+            'start_timestamp': '2024-01-01 10:00:00',
+            'end_timestamp': '2024-01-01 10:45:30',
+            'start_lat_lng': (1.0, 2.0),
+            'end_lat_lng': (3.0, 4.0),
+            'distance': 2.5,
+            'steps': 3000,
+            'calories_burned': 200,
+        }
+
+    def test_parses_once_and_computes_duration(self):
+        """start, end and the duration are computed when the record is made."""
+        workout = Workout.from_dict(self.workout)
+        self.assertEqual(workout.start, datetime(2024, 1, 1, 10))
+        self.assertEqual(workout.duration_seconds, 2730)
+        self.assertEqual(workout.duration_minutes, 45)
+
+    def test_stored_duration_is_kept(self):
+        """A duration given by storage is not recomputed."""
+        workout = Workout.from_dict({**self.workout, 'duration_seconds': 60})
+        self.assertEqual(workout.duration_minutes, 1)
+
+    def test_unparseable_timestamps(self):
+        """Bad timestamps leave start, end and duration empty."""
+        workout = Workout.from_dict({**self.workout, 'start_timestamp': 'soon'})
+        self.assertIsNone(workout.start)
+        self.assertIsNone(workout.duration_seconds)
+
+    def test_reads_like_a_dict(self):
+        """Records support the dict access older callers use."""
+        workout = Workout.from_dict(self.workout)
+        self.assertEqual(workout['steps'], 3000)
+        self.assertEqual(workout.get('missing', 'default'), 'default')
+        self.assertIn('distance', workout)
+        self.assertNotIn('start', workout)
+        self.assertEqual(workout.to_dict(), {**self.workout, 'duration_seconds': 2730})
+        with self.assertRaises(KeyError):
+            workout['start']
+
+    def test_slotted(self):
+        """Records have no per-instance __dict__ to grow."""
+        workout = Workout.from_dict(self.workout)
+        self.assertFalse(hasattr(workout, '__dict__'))
+        with self.assertRaises(AttributeError):
+            workout.notes = 'extra'
+
+
+class TestOtherRecords(unittest.TestCase):
+    """Tests the Post, Advice and SensorSample records."""
+
+    def test_post_and_advice_timestamps(self):
+        """Posts and advice parse their timestamps once."""
+        post = Post('u', 'p1', '2024-01-01 09:00:00', 'Hello')
+        advice = Advice.from_dict({'advice_id': 'a1', 'timestamp': '2024-01-02 09:00:00',
+                                   'content': 'Rest', 'image': None})
+        self.assertEqual(post.posted_at, datetime(2024, 1, 1, 9))
+        self.assertEqual(advice.created_at, datetime(2024, 1, 2, 9))
+        self.assertEqual(set(advice), {'advice_id', 'timestamp', 'content', 'image'})
+
+    def test_sensor_series_to_records(self):
+        """A SensorSeries converts to SensorSample records."""
+        samples = [{'sensor_type': 'heart_rate', 'timestamp': '2024-01-01 00:00:00', 'data': 120.0}]
+        records = SensorSeries.from_records(samples).to_records()
+        self.assertEqual(records, [SensorSample('heart_rate', '2024-01-01 00:00:00', 120.0)])
+        self.assertEqual(records[0].to_dict(), samples[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
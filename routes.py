@@ -0,0 +1,113 @@
+#############################################################################
+# routes.py
+#
+# This file contains the geometry used to show workout routes on a map.
+#
+# A GPS trace can have thousands of points, far more than a map can usefully
+# draw. Routes are simplified with the Douglas-Peucker algorithm, once per
+# zoom level, at a tolerance of about one screen pixel at that zoom, and then
+# capped at MAX_ROUTE_POINTS. Storage keeps the simplified versions next to
+# the full trace, so a map only ever reads a few hundred points.
+#
+# Points are (N, 2) float64 arrays of (latitude, longitude) in degrees.
+#############################################################################
+
+import numpy as np
+
+# Web map zoom levels that simplified routes are stored for: roughly a city,
+# a neighbourhood and a few streets across.
+ROUTE_ZOOM_LEVELS = (10, 13, 16)
+
+# The zoom level used for a single workout's map.
+DEFAULT_ROUTE_ZOOM = 16
+
+# A simplified route never has more points than this.
+MAX_ROUTE_POINTS = 500
+
+# Width of the world, in pixels, of a map tile pyramid at zoom 0.
+_TILE_SIZE = 256
+
+
+def as_points(points):
+    """Returns points as an (N, 2) float64 array of (lat, lng) pairs."""
+    points = np.asarray(points, dtype=np.float64)
+    if points.size == 0:
+        return np.empty((0, 2))
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError(f'Expected (lat, lng) pairs, got shape {points.shape}.')
+    return points
+
+
+def zoom_tolerance(zoom):
+    """Returns the width of one map pixel at a zoom level, in degrees."""
+    return 360.0 / (_TILE_SIZE * 2 ** zoom)
+
+
+def bounding_box(points):
+    """Returns (min_lat, min_lng, max_lat, max_lng), or None for no points."""
+    points = as_points(points)
+    if not len(points):
+        return None
+    low = points.min(axis=0)
+    high = points.max(axis=0)
+    return (float(low[0]), float(low[1]), float(high[0]), float(high[1]))
+
+
+def simplify(points, tolerance):
+    """Simplifies a route with the Douglas-Peucker algorithm.
+
+    Keeps the first and last points and every point needed so that the
+    simplified line stays within `tolerance` degrees of the original.
+    Longitudes are scaled by the cosine of the route's latitude, so the
+    tolerance means the same distance in every direction.
+    """
+    points = as_points(points)
+    if len(points) < 3:
+        return points.copy()
+    projected = points * (1.0, np.cos(np.radians(points[:, 0].mean())))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    # Rather than recursing one segment at a time, every segment between
+    # kept points is split in the same vectorized pass, one pass per level
+    # of the recursion. The result is the same.
+    positions = np.arange(len(points))
+    while True:
+        kept = np.flatnonzero(keep)
+        segment = np.minimum(np.searchsorted(kept, positions, side='right') - 1, len(kept) - 2)
+        distances = _segment_distances(
+            projected, projected[kept[segment]], projected[kept[segment + 1]])
+        distances[kept] = 0.0
+        farthest = np.maximum.reduceat(distances, kept[:-1])
+        candidates = np.flatnonzero(
+            (distances == farthest[segment]) & (distances > tolerance))
+        if not len(candidates):
+            return points[keep]
+        # The first farthest point of each segment, as np.argmax would pick.
+        _, first = np.unique(segment[candidates], return_index=True)
+        keep[candidates[first]] = True
+
+
+def downsample(points, max_points=MAX_ROUTE_POINTS):
+    """Returns at most max_points of a route, evenly spaced along it."""
+    points = as_points(points)
+    if len(points) <= max_points:
+        return points
+    indices = np.unique(np.linspace(0, len(points) - 1, max_points).round().astype(np.intp))
+    return points[indices]
+
+
+def simplify_for_zoom(points, zoom, max_points=MAX_ROUTE_POINTS):
+    """Returns the route as it should be drawn at a map zoom level."""
+    return downsample(simplify(points, zoom_tolerance(zoom)), max_points)
+
+
+def _segment_distances(points, start, end):
+    # Distance from each point to the line segment from the matching row of
+    # start to the matching row of end.
+    direction = end - start
+    length_squared = np.einsum('ij,ij->i', direction, direction)
+    offset = points - start
+    along = np.divide(np.einsum('ij,ij->i', offset, direction), length_squared,
+                      out=np.zeros(len(points)), where=length_squared > 0)
+    nearest = offset - np.clip(along, 0.0, 1.0)[:, None] * direction
+    return np.hypot(nearest[:, 0], nearest[:, 1])
@@ -0,0 +1,84 @@
+#############################################################################
+# routes_test.py
+#
+# This file contains tests for routes.py.
+#############################################################################
+
+import unittest
+
+import numpy as np
+
+from routes import (MAX_ROUTE_POINTS, as_points, bounding_box, downsample, simplify,
+                    simplify_for_zoom, zoom_tolerance)
+
+
+class TestSimplify(unittest.TestCase):
+    """Tests the Douglas-Peucker simplification."""
+
+    def test_straight_line_keeps_ends(self):
+        """Points on a straight line are all dropped except the ends."""
+        line = np.column_stack([np.linspace(0, 1, 50), np.linspace(0, 1, 50)])
+        np.testing.assert_array_equal(simplify(line, 1e-9), line[[0, -1]])
+
+    def test_keeps_corners(self):
+        """A corner farther than the tolerance is kept."""
+        route = [(0, 0), (0, 0.5), (0, 1), (0.5, 1), (1, 1)]
+        np.testing.assert_array_equal(simplify(route, 0.01), [(0, 0), (0, 1), (1, 1)])
+
+    def test_stays_within_tolerance(self):
+        """Every original point is within the tolerance of the simplified line."""
+        rng = np.random.default_rng(0)
+        trace = rng.normal(scale=1e-3, size=(2000, 2)).cumsum(axis=0)
+        simplified = simplify(trace, 1e-3)
+        self.assertLess(len(simplified), len(trace))
+        # Check against a brute-force distance to the simplified polyline
+        # (the trace is near the equator, so degrees are not rescaled much).
+        scale = (1.0, np.cos(np.radians(trace[:, 0].mean())))
+        starts, ends = simplified[:-1] * scale, simplified[1:] * scale
+        points = trace * scale
+        direction = ends - starts
+        along = np.clip(np.einsum('pij,ij->pi', points[:, None] - starts, direction)
+                        / np.einsum('ij,ij->i', direction, direction), 0, 1)
+        nearest = starts + along[..., None] * direction
+        distances = np.hypot(*(points[:, None] - nearest).transpose(2, 0, 1)).min(axis=1)
+        self.assertLessEqual(distances.max(), 1e-3 + 1e-12)
+
+    def test_short_routes(self):
+        """Routes with fewer than three points are returned unchanged."""
+        self.assertEqual(len(simplify([], 1)), 0)
+        np.testing.assert_array_equal(simplify([(1, 2), (3, 4)], 1), [(1, 2), (3, 4)])
+
+    def test_rejects_bad_shapes(self):
+        """Points must be (lat, lng) pairs."""
+        with self.assertRaises(ValueError):
+            as_points([1, 2, 3])
+
+
+class TestZoomLevels(unittest.TestCase):
+    """Tests downsampling for a map zoom level."""
+
+    def test_downsample_caps_points(self):
+        """Long routes are cut to max_points, keeping both ends."""
+        trace = np.column_stack([np.arange(10_000.0), np.zeros(10_000)])
+        sampled = downsample(trace, 100)
+        self.assertEqual(len(sampled), 100)
+        np.testing.assert_array_equal(sampled[[0, -1]], trace[[0, -1]])
+
+    def test_closer_zooms_keep_more_detail(self):
+        """Tolerances shrink as the zoom increases, and output is capped."""
+        rng = np.random.default_rng(1)
+        trace = rng.normal(scale=1e-4, size=(20_000, 2)).cumsum(axis=0)
+        self.assertLess(zoom_tolerance(16), zoom_tolerance(10))
+        coarse = simplify_for_zoom(trace, 10)
+        fine = simplify_for_zoom(trace, 16)
+        self.assertLess(len(coarse), len(fine))
+        self.assertLessEqual(len(fine), MAX_ROUTE_POINTS)
+
+    def test_bounding_box(self):
+        """The box spans the route's extreme latitudes and longitudes."""
+        self.assertEqual(bounding_box([(1, 5), (3, 2), (2, 4)]), (1.0, 2.0, 3.0, 5.0))
+        self.assertIsNone(bounding_box([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#############################################################################
+# sensor_data.py
+#
+# This file contains the columnar container used for a workout's sensor
+# samples. Samples are stored as parallel NumPy arrays instead of a list of
+# dicts, which keeps long workouts small in memory and lets aggregation code
+# work on whole columns at once.
+#############################################################################
+
+from collections.abc import Sequence
+
+import numpy as np
+
+from records import SensorSample
+
+# Sensor types known to the app. A sample's type is stored as its index in
+# this tuple, so the order must never change (only append new types).
+SENSOR_TYPES = (
+    'accelerometer',
+    'gyroscope',
+    'pressure',
+    'temperature',
+    'heart_rate',
+)
+
+_SENSOR_CODES = {name: code for code, name in enumerate(SENSOR_TYPES)}
+
+
+def sensor_code(sensor_type):
+    """Returns the integer code used to store the given sensor type."""
+    try:
+        return _SENSOR_CODES[sensor_type]
+    except KeyError:
+        raise ValueError(f'Unknown sensor type {sensor_type}.') from None
+
+
+def parse_timestamps(timestamps):
+    """Converts 'YYYY-MM-DD HH:MM:SS' strings to int64 epoch seconds."""
+    return np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+def format_timestamps(epoch_seconds):
+    """Converts int64 epoch seconds back to 'YYYY-MM-DD HH:MM:SS' strings."""
+    as_strings = np.datetime_as_string(
+        np.asarray(epoch_seconds, dtype=np.int64).astype('datetime64[s]'))
+    if as_strings.size == 0:
+        return as_strings
+    return np.char.replace(as_strings, 'T', ' ')
+
+
+class SensorSeries(Sequence):
+    """A workout's sensor samples stored column by column.
+
+    Attributes:
+        timestamps: int64 array of epoch seconds.
+        values: float64 array of sample readings.
+        type_codes: int8 array of indexes into SENSOR_TYPES.
+
+    The series is also a read-only sequence of the
+    {'sensor_type', 'timestamp', 'data'} dicts that get_user_sensor_data used
+    to return, so existing callers can keep iterating over it unchanged.
+    """
+
+    __slots__ = ('timestamps', 'values', 'type_codes')
+
+    def __init__(self, timestamps, values, type_codes):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.type_codes = np.asarray(type_codes, dtype=np.int8)
+        if not (len(self.timestamps) == len(self.values) == len(self.type_codes)):
+            raise ValueError('Sensor columns must all have the same length.')
+
+    @classmethod
+    def empty(cls):
+        """Returns a series with no samples."""
+        return cls(np.empty(0), np.empty(0), np.empty(0))
+
+    @classmethod
+    def from_records(cls, records):
+        """Builds a series from an iterable of sample dicts."""
+        records = list(records)
+        return cls(
+            parse_timestamps([r['timestamp'] for r in records]),
+            [r['data'] for r in records],
+            [sensor_code(r['sensor_type']) for r in records],
+        )
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SensorSeries(
+                self.timestamps[index], self.values[index], self.type_codes[index])
+        return {
+            'sensor_type': SENSOR_TYPES[self.type_codes[index]],
+            'timestamp': str(format_timestamps(self.timestamps[index])),
+            'data': float(self.values[index]),
+        }
+
+    def __iter__(self):
+        return iter(self.to_dicts())
+
+    def __repr__(self):
+        return f'SensorSeries({len(self)} samples)'
+
+    @property
+    def nbytes(self):
+        """Total memory used by the sample columns, in bytes."""
+        return self.timestamps.nbytes + self.values.nbytes + self.type_codes.nbytes
+
+    @property
+    def sensor_types(self):
+        """Names of the sensor types present in this series."""
+        return [SENSOR_TYPES[code] for code in np.unique(self.type_codes)]
+
+    def for_sensor(self, sensor_type):
+        """Returns only the samples of the given sensor type."""
+        mask = self.type_codes == sensor_code(sensor_type)
+        return SensorSeries(
+            self.timestamps[mask], self.values[mask], self.type_codes[mask])
+
+    def sorted(self):
+        """Returns the samples ordered by timestamp (stable for ties)."""
+        order = np.argsort(self.timestamps, kind='stable')
+        return SensorSeries(
+            self.timestamps[order], self.values[order], self.type_codes[order])
+
+    def to_dicts(self):
+        """Returns the samples as a list of dicts (the legacy format)."""
+        names = np.asarray(SENSOR_TYPES, dtype=object)[self.type_codes]
+        return [
+            {'sensor_type': sensor_type, 'timestamp': timestamp, 'data': data}
+            for sensor_type, timestamp, data in zip(
+                names.tolist(),
+                format_timestamps(self.timestamps).tolist(),
+                self.values.tolist(),
+            )
+        ]
+
+    def to_records(self):
+        """Returns the samples as a list of SensorSample records."""
+        names = np.asarray(SENSOR_TYPES, dtype=object)[self.type_codes]
+        return list(map(SensorSample, names.tolist(),
+                        format_timestamps(self.timestamps).tolist(),
+                        self.values.tolist()))
@@ -0,0 +1,81 @@
+#############################################################################
+# sensor_data_test.py
+#
+# This file contains tests for sensor_data.py.
+#############################################################################
+
+import unittest
+
+import numpy as np
+
+from sensor_data import SensorSeries, format_timestamps, parse_timestamps
+
+
+class TestSensorSeries(unittest.TestCase):
+    """Tests the SensorSeries container."""
+
+    def setUp(self):
+        self.records = [
+            {'sensor_type': 'heart_rate', 'timestamp': '2024-01-01 00:05:00', 'data': 120.5},
+            {'sensor_type': 'pressure', 'timestamp': '2024-01-01 00:01:00', 'data': 3.0},
+            {'sensor_type': 'heart_rate', 'timestamp': '2024-01-01 00:02:00', 'data': 98.0},
+        ]
+
+    def test_round_trips_records(self):
+        """Building from dicts and reading back gives the same dicts."""
+        series = SensorSeries.from_records(self.records)
+        self.assertEqual(len(series), 3)
+        self.assertEqual(series.to_dicts(), self.records)
+        self.assertEqual(list(series), self.records)
+        self.assertEqual(series[0], self.records[0])
+
+    def test_column_dtypes(self):
+        """Columns use compact fixed-width dtypes."""
+        series = SensorSeries.from_records(self.records)
+        self.assertEqual(series.timestamps.dtype, np.int64)
+        self.assertEqual(series.values.dtype, np.float64)
+        self.assertEqual(series.type_codes.dtype, np.int8)
+        self.assertEqual(series.nbytes, 3 * (8 + 8 + 1))
+
+    def test_for_sensor_and_sorted(self):
+        """Filtering by sensor type and sorting work on whole columns."""
+        series = SensorSeries.from_records(self.records).sorted()
+        self.assertEqual(
+            [r['timestamp'] for r in series],
+            ['2024-01-01 00:01:00', '2024-01-01 00:02:00', '2024-01-01 00:05:00'])
+        heart_rate = series.for_sensor('heart_rate')
+        self.assertEqual(heart_rate.values.tolist(), [98.0, 120.5])
+        self.assertEqual(series.sensor_types, ['pressure', 'heart_rate'])
+
+    def test_slicing_returns_series(self):
+        """Slicing keeps the columnar type."""
+        series = SensorSeries.from_records(self.records)
+        self.assertIsInstance(series[1:], SensorSeries)
+        self.assertEqual(len(series[1:]), 2)
+
+    def test_unknown_sensor_type(self):
+        """Unknown sensor types are rejected."""
+        with self.assertRaises(ValueError):
+            SensorSeries.from_records(
+                [{'sensor_type': 'barometer', 'timestamp': '2024-01-01 00:00:00', 'data': 1.0}])
+
+    def test_mismatched_columns(self):
+        """Columns of different lengths are rejected."""
+        with self.assertRaises(ValueError):
+            SensorSeries([1, 2], [1.0], [0, 0])
+
+    def test_empty(self):
+        """An empty series behaves like an empty list."""
+        series = SensorSeries.empty()
+        self.assertEqual(len(series), 0)
+        self.assertEqual(series.to_dicts(), [])
+
+    def test_timestamp_helpers(self):
+        """Timestamps survive conversion to epoch seconds and back."""
+        epoch = parse_timestamps(['2024-01-01 00:00:00'])
+        self.assertEqual(epoch.tolist(), [1704067200])
+        self.assertEqual(format_timestamps(epoch).tolist(), ['2024-01-01 00:00:00'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#############################################################################
+# startup.py
+#
+# This file contains the app's startup mode and its startup-time report.
+#
+# The Dockerfile starts the app with `python startup.py`, which does what
+# `streamlit run app.py` does but first imports the app's dependencies and
+# warms the caches the home page reads (see preload and warm_up). Streamlit
+# only starts listening after that, so on a Cloud Run cold start the
+# container is reported ready once it is warm, and the first visitor doesn't
+# pay for it. Warm-up gives up waiting after WARM_UP_TIMEOUT seconds.
+#
+# However the app was started, app.py calls record_first_render after its
+# first page, which logs one JSON line to stderr: how long each preloaded
+# import and the warm-up took, and the time from process start to the end
+# of that first render. With metrics enabled the same numbers are recorded
+# under kind 'startup'. benchmarks/bench_startup.py tracks cold starts
+# across changes.
+#############################################################################
+
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+# Modules imported before Streamlit starts, in order: what `import app`
+# loads. Each module's time leaves out what the modules before it already
+# imported.
+PRELOAD_MODULES = (
+    'streamlit', 'numpy', 'PIL.Image',
+    'storage', 'data_fetcher', 'leaderboards', 'advice', 'live', 'modules',
+)
+
+# Modules the first page render imports lazily (its charts and maps go
+# through pandas and pyarrow). `import app` stays light without them, so
+# they are only imported by warm_up, which startup mode runs before
+# Streamlit listens.
+WARM_UP_MODULES = ('pandas', 'pyarrow')
+
+# Users whose home page is warmed up, and the longest (in seconds) the
+# server waits for it before starting anyway.
+WARM_UP_USERS = tuple(filter(None, os.environ.get('SDS_WARM_UP_USERS', 'user1').split(',')))
+WARM_UP_TIMEOUT = float(os.environ.get('SDS_WARM_UP_TIMEOUT') or 30)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+logger = logging.getLogger(__name__)
+
+# Fallback for when the process start time can't be read.
+_imported_at = time.perf_counter()
+
+_report = {'import_ms': {}, 'warm_up_ms': None, 'first_render_ms': None}
+_report_lock = threading.Lock()
+
+
+def preload(modules=PRELOAD_MODULES):
+    """Imports modules ahead of time. Returns {module: milliseconds}."""
+    for name in modules:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        _report['import_ms'][name] = _ms(time.perf_counter() - started)
+    return dict(_report['import_ms'])
+
+
+def warm_up(user_ids=WARM_UP_USERS):
+    """Opens the database and fills the caches the home page reads.
+
+    This imports WARM_UP_MODULES, then makes the same reads as
+    app.load_home_page for each user: the page data and the friends
+    leaderboard for the week of their latest workout. Returns how many
+    milliseconds it took.
+    """
+    import data_fetcher
+    import leaderboards
+
+    started = time.perf_counter()
+    preload(WARM_UP_MODULES)
+    data_fetcher.get_storage()
+    for user_id in user_ids:
+        page_data = data_fetcher.fetch_page_data(user_id)
+        totals = page_data['activity_totals']
+        leaderboards.get_friends_leaderboard(
+            user_id, 'steps', 'week', totals['period_start'] if totals else None)
+    _report['warm_up_ms'] = _ms(time.perf_counter() - started)
+    return _report['warm_up_ms']
+
+
+def record_first_render():
+    """Records the time from process start to now, the end of the first
+    page render, and logs the startup report. Later calls do nothing."""
+    with _report_lock:
+        if _report['first_render_ms'] is not None:
+            return
+        _report['first_render_ms'] = _ms(process_age())
+        report = startup_report()
+    # Cloud Run turns a JSON line on stderr into a structured log entry.
+    print(json.dumps({'startup_report': report}), file=sys.stderr, flush=True)
+    if metrics.ENABLED:
+        for name, ms in report['import_ms'].items():
+            metrics.registry.observe('startup', f'import {name}', ms / 1e3)
+        for name in ('warm_up_ms', 'first_render_ms'):
+            if report[name] is not None:
+                metrics.registry.observe('startup', name[:-3], report[name] / 1e3)
+
+
+def startup_report():
+    """Returns what has been measured so far: 'import_ms' ({module:
+    milliseconds}), 'warm_up_ms' and 'first_render_ms' (None until known)."""
+    return {**_report, 'import_ms': dict(_report['import_ms'])}
+
+
+def process_age():
+    """Returns how many seconds ago this process started.
+
+    Falls back to the time since this module was imported where /proc
+    isn't available.
+    """
+    try:
+        with open('/proc/self/stat') as file:
+            # Field 22 is the start time in clock ticks after boot; fields
+            # are counted after the command name, which may contain spaces.
+            start_ticks = int(file.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as file:
+            uptime = float(file.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _imported_at
+
+
+def main():
+    """Preloads, warms up, then runs `streamlit run app.py` with this
+    script's command line options passed on."""
+    preload()
+    warming = threading.Thread(target=_warm_up_or_log, name='warm-up', daemon=True)
+    warming.start()
+    warming.join(WARM_UP_TIMEOUT)
+    if warming.is_alive():
+        logger.warning('Warm-up took over %s seconds; starting without it.', WARM_UP_TIMEOUT)
+
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', APP_PATH, *sys.argv[1:]]
+    cli.main()
+
+
+def _warm_up_or_log():
+    # A failed warm-up only costs the first visitor time, so the server
+    # still starts.
+    try:
+        warm_up()
+    except Exception:
+        logger.exception('Warm-up failed')
+
+
+def _ms(seconds):
+    return round(seconds * 1e3, 1)
+
+
+if __name__ == '__main__':
+    # Run as the `startup` module, so app.py's `import startup` shares the
+    # report with this run instead of importing a second copy.
+    import startup
+    startup.main()
@@ -0,0 +1,90 @@
+#############################################################################
+# startup_test.py
+#
+# This file contains tests for startup.py.
+#############################################################################
+
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import data_fetcher
+import startup
+from cache import cache_stats
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def total_misses():
+    return sum(stats['misses'] for stats in cache_stats().values())
+
+
+class TestStartup(unittest.TestCase):
+    """Tests preloading, warming up and the startup report."""
+
+    def setUp(self):
+        self.report = mock.patch.dict(startup._report, {
+            'import_ms': {}, 'warm_up_ms': None, 'first_render_ms': None})
+        self.report.start()
+
+    def tearDown(self):
+        self.report.stop()
+
+    def test_preload(self):
+        """Each preloaded module's import time is recorded, in order."""
+        self.assertEqual(list(startup.preload(['json', 'sensor_data'])), ['json', 'sensor_data'])
+        self.assertIn('sensor_data', sys.modules)
+
+    def test_preload_is_what_app_imports(self):
+        """Preloading covers app.py's imports but not pandas or pyarrow."""
+        code = ('import sys, startup; startup.preload(); loaded = set(sys.modules); import app; '
+                'print(sorted(set(sys.modules) - loaded), "pandas" in sys.modules, "pyarrow" in sys.modules)')
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                                text=True, check=True, timeout=60)
+        self.assertEqual(result.stdout.split(), ["['app']", 'False', 'False'])
+
+    def test_warm_up_fills_caches(self):
+        """After warm-up, the home page's reads are all cache hits, and the
+        modules its render imports lazily are loaded."""
+        data_fetcher.use_storage(data_fetcher.open_storage(':memory:'))
+        data_fetcher.clear_all()
+        try:
+            startup.warm_up(['user1'])
+            misses = total_misses()
+            data_fetcher.fetch_page_data('user1')
+            self.assertEqual(total_misses(), misses)
+        finally:
+            data_fetcher.use_storage(None)
+            data_fetcher.clear_all()
+        self.assertIsNotNone(startup.startup_report()['warm_up_ms'])
+        self.assertLessEqual(set(startup.WARM_UP_MODULES), set(startup.startup_report()['import_ms']))
+
+    def test_first_render_is_reported_once(self):
+        """The report is logged as one JSON line, on the first render only."""
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            startup.record_first_render()
+            startup.record_first_render()
+        [line] = stderr.getvalue().splitlines()
+        report = json.loads(line)['startup_report']
+        self.assertGreater(report['first_render_ms'], 0)
+        self.assertEqual(report, startup.startup_report())
+
+    def test_process_age(self):
+        """The process started before this test, and not long before."""
+        self.assertTrue(0 < startup.process_age() < 24 * 3600)
+
+    def test_app_import_is_light(self):
+        """Importing app.py neither loads pandas nor touches the database."""
+        code = ('import sys, app, data_fetcher; '
+                'print("pandas" in sys.modules, data_fetcher._storage is not None)')
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                                text=True, check=True, timeout=60)
+        self.assertEqual(result.stdout.split(), ['False', 'False'])
+
+
+if __name__ == "__main__":
+    unittest.main()
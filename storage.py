@@ -0,0 +1,1078 @@
+#############################################################################
+# storage.py
+#
+# This file contains the SQLite storage backend used by data_fetcher.py.
+#
+# The schema is built by the numbered MIGRATIONS below; a database remembers
+# how many it has applied (PRAGMA user_version), so add new migrations at the
+# end instead of editing old ones. Queries are module-level constants so that
+# sqlite3's per-connection statement cache prepares each one only once.
+#############################################################################
+
+import contextlib
+import heapq
+import itertools
+import json
+import queue
+import sqlite3
+
+import numpy as np
+
+from records import Advice, Post, Workout
+from routes import ROUTE_ZOOM_LEVELS, bounding_box, simplify_for_zoom
+from sensor_data import SensorSeries, sensor_code
+
+MIGRATIONS = [
+    # 1: users, friendships, workouts, sensor samples, posts and advice.
+    '''
+    CREATE TABLE users (
+        user_id TEXT PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        username TEXT NOT NULL,
+        date_of_birth TEXT,
+        profile_image TEXT
+    );
+    -- The friend_id check is deferred to commit, so users who are each
+    -- other's friends can be added one after the other.
+    CREATE TABLE friendships (
+        user_id TEXT NOT NULL REFERENCES users (user_id),
+        friend_id TEXT NOT NULL REFERENCES users (user_id) DEFERRABLE INITIALLY DEFERRED,
+        position INTEGER NOT NULL,
+        PRIMARY KEY (user_id, friend_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE workouts (
+        workout_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL REFERENCES users (user_id),
+        start_timestamp TEXT NOT NULL,
+        end_timestamp TEXT NOT NULL,
+        start_lat REAL,
+        start_lng REAL,
+        end_lat REAL,
+        end_lng REAL,
+        distance REAL NOT NULL DEFAULT 0,
+        steps INTEGER NOT NULL DEFAULT 0,
+        calories_burned INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX workouts_user_timestamp ON workouts (user_id, start_timestamp);
+    -- Clustered on (workout_id, timestamp) so a workout's samples are read
+    -- in time order from one contiguous range of the table.
+    CREATE TABLE sensor_samples (
+        workout_id TEXT NOT NULL REFERENCES workouts (workout_id),
+        timestamp INTEGER NOT NULL,
+        sensor_type INTEGER NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (workout_id, timestamp, sensor_type)
+    ) WITHOUT ROWID;
+    CREATE TABLE posts (
+        post_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL REFERENCES users (user_id),
+        timestamp TEXT NOT NULL,
+        content TEXT NOT NULL,
+        image TEXT
+    );
+    CREATE INDEX posts_user_timestamp ON posts (user_id, timestamp);
+    CREATE TABLE advice (
+        advice_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL REFERENCES users (user_id),
+        timestamp TEXT NOT NULL,
+        content TEXT NOT NULL,
+        image TEXT
+    );
+    CREATE INDEX advice_user_timestamp ON advice (user_id, timestamp);
+    ''',
+    # 2: per-workout summaries and per-user day/week/month rollups, kept up
+    # to date by triggers so summary reads are single-row lookups.
+    '''
+    CREATE TABLE workout_summaries (
+        workout_id TEXT PRIMARY KEY REFERENCES workouts (workout_id),
+        duration_seconds INTEGER NOT NULL,
+        sample_count INTEGER NOT NULL DEFAULT 0,
+        heart_rate_count INTEGER NOT NULL DEFAULT 0,
+        heart_rate_sum REAL NOT NULL DEFAULT 0,
+        heart_rate_max REAL
+    );
+    -- period is 'day', 'week' (starting Monday) or 'month'; period_start is
+    -- the 'YYYY-MM-DD' date the period starts on.
+    CREATE TABLE user_rollups (
+        user_id TEXT NOT NULL,
+        period TEXT NOT NULL,
+        period_start TEXT NOT NULL,
+        workouts INTEGER NOT NULL,
+        duration_seconds INTEGER NOT NULL,
+        distance REAL NOT NULL,
+        steps INTEGER NOT NULL,
+        calories_burned INTEGER NOT NULL,
+        PRIMARY KEY (user_id, period, period_start)
+    ) WITHOUT ROWID;
+
+    -- A workout whose timestamps SQLite can't parse counts as lasting 0
+    -- seconds, and is left out of the rollups (it has no period).
+    -- Sensor type 4 is heart_rate (see sensor_data.SENSOR_TYPES).
+    INSERT INTO workout_summaries
+        (workout_id, duration_seconds, sample_count, heart_rate_count,
+         heart_rate_sum, heart_rate_max)
+    SELECT w.workout_id,
+           coalesce(strftime('%s', w.end_timestamp) - strftime('%s', w.start_timestamp), 0),
+           count(s.workout_id),
+           count(s.value) FILTER (WHERE s.sensor_type = 4),
+           coalesce(sum(s.value) FILTER (WHERE s.sensor_type = 4), 0),
+           max(s.value) FILTER (WHERE s.sensor_type = 4)
+    FROM workouts AS w LEFT JOIN sensor_samples AS s USING (workout_id)
+    GROUP BY w.workout_id;
+
+    INSERT INTO user_rollups
+    SELECT w.user_id, p.period, p.period_start, count(*),
+           sum(coalesce(strftime('%s', w.end_timestamp) - strftime('%s', w.start_timestamp), 0)),
+           sum(w.distance), sum(w.steps), sum(w.calories_burned)
+    FROM workouts AS w, (
+        SELECT 'day' AS period, date(start_timestamp) AS period_start, workout_id FROM workouts
+        UNION ALL
+        SELECT 'week', date(start_timestamp, 'weekday 0', '-6 days'), workout_id FROM workouts
+        UNION ALL
+        SELECT 'month', date(start_timestamp, 'start of month'), workout_id FROM workouts
+    ) AS p
+    WHERE p.workout_id = w.workout_id AND p.period_start IS NOT NULL
+    GROUP BY w.user_id, p.period, p.period_start;
+
+    CREATE TRIGGER workouts_rollup_insert AFTER INSERT ON workouts BEGIN
+        INSERT INTO workout_summaries (workout_id, duration_seconds)
+        VALUES (NEW.workout_id,
+                coalesce(strftime('%s', NEW.end_timestamp) - strftime('%s', NEW.start_timestamp), 0));
+        INSERT INTO user_rollups
+        SELECT NEW.user_id, period, period_start, 1,
+               coalesce(strftime('%s', NEW.end_timestamp) - strftime('%s', NEW.start_timestamp), 0),
+               NEW.distance, NEW.steps, NEW.calories_burned
+        FROM (
+            SELECT 'day' AS period, date(NEW.start_timestamp) AS period_start
+            UNION ALL SELECT 'week', date(NEW.start_timestamp, 'weekday 0', '-6 days')
+            UNION ALL SELECT 'month', date(NEW.start_timestamp, 'start of month')
+        ) WHERE period_start IS NOT NULL
+        ON CONFLICT (user_id, period, period_start) DO UPDATE SET
+            workouts = workouts + excluded.workouts,
+            duration_seconds = duration_seconds + excluded.duration_seconds,
+            distance = distance + excluded.distance,
+            steps = steps + excluded.steps,
+            calories_burned = calories_burned + excluded.calories_burned;
+    END;
+
+    CREATE TRIGGER workouts_rollup_delete AFTER DELETE ON workouts BEGIN
+        DELETE FROM workout_summaries WHERE workout_id = OLD.workout_id;
+        UPDATE user_rollups SET
+            workouts = workouts - 1,
+            duration_seconds = duration_seconds
+                - coalesce(strftime('%s', OLD.end_timestamp) - strftime('%s', OLD.start_timestamp), 0),
+            distance = distance - OLD.distance,
+            steps = steps - OLD.steps,
+            calories_burned = calories_burned - OLD.calories_burned
+        WHERE user_id = OLD.user_id AND (period, period_start) IN (
+            VALUES ('day', date(OLD.start_timestamp)),
+                   ('week', date(OLD.start_timestamp, 'weekday 0', '-6 days')),
+                   ('month', date(OLD.start_timestamp, 'start of month')));
+        DELETE FROM user_rollups WHERE user_id = OLD.user_id AND workouts = 0;
+    END;
+
+    -- An update moves the old values out of their periods and the new ones in.
+    CREATE TRIGGER workouts_rollup_update AFTER UPDATE ON workouts BEGIN
+        UPDATE workout_summaries SET duration_seconds =
+            coalesce(strftime('%s', NEW.end_timestamp) - strftime('%s', NEW.start_timestamp), 0)
+        WHERE workout_id = NEW.workout_id;
+        UPDATE user_rollups SET
+            workouts = workouts - 1,
+            duration_seconds = duration_seconds
+                - coalesce(strftime('%s', OLD.end_timestamp) - strftime('%s', OLD.start_timestamp), 0),
+            distance = distance - OLD.distance,
+            steps = steps - OLD.steps,
+            calories_burned = calories_burned - OLD.calories_burned
+        WHERE user_id = OLD.user_id AND (period, period_start) IN (
+            VALUES ('day', date(OLD.start_timestamp)),
+                   ('week', date(OLD.start_timestamp, 'weekday 0', '-6 days')),
+                   ('month', date(OLD.start_timestamp, 'start of month')));
+        DELETE FROM user_rollups WHERE user_id = OLD.user_id AND workouts = 0;
+        INSERT INTO user_rollups
+        SELECT NEW.user_id, period, period_start, 1,
+               coalesce(strftime('%s', NEW.end_timestamp) - strftime('%s', NEW.start_timestamp), 0),
+               NEW.distance, NEW.steps, NEW.calories_burned
+        FROM (
+            SELECT 'day' AS period, date(NEW.start_timestamp) AS period_start
+            UNION ALL SELECT 'week', date(NEW.start_timestamp, 'weekday 0', '-6 days')
+            UNION ALL SELECT 'month', date(NEW.start_timestamp, 'start of month')
+        ) WHERE period_start IS NOT NULL
+        ON CONFLICT (user_id, period, period_start) DO UPDATE SET
+            workouts = workouts + excluded.workouts,
+            duration_seconds = duration_seconds + excluded.duration_seconds,
+            distance = distance + excluded.distance,
+            steps = steps + excluded.steps,
+            calories_burned = calories_burned + excluded.calories_burned;
+    END;
+
+    ''',
+    # 3: remember which workout data each piece of advice was generated from.
+    '''
+    ALTER TABLE advice ADD COLUMN input_hash TEXT;
+    ''',
+    # 4: include the id in the per-user indexes, so keyset pages ordered by
+    # (timestamp, id) are read straight from the index.
+    '''
+    DROP INDEX workouts_user_timestamp;
+    CREATE INDEX workouts_user_timestamp ON workouts (user_id, start_timestamp, workout_id);
+    DROP INDEX posts_user_timestamp;
+    CREATE INDEX posts_user_timestamp ON posts (user_id, timestamp, post_id);
+    ''',
+    # 5: GPS routes. The full trace and one simplified copy per zoom level
+    # are stored as little-endian float64 (lat, lng) pairs.
+    '''
+    CREATE TABLE routes (
+        workout_id TEXT PRIMARY KEY REFERENCES workouts (workout_id),
+        point_count INTEGER NOT NULL,
+        min_lat REAL,
+        min_lng REAL,
+        max_lat REAL,
+        max_lng REAL,
+        points BLOB NOT NULL
+    );
+    CREATE TABLE route_levels (
+        workout_id TEXT NOT NULL REFERENCES routes (workout_id),
+        zoom INTEGER NOT NULL,
+        points BLOB NOT NULL,
+        PRIMARY KEY (workout_id, zoom)
+    ) WITHOUT ROWID;
+    ''',
+]
+
+SELECT_USER = '''
+    SELECT user_id, full_name, username, date_of_birth, profile_image
+    FROM users WHERE user_id = ?
+'''
+# Many users in one statement: the ids are passed as a single JSON array.
+SELECT_USERS = '''
+    SELECT user_id, full_name, username, date_of_birth, profile_image
+    FROM users WHERE user_id IN (SELECT value FROM json_each(?))
+'''
+SELECT_FRIENDS = '''
+    SELECT friend_id FROM friendships WHERE user_id = ? ORDER BY position
+'''
+SELECT_USER_IDS = 'SELECT user_id FROM users ORDER BY user_id'
+SELECT_ALL_FRIENDSHIPS = 'SELECT user_id, friend_id FROM friendships'
+SELECT_FRIENDS_OF_USERS = '''
+    SELECT user_id, friend_id FROM friendships
+    WHERE user_id IN (SELECT value FROM json_each(?))
+    ORDER BY user_id, position
+'''
+SELECT_WORKOUTS = '''
+    SELECT workout_id, start_timestamp, end_timestamp, start_lat, start_lng,
+           end_lat, end_lng, distance, steps, calories_burned, duration_seconds
+    FROM workouts JOIN workout_summaries USING (workout_id)
+    WHERE user_id = ? ORDER BY start_timestamp, workout_id
+'''
+# Keyset pages: rows strictly after (or before) the last row of the
+# previous page, within [since, until).
+SELECT_WORKOUTS_PAGE = '''
+    SELECT workout_id, start_timestamp, end_timestamp, start_lat, start_lng,
+           end_lat, end_lng, distance, steps, calories_burned, duration_seconds
+    FROM workouts JOIN workout_summaries USING (workout_id)
+    WHERE user_id = ? AND start_timestamp >= ? AND start_timestamp < ?
+      AND (start_timestamp, workout_id) > (?, ?)
+    ORDER BY start_timestamp, workout_id LIMIT ?
+'''
+SELECT_POSTS_PAGE = '''
+    SELECT user_id, post_id, timestamp, content, image
+    FROM posts
+    WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
+      AND (timestamp, post_id) < (?, ?)
+    ORDER BY timestamp DESC, post_id DESC LIMIT ?
+'''
+SELECT_WORKOUT_SUMMARY = '''
+    SELECT duration_seconds, sample_count, heart_rate_count, heart_rate_sum,
+           heart_rate_max
+    FROM workout_summaries WHERE workout_id = ?
+'''
+SELECT_ROLLUP = '''
+    SELECT period_start, workouts, duration_seconds, distance, steps, calories_burned
+    FROM user_rollups WHERE user_id = ? AND period = ? AND period_start = ?
+'''
+SELECT_LATEST_ROLLUPS = '''
+    SELECT period_start, workouts, duration_seconds, distance, steps, calories_burned
+    FROM user_rollups WHERE user_id = ? AND period = ?
+    ORDER BY period_start DESC LIMIT ?
+'''
+SELECT_ROLLUPS_FOR_USERS = '''
+    SELECT user_id, steps, distance, calories_burned FROM user_rollups
+    WHERE period = ? AND period_start = ?
+      AND user_id IN (SELECT value FROM json_each(?))
+'''
+SELECT_ACTIVE_USERS = '''
+    SELECT DISTINCT user_id FROM workouts WHERE start_timestamp >= ? ORDER BY user_id
+'''
+SELECT_SENSOR_SAMPLES = '''
+    SELECT timestamp, value, sensor_type FROM sensor_samples
+    WHERE workout_id = ? ORDER BY timestamp, sensor_type
+'''
+SELECT_POSTS = '''
+    SELECT user_id, post_id, timestamp, content, image
+    FROM posts WHERE user_id = ? ORDER BY timestamp DESC, post_id DESC
+'''
+# One user's newest posts after a timestamp, read in posts_user_timestamp
+# index order, so SQLite stops after LIMIT rows instead of sorting them all.
+SELECT_NEWEST_POSTS = '''
+    SELECT user_id, post_id, timestamp, content, image
+    FROM posts WHERE user_id = ? AND timestamp > ?
+    ORDER BY timestamp DESC, post_id DESC LIMIT ?
+'''
+SELECT_LATEST_ADVICE = '''
+    SELECT advice_id, timestamp, content, image, input_hash FROM advice
+    WHERE user_id = ? ORDER BY timestamp DESC, advice_id DESC LIMIT 1
+'''
+SELECT_ROUTE = 'SELECT points FROM routes WHERE workout_id = ?'
+SELECT_ROUTE_LEVEL = 'SELECT points FROM route_levels WHERE workout_id = ? AND zoom = ?'
+SELECT_USER_ROUTES = '''
+    SELECT workouts.workout_id, min_lat, min_lng, max_lat, max_lng, route_levels.points
+    FROM workouts
+    JOIN routes ON routes.workout_id = workouts.workout_id
+    JOIN route_levels ON route_levels.workout_id = workouts.workout_id AND zoom = ?
+    WHERE user_id = ?
+    ORDER BY start_timestamp, workouts.workout_id
+'''
+# A user's rows in one table, copied as they are stored for archive.py.
+# Columns are selected in the order the table's INSERT statement takes them,
+# and rows with a timestamp are limited to [since, until).
+SELECT_ARCHIVE_ROWS = {
+    'users': '''
+        SELECT user_id, full_name, username, date_of_birth, profile_image
+        FROM users WHERE user_id = :user_id
+    ''',
+    'friendships': '''
+        SELECT user_id, friend_id, position FROM friendships
+        WHERE user_id = :user_id ORDER BY position
+    ''',
+    'workouts': '''
+        SELECT workout_id, user_id, start_timestamp, end_timestamp, start_lat,
+               start_lng, end_lat, end_lng, distance, steps, calories_burned
+        FROM workouts
+        WHERE user_id = :user_id AND start_timestamp >= :since AND start_timestamp < :until
+        ORDER BY start_timestamp, workout_id
+    ''',
+    # Samples go with the time their workout started, and are grouped by
+    # workout in the same order as the workouts.
+    'sensor_samples': '''
+        SELECT workouts.workout_id, timestamp, sensor_type, value
+        FROM workouts JOIN sensor_samples ON sensor_samples.workout_id = workouts.workout_id
+        WHERE user_id = :user_id AND start_timestamp >= :since AND start_timestamp < :until
+        ORDER BY start_timestamp, workouts.workout_id, timestamp, sensor_type
+    ''',
+    'posts': '''
+        SELECT post_id, user_id, timestamp, content, image FROM posts
+        WHERE user_id = :user_id AND timestamp >= :since AND timestamp < :until
+        ORDER BY timestamp, post_id
+    ''',
+    'advice': '''
+        SELECT advice_id, user_id, timestamp, content, image, input_hash FROM advice
+        WHERE user_id = :user_id AND timestamp >= :since AND timestamp < :until
+        ORDER BY timestamp, advice_id
+    ''',
+}
+# The 'YYYY-MM' months a user has workouts, posts or advice in.
+SELECT_USER_MONTHS = '''
+    SELECT substr(start_timestamp, 1, 7) FROM workouts WHERE user_id = :user_id
+    UNION SELECT substr(timestamp, 1, 7) FROM posts WHERE user_id = :user_id
+    UNION SELECT substr(timestamp, 1, 7) FROM advice WHERE user_id = :user_id
+    ORDER BY 1
+'''
+SELECT_WORKOUTS_WITH_SAMPLES = '''
+    SELECT workout_id FROM workout_summaries
+    WHERE sample_count > 0 AND workout_id IN (SELECT value FROM json_each(?))
+'''
+INSERT_USER = '''
+    INSERT INTO users (user_id, full_name, username, date_of_birth, profile_image)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        full_name = excluded.full_name,
+        username = excluded.username,
+        date_of_birth = excluded.date_of_birth,
+        profile_image = excluded.profile_image
+'''
+INSERT_FRIENDSHIP = '''
+    INSERT OR REPLACE INTO friendships (user_id, friend_id, position)
+    VALUES (?, ?, ?)
+'''
+# Upserts rather than INSERT OR REPLACE, which would delete (and so orphan
+# the sensor samples of) an existing workout.
+INSERT_WORKOUT = '''
+    INSERT INTO workouts
+        (workout_id, user_id, start_timestamp, end_timestamp, start_lat,
+         start_lng, end_lat, end_lng, distance, steps, calories_burned)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (workout_id) DO UPDATE SET
+        start_timestamp = excluded.start_timestamp,
+        end_timestamp = excluded.end_timestamp,
+        start_lat = excluded.start_lat,
+        start_lng = excluded.start_lng,
+        end_lat = excluded.end_lat,
+        end_lng = excluded.end_lng,
+        distance = excluded.distance,
+        steps = excluded.steps,
+        calories_burned = excluded.calories_burned
+'''
+# Sensor samples are written through a per-connection staging table: a
+# batch is bulk-loaded into it, samples already stored are dropped from it,
+# and what is left is summarized into workout_summaries and then copied into
+# sensor_samples with one INSERT ... SELECT.
+CREATE_SENSOR_STAGING = '''
+    CREATE TEMP TABLE IF NOT EXISTS sensor_staging (
+        timestamp INTEGER NOT NULL,
+        sensor_type INTEGER NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (timestamp, sensor_type)
+    ) WITHOUT ROWID
+'''
+CLEAR_SENSOR_STAGING = 'DELETE FROM temp.sensor_staging'
+# OR IGNORE keeps the first of any repeated samples within the batch.
+INSERT_SENSOR_STAGING = '''
+    INSERT OR IGNORE INTO temp.sensor_staging (timestamp, sensor_type, value)
+    VALUES (?, ?, ?)
+'''
+DELETE_STORED_FROM_STAGING = '''
+    DELETE FROM temp.sensor_staging WHERE EXISTS (
+        SELECT 1 FROM sensor_samples AS s
+        WHERE s.workout_id = ?
+          AND s.timestamp = sensor_staging.timestamp
+          AND s.sensor_type = sensor_staging.sensor_type)
+'''
+UPDATE_WORKOUT_SUMMARY_SAMPLES = '''
+    UPDATE workout_summaries SET
+        sample_count = sample_count + new_sample_count,
+        heart_rate_count = heart_rate_count + new_heart_rate_count,
+        heart_rate_sum = heart_rate_sum + new_heart_rate_sum,
+        heart_rate_max = max(coalesce(heart_rate_max, new_heart_rate_max),
+                             coalesce(new_heart_rate_max, heart_rate_max))
+    FROM (
+        SELECT count(*) AS new_sample_count,
+               count(*) FILTER (WHERE sensor_type = :heart_rate) AS new_heart_rate_count,
+               coalesce(sum(value) FILTER (WHERE sensor_type = :heart_rate), 0)
+                   AS new_heart_rate_sum,
+               max(value) FILTER (WHERE sensor_type = :heart_rate) AS new_heart_rate_max
+        FROM temp.sensor_staging
+    )
+    WHERE workout_id = :workout_id
+'''
+COPY_SENSOR_STAGING = '''
+    INSERT INTO sensor_samples (workout_id, timestamp, sensor_type, value)
+    SELECT ?, timestamp, sensor_type, value FROM temp.sensor_staging
+'''
+# Bulk loads skip the staging table: the caller guarantees the samples are
+# new, and the summaries are computed in NumPy instead.
+INSERT_SENSOR_SAMPLE = '''
+    INSERT INTO sensor_samples (workout_id, timestamp, sensor_type, value)
+    VALUES (?, ?, ?, ?)
+'''
+UPDATE_WORKOUT_SUMMARY_TOTALS = '''
+    UPDATE workout_summaries SET
+        sample_count = sample_count + ?1,
+        heart_rate_count = heart_rate_count + ?2,
+        heart_rate_sum = heart_rate_sum + ?3,
+        heart_rate_max = max(coalesce(heart_rate_max, ?4), coalesce(?4, heart_rate_max))
+    WHERE workout_id = ?5
+'''
+INSERT_POST = '''
+    INSERT OR REPLACE INTO posts (post_id, user_id, timestamp, content, image)
+    VALUES (?, ?, ?, ?, ?)
+'''
+INSERT_ROUTE = '''
+    INSERT OR REPLACE INTO routes
+        (workout_id, point_count, min_lat, min_lng, max_lat, max_lng, points)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_ROUTE_LEVEL = '''
+    INSERT OR REPLACE INTO route_levels (workout_id, zoom, points) VALUES (?, ?, ?)
+'''
+INSERT_ADVICE = '''
+    INSERT OR REPLACE INTO advice (advice_id, user_id, timestamp, content, image, input_hash)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Statements that store rows in SELECT_ARCHIVE_ROWS' format. Sensor samples
+# are left out: they are stored with add_sensor_data_bulk, which keeps the
+# workout summaries right.
+INSERT_ARCHIVE_ROWS = {
+    'users': INSERT_USER,
+    'friendships': INSERT_FRIENDSHIP,
+    'workouts': INSERT_WORKOUT,
+    'posts': INSERT_POST,
+    'advice': INSERT_ADVICE,
+}
+
+ROLLUP_PERIODS = ('day', 'week', 'month')
+
+# How many rows add_sensor_data_bulk hands to SQLite at a time.
+BULK_INSERT_ROWS = 100_000
+
+# Bounds that sort before and after every 'YYYY-MM-DD HH:MM:SS' timestamp
+# (and id), used when a page query has no since/until/position.
+MIN_KEY = ''
+MAX_KEY = '\uffff'
+
+# Row layout used to load sensor samples straight into NumPy.
+_SAMPLE_DTYPE = np.dtype([('timestamp', np.int64), ('value', np.float64), ('type', np.int8)])
+
+# How route points are stored in BLOBs.
+_ROUTE_DTYPE = np.dtype('<f8')
+
+
+class ConnectionPool:
+    """A fixed set of SQLite connections shared between threads.
+
+    Each connection is used by one thread at a time; connection() blocks when
+    all of them are busy.
+    """
+
+    def __init__(self, path, size=4, timeout=10.0):
+        self.path = path
+        self.size = size
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._connect(timeout))
+
+    def _connect(self, timeout):
+        connection = sqlite3.connect(
+            self.path,
+            timeout=timeout,
+            check_same_thread=False,
+            # Statements are run in explicit transactions (see Storage.write).
+            isolation_level=None,
+            cached_statements=256,
+        )
+        connection.execute('PRAGMA foreign_keys = ON')
+        if self.path != ':memory:':
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrows a connection for the duration of a with block."""
+        connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def close(self):
+        """Closes every connection in the pool."""
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+class Storage:
+    """Reads and writes the app's data in a SQLite database.
+
+    Read methods return the same records (see records.py), dicts and
+    SensorSeries as the data_fetcher functions they back, so each row is
+    parsed once, here.
+    """
+
+    def __init__(self, path, pool_size=4):
+        # An in-memory database only exists inside a single connection.
+        self.pool = ConnectionPool(path, size=1 if path == ':memory:' else pool_size)
+        self.migrate()
+
+    def close(self):
+        self.pool.close()
+
+    @contextlib.contextmanager
+    def read(self):
+        """Yields a connection for queries."""
+        with self.pool.connection() as connection:
+            yield connection
+
+    @contextlib.contextmanager
+    def write(self):
+        """Yields a connection inside a transaction that commits on success.
+
+        BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        wait for each other instead of failing half way through.
+        """
+        with self.pool.connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def migrate(self):
+        """Applies any migrations the database has not seen yet."""
+        with self.write() as connection:
+            applied = connection.execute('PRAGMA user_version').fetchone()[0]
+            for version, script in enumerate(MIGRATIONS[applied:], start=applied + 1):
+                for statement in _statements(script):
+                    connection.execute(statement)
+                connection.execute(f'PRAGMA user_version = {version}')
+
+    def is_empty(self, connection=None):
+        """Returns whether the database has no users yet."""
+        if connection is not None:
+            return connection.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+        with self.read() as connection:
+            return self.is_empty(connection)
+
+    # Reads
+
+    def get_user(self, user_id):
+        """Returns a user's profile dict, or None if there is no such user."""
+        with self.read() as connection:
+            row = connection.execute(SELECT_USER, (user_id,)).fetchone()
+            if row is None:
+                return None
+            friends = [friend for friend, in connection.execute(SELECT_FRIENDS, (user_id,))]
+        return _profile(row, friends)
+
+    def get_users(self, user_ids):
+        """Returns {user_id: profile} for the ids that exist, in one query each."""
+        ids_json = _json_list(user_ids)
+        with self.read() as connection:
+            rows = connection.execute(SELECT_USERS, (ids_json,)).fetchall()
+            friends = {}
+            for user_id, friend_id in connection.execute(SELECT_FRIENDS_OF_USERS, (ids_json,)):
+                friends.setdefault(user_id, []).append(friend_id)
+        return {row[0]: _profile(row, friends.get(row[0], [])) for row in rows}
+
+    def get_friend_edges(self):
+        """Returns every user id and every (user_id, friend_id) friendship.
+
+        This is what friend_graph.FriendGraph.from_storage builds its index
+        from.
+        """
+        with self.read() as connection:
+            user_ids = [user_id for user_id, in connection.execute(SELECT_USER_IDS)]
+            friendships = connection.execute(SELECT_ALL_FRIENDSHIPS).fetchall()
+        return user_ids, friendships
+
+    def get_user_ids(self):
+        """Returns every user id, in order."""
+        with self.read() as connection:
+            return [user_id for user_id, in connection.execute(SELECT_USER_IDS)]
+
+    def get_user_months(self, user_id):
+        """Returns the 'YYYY-MM' months a user has workouts, posts or advice in."""
+        with self.read() as connection:
+            return [month for month, in connection.execute(
+                SELECT_USER_MONTHS, {'user_id': user_id})]
+
+    def get_archive_rows(self, table, user_id, since=None, until=None):
+        """Returns a user's rows in one table, as stored, for a bulk copy.
+
+        This is what archive.py exports: plain row tuples, without building
+        records or dicts.
+
+        Args:
+            table: a key of SELECT_ARCHIVE_ROWS.
+            since: only rows timestamped at or after this (for sensor
+                samples, their workout's start).
+            until: only rows timestamped before this.
+
+        Returns:
+            A (column names, rows) pair.
+        """
+        if table not in SELECT_ARCHIVE_ROWS:
+            raise ValueError(f'Unknown archive table {table}.')
+        with self.read() as connection:
+            cursor = connection.execute(SELECT_ARCHIVE_ROWS[table], {
+                'user_id': user_id, 'since': since or MIN_KEY, 'until': until or MAX_KEY})
+            return [column[0] for column in cursor.description], cursor.fetchall()
+
+    def get_workouts_with_samples(self, workout_ids):
+        """Returns the set of the given workouts that have samples stored."""
+        with self.read() as connection:
+            return {workout_id for workout_id, in connection.execute(
+                SELECT_WORKOUTS_WITH_SAMPLES, (_json_list(workout_ids),))}
+
+    def get_workouts(self, user_id):
+        """Returns a user's workouts, oldest first."""
+        with self.read() as connection:
+            rows = connection.execute(SELECT_WORKOUTS, (user_id,)).fetchall()
+        return [_workout(row) for row in rows]
+
+    def get_workouts_page(self, user_id, after=None, since=None, until=None, limit=100):
+        """Returns up to `limit` workouts, oldest first.
+
+        Args:
+            after: a (start_timestamp, workout_id) pair; only workouts after
+                it are returned. Pass the last workout of the previous page.
+            since: only workouts starting at or after this timestamp.
+            until: only workouts starting before this timestamp.
+        """
+        after = after or (MIN_KEY, MIN_KEY)
+        with self.read() as connection:
+            rows = connection.execute(SELECT_WORKOUTS_PAGE, (
+                user_id, since or MIN_KEY, until or MAX_KEY, *after, limit)).fetchall()
+        return [_workout(row) for row in rows]
+
+    def get_posts_page(self, user_id, before=None, since=None, until=None, limit=100):
+        """Returns up to `limit` posts, newest first.
+
+        Args:
+            before: a (timestamp, post_id) pair; only posts before it are
+                returned. Pass the last post of the previous page.
+            since: only posts at or after this timestamp.
+            until: only posts before this timestamp.
+        """
+        before = before or (MAX_KEY, MAX_KEY)
+        with self.read() as connection:
+            rows = connection.execute(SELECT_POSTS_PAGE, (
+                user_id, since or MIN_KEY, until or MAX_KEY, *before, limit)).fetchall()
+        return [_post(row) for row in rows]
+
+    def get_active_user_ids(self, since):
+        """Returns the ids of users with a workout starting at or after `since`."""
+        with self.read() as connection:
+            return [user_id for user_id, in connection.execute(SELECT_ACTIVE_USERS, (since,))]
+
+    def get_workout_summary(self, workout_id):
+        """Returns the stored summary of a workout, or None.
+
+        The dict has 'duration_seconds', 'sample_count', 'heart_rate_avg'
+        and 'heart_rate_max' (both None without heart rate samples).
+        """
+        with self.read() as connection:
+            row = connection.execute(SELECT_WORKOUT_SUMMARY, (workout_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'duration_seconds': row[0],
+            'sample_count': row[1],
+            'heart_rate_avg': row[3] / row[2] if row[2] else None,
+            'heart_rate_max': row[4],
+        }
+
+    def get_rollups(self, user_id, period, period_start=None, limit=1):
+        """Returns a user's activity totals per day, week or month.
+
+        Args:
+            period: 'day', 'week' (weeks start on Monday) or 'month'.
+            period_start: the 'YYYY-MM-DD' start of one period to return.
+                Without it, the latest `limit` periods with activity are
+                returned, newest first.
+
+        Returns:
+            A list of dicts with 'period_start', 'workouts',
+            'duration_seconds', 'distance', 'steps' and 'calories_burned'.
+        """
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f'Unknown rollup period {period}.')
+        with self.read() as connection:
+            if period_start is None:
+                rows = connection.execute(SELECT_LATEST_ROLLUPS, (user_id, period, limit))
+            else:
+                rows = connection.execute(SELECT_ROLLUP, (user_id, period, period_start))
+            rows = rows.fetchall()
+        return [_rollup(row) for row in rows]
+
+    def get_rollups_for_users(self, user_ids, period, period_start):
+        """Returns many users' totals for one day, week or month.
+
+        Returns:
+            A dict mapping each user with activity in the period to a
+            (steps, distance, calories_burned) tuple.
+        """
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f'Unknown rollup period {period}.')
+        with self.read() as connection:
+            rows = connection.execute(
+                SELECT_ROLLUPS_FOR_USERS, (period, period_start, _json_list(user_ids)))
+            return {row[0]: row[1:] for row in rows}
+
+    def get_sensor_data(self, workout_id):
+        """Returns a workout's samples as a time-ordered SensorSeries."""
+        with self.read() as connection:
+            samples = np.fromiter(
+                connection.execute(SELECT_SENSOR_SAMPLES, (workout_id,)),
+                dtype=_SAMPLE_DTYPE)
+        return SensorSeries(samples['timestamp'], samples['value'], samples['type'])
+
+    def get_route(self, workout_id, zoom=None):
+        """Returns a workout's GPS route as an (N, 2) array of (lat, lng).
+
+        Without a zoom level this is the full trace; with one, it is the
+        stored simplification for the nearest level in ROUTE_ZOOM_LEVELS
+        (see routes.py). Returns None if the workout has no route. The array
+        is read-only.
+        """
+        with self.read() as connection:
+            if zoom is None:
+                row = connection.execute(SELECT_ROUTE, (workout_id,)).fetchone()
+            else:
+                row = connection.execute(
+                    SELECT_ROUTE_LEVEL, (workout_id, _stored_zoom(zoom))).fetchone()
+        return None if row is None else _route_points(row[0])
+
+    def get_user_routes(self, user_id, zoom):
+        """Returns every route of a user's workouts, simplified for a zoom level.
+
+        Returns:
+            A list of dicts with 'workout_id', 'bounds' (min_lat, min_lng,
+            max_lat, max_lng) and read-only 'points', oldest workout first.
+        """
+        with self.read() as connection:
+            rows = connection.execute(
+                SELECT_USER_ROUTES, (_stored_zoom(zoom), user_id)).fetchall()
+        return [
+            {'workout_id': row[0], 'bounds': row[1:5], 'points': _route_points(row[5])}
+            for row in rows
+        ]
+
+    def get_posts(self, user_id):
+        """Returns a user's posts, newest first."""
+        with self.read() as connection:
+            rows = connection.execute(SELECT_POSTS, (user_id,)).fetchall()
+        return [_post(row) for row in rows]
+
+    def get_posts_for_users(self, user_ids, since=None, limit=20):
+        """Returns up to `limit` of the newest posts by any of the users,
+        newest first. With `since`, only posts after it.
+
+        Each user's posts are read newest first, in index order, by a cursor
+        of its own, and the cursors are merged lazily: about `limit` rows are
+        read in all, plus one per user, however many posts the users have.
+        """
+        with self.read() as connection:
+            cursors = [connection.execute(SELECT_NEWEST_POSTS, (user_id, since or MIN_KEY, limit))
+                       for user_id in user_ids]
+            rows = heapq.merge(*cursors, key=lambda row: (row[2], row[1]), reverse=True)
+            return [_post(row) for row in itertools.islice(rows, limit)]
+
+    def get_latest_advice(self, user_id, with_input_hash=False):
+        """Returns a user's most recent Advice, or None if there is none.
+
+        With with_input_hash=True, returns an (advice, input_hash) tuple
+        instead, input_hash being the one it was stored with (see
+        add_advice); both are None if there is no advice.
+        """
+        with self.read() as connection:
+            row = connection.execute(SELECT_LATEST_ADVICE, (user_id,)).fetchone()
+        advice = None if row is None else Advice(*row[:4])
+        if with_input_hash:
+            return advice, (None if row is None else row[4])
+        return advice
+
+    # Writes. Each accepts an open connection so several writes can share a
+    # transaction; without one, the write gets a transaction of its own.
+
+    def add_user(self, user_id, profile, connection=None):
+        """Stores a user (in the users dict format) and their friends list."""
+        with _writing(self, connection) as connection:
+            connection.execute(INSERT_USER, (
+                user_id, profile['full_name'], profile['username'],
+                profile.get('date_of_birth'), profile.get('profile_image')))
+            connection.execute('DELETE FROM friendships WHERE user_id = ?', (user_id,))
+            connection.executemany(INSERT_FRIENDSHIP, [
+                (user_id, friend_id, position)
+                for position, friend_id in enumerate(profile.get('friends', []))
+            ])
+
+    def add_workouts(self, user_id, workouts, connection=None):
+        """Stores Workout records or dicts in the same format."""
+        with _writing(self, connection) as connection:
+            connection.executemany(INSERT_WORKOUT, [
+                (w['workout_id'], user_id, w['start_timestamp'], w['end_timestamp'],
+                 *(w.get('start_lat_lng') or (None, None)),
+                 *(w.get('end_lat_lng') or (None, None)),
+                 w.get('distance', 0), w.get('steps', 0), w.get('calories_burned', 0))
+                for w in workouts
+            ])
+
+    def add_sensor_data(self, workout_id, series, connection=None):
+        """Stores a SensorSeries for a workout.
+
+        Samples already stored for the same (workout, sensor type, timestamp)
+        are ignored. Returns how many samples were actually inserted.
+        """
+        with _writing(self, connection) as connection:
+            connection.execute(CREATE_SENSOR_STAGING)
+            connection.execute(CLEAR_SENSOR_STAGING)
+            connection.executemany(INSERT_SENSOR_STAGING, zip(
+                series.timestamps.tolist(),
+                series.type_codes.tolist(),
+                series.values.tolist(),
+            ))
+            connection.execute(DELETE_STORED_FROM_STAGING, (workout_id,))
+            connection.execute(UPDATE_WORKOUT_SUMMARY_SAMPLES, {
+                'workout_id': workout_id, 'heart_rate': sensor_code('heart_rate')})
+            inserted = connection.execute(COPY_SENSOR_STAGING, (workout_id,)).rowcount
+            connection.execute(CLEAR_SENSOR_STAGING)
+            return inserted
+
+    def add_sensor_data_bulk(self, workout_ids, counts, series, connection=None):
+        """Stores the samples of many workouts at once, e.g. generated data.
+
+        Faster than calling add_sensor_data per workout, but samples are not
+        checked against what is stored: every sample must be new, or the
+        insert fails.
+
+        Args:
+            workout_ids: the workouts, in the order their samples appear in
+                `series`.
+            counts: how many samples each workout has.
+            series: every workout's samples back to back, in one SensorSeries.
+        """
+        counts = np.asarray(counts, dtype=np.int64)
+        owners = np.repeat(np.arange(len(counts)), counts)
+        heart_rate = series.type_codes == sensor_code('heart_rate')
+        heart_rate_owners = owners[heart_rate]
+        heart_rate_values = series.values[heart_rate]
+        heart_rate_counts = np.bincount(heart_rate_owners, minlength=len(counts))
+        heart_rate_sums = np.bincount(
+            heart_rate_owners, weights=heart_rate_values, minlength=len(counts))
+        heart_rate_maxes = np.full(len(counts), -np.inf)
+        np.maximum.at(heart_rate_maxes, heart_rate_owners, heart_rate_values)
+        owner_ids = np.repeat(np.asarray(workout_ids, dtype=object), counts)
+        with _writing(self, connection) as connection:
+            # In slices, so only one slice at a time is turned into Python
+            # objects.
+            for begin in range(0, len(series), BULK_INSERT_ROWS):
+                end = begin + BULK_INSERT_ROWS
+                connection.executemany(INSERT_SENSOR_SAMPLE, zip(
+                    owner_ids[begin:end].tolist(),
+                    series.timestamps[begin:end].tolist(),
+                    series.type_codes[begin:end].tolist(),
+                    series.values[begin:end].tolist(),
+                ))
+            connection.executemany(UPDATE_WORKOUT_SUMMARY_TOTALS, zip(
+                counts.tolist(),
+                heart_rate_counts.tolist(),
+                heart_rate_sums.tolist(),
+                [peak if count else None
+                 for peak, count in zip(heart_rate_maxes.tolist(), heart_rate_counts.tolist())],
+                workout_ids,
+            ))
+
+    def add_route(self, workout_id, points, connection=None):
+        """Stores a workout's GPS route, replacing any it already has.
+
+        The route's bounding box and its simplification for each zoom level
+        are computed once, here, so reads never process the full trace.
+
+        Args:
+            points: (lat, lng) pairs in the order they were recorded.
+        """
+        points = np.asarray(points, dtype=_ROUTE_DTYPE).reshape(-1, 2)
+        with _writing(self, connection) as connection:
+            connection.execute(INSERT_ROUTE, (
+                workout_id, len(points), *(bounding_box(points) or (None,) * 4),
+                points.tobytes()))
+            connection.executemany(INSERT_ROUTE_LEVEL, [
+                (workout_id, zoom, simplify_for_zoom(points, zoom).astype(_ROUTE_DTYPE).tobytes())
+                for zoom in ROUTE_ZOOM_LEVELS
+            ])
+
+    def add_posts(self, posts, connection=None):
+        """Stores Post records or dicts in the same format."""
+        with _writing(self, connection) as connection:
+            connection.executemany(INSERT_POST, [
+                (p['post_id'], p['user_id'], p['timestamp'], p['content'], p.get('image'))
+                for p in posts
+            ])
+
+    def add_archive_rows(self, table, rows, connection=None):
+        """Stores rows in get_archive_rows' format (not sensor samples).
+
+        Existing rows with the same key are updated.
+        """
+        if table not in INSERT_ARCHIVE_ROWS:
+            raise ValueError(f'Rows of {table} can\'t be added as archive rows.')
+        with _writing(self, connection) as connection:
+            connection.executemany(INSERT_ARCHIVE_ROWS[table], rows)
+
+    def add_advice(self, user_id, advice, connection=None, input_hash=None):
+        """Stores an Advice record, or a dict in the same format.
+
+        A dict may also have an 'input_hash' identifying the data the advice
+        was generated from; for a record, pass input_hash separately.
+        """
+        with _writing(self, connection) as connection:
+            connection.execute(INSERT_ADVICE, (
+                advice['advice_id'], user_id, advice['timestamp'],
+                advice['content'], advice.get('image'),
+                input_hash or advice.get('input_hash')))
+
+
+@contextlib.contextmanager
+def _writing(storage, connection):
+    # Reuse the caller's transaction if there is one, else start one.
+    if connection is not None:
+        yield connection
+    else:
+        with storage.write() as connection:
+            yield connection
+
+
+def _json_list(values):
+    # Encodes ids as a JSON array for the json_each() queries.
+    return json.dumps(list(values))
+
+
+def _statements(script):
+    # Splits a migration into statements. executescript() can't be used
+    # because it commits the surrounding transaction; complete_statement()
+    # keeps trigger bodies (which contain ';') in one piece.
+    statement = ''
+    for part in script.split(';'):
+        statement += part + ';'
+        if sqlite3.complete_statement(statement):
+            if statement.strip(' \n;'):
+                yield statement
+            statement = ''
+
+
+def _stored_zoom(zoom):
+    # The most detailed stored level not above `zoom` (or the least detailed
+    # level for zooms below all of them).
+    return max((level for level in ROUTE_ZOOM_LEVELS if level <= zoom),
+               default=ROUTE_ZOOM_LEVELS[0])
+
+
+def _route_points(blob):
+    return np.frombuffer(blob, dtype=_ROUTE_DTYPE).reshape(-1, 2)
+
+
+def _profile(row, friends):
+    return {
+        'full_name': row[1],
+        'username': row[2],
+        'date_of_birth': row[3],
+        'profile_image': row[4],
+        'friends': friends,
+    }
+
+
+def _workout(row):
+    return Workout(
+        workout_id=row[0],
+        start_timestamp=row[1],
+        end_timestamp=row[2],
+        start_lat_lng=_lat_lng(row[3], row[4]),
+        end_lat_lng=_lat_lng(row[5], row[6]),
+        distance=row[7],
+        steps=row[8],
+        calories_burned=row[9],
+        duration_seconds=row[10],
+    )
+
+
+def _lat_lng(lat, lng):
+    # Workouts can be stored without coordinates (NULL columns).
+    return None if lat is None else (lat, lng)
+
+
+def _post(row):
+    return Post(*row)
+
+
+def _rollup(row):
+    return {
+        'period_start': row[0],
+        'workouts': row[1],
+        'duration_seconds': row[2],
+        'distance': row[3],
+        'steps': row[4],
+        'calories_burned': row[5],
+    }
@@ -0,0 +1,286 @@
+#############################################################################
+# storage_test.py
+#
+# This file contains tests for storage.py.
+#############################################################################
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from sensor_data import SensorSeries
+from storage import MIGRATIONS, SELECT_NEWEST_POSTS, Storage
+
+
+def make_profile(name, friends=()):
+    return {
+        'full_name': name.title(),
+        'username': name,
+        'date_of_birth': '1990-01-01',
+        'profile_image': None,
+        'friends': list(friends),
+    }
+
+
+def make_workout(workout_id, start):
+    return {
+        'workout_id': workout_id,
+        'start_timestamp': start,
+        'end_timestamp': start,
+        'start_lat_lng': (1.0, 2.0),
+        'end_lat_lng': (3.0, 4.0),
+        'distance': 1.5,
+        'steps': 100,
+        'calories_burned': 10,
+    }
+
+
+class TestStorage(unittest.TestCase):
+    """Tests reading and writing through Storage."""
+
+    def setUp(self):
+        self.storage = Storage(':memory:')
+        with self.storage.write() as connection:
+            self.storage.add_user('a', make_profile('a', ['b']), connection)
+            self.storage.add_user('b', make_profile('b', ['a']), connection)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_users_and_friends(self):
+        """Profiles round-trip, including friends added before they exist."""
+        self.assertEqual(self.storage.get_user('a'), make_profile('a', ['b']))
+        self.assertIsNone(self.storage.get_user('nobody'))
+        self.assertEqual(set(self.storage.get_users(['a', 'b', 'nobody'])), {'a', 'b'})
+
+    def test_workouts_are_ordered(self):
+        """Workouts come back oldest first, and can be updated in place."""
+        self.storage.add_workouts('a', [
+            make_workout('w2', '2024-01-02 00:00:00'),
+            make_workout('w1', '2024-01-01 00:00:00'),
+        ])
+        self.storage.add_workouts('a', [dict(make_workout('w1', '2024-01-01 00:00:00'), steps=5)])
+        workouts = self.storage.get_workouts('a')
+        self.assertEqual([w['workout_id'] for w in workouts], ['w1', 'w2'])
+        self.assertEqual(workouts[0]['steps'], 5)
+        self.assertEqual(workouts[0]['start_lat_lng'], (1.0, 2.0))
+
+    def test_workouts_without_coordinates(self):
+        """Missing coordinates come back as None, not (None, None)."""
+        workout = dict(make_workout('w1', '2024-01-01 00:00:00'))
+        del workout['start_lat_lng']
+        workout['end_lat_lng'] = None
+        self.storage.add_workouts('a', [workout])
+        [stored] = self.storage.get_workouts('a')
+        self.assertIsNone(stored['start_lat_lng'])
+        self.assertIsNone(stored['end_lat_lng'])
+        self.assertEqual(self.storage.get_workouts_page('a'), [stored])
+
+    def test_sensor_data_round_trip(self):
+        """Samples are stored once and read back in time order."""
+        self.storage.add_workouts('a', [make_workout('w1', '2024-01-01 00:00:00')])
+        series = SensorSeries([30, 10, 20], [3.0, 1.0, 2.0], [4, 4, 0])
+        self.storage.add_sensor_data('w1', series)
+        self.storage.add_sensor_data('w1', series)
+        stored = self.storage.get_sensor_data('w1')
+        self.assertEqual(stored.timestamps.tolist(), [10, 20, 30])
+        self.assertEqual(stored.values.tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(stored.type_codes.tolist(), [4, 0, 4])
+
+    def test_posts_and_advice(self):
+        """Posts are newest first and only the latest advice is returned."""
+        self.storage.add_posts([
+            {'post_id': 'p1', 'user_id': 'a', 'timestamp': '2024-01-01 00:00:00', 'content': 'old'},
+            {'post_id': 'p2', 'user_id': 'a', 'timestamp': '2024-01-02 00:00:00', 'content': 'new'},
+        ])
+        self.assertEqual([p['post_id'] for p in self.storage.get_posts('a')], ['p2', 'p1'])
+        self.assertIsNone(self.storage.get_latest_advice('a'))
+        for day in (1, 3, 2):
+            self.storage.add_advice('a', {
+                'advice_id': f'x{day}', 'timestamp': f'2024-01-0{day} 00:00:00',
+                'content': 'hi', 'image': None})
+        self.assertEqual(self.storage.get_latest_advice('a')['advice_id'], 'x3')
+
+    def test_rollups_follow_workout_changes(self):
+        """Day, week and month totals are updated as workouts change."""
+        self.storage.add_workouts('a', [
+            dict(make_workout('w1', '2024-01-01 10:00:00'), end_timestamp='2024-01-01 10:30:00'),
+            make_workout('w2', '2024-01-07 10:00:00'),
+        ])
+        week = self.storage.get_rollups('a', 'week', '2024-01-01')[0]
+        self.assertEqual(
+            (week['workouts'], week['steps'], week['duration_seconds']), (2, 200, 1800))
+        self.assertEqual(self.storage.get_rollups('a', 'day', '2024-01-07')[0]['workouts'], 1)
+
+        # Moving w2 into the next week moves its totals with it.
+        self.storage.add_workouts('a', [dict(make_workout('w2', '2024-01-08 10:00:00'), steps=50)])
+        self.assertEqual(self.storage.get_rollups('a', 'week', '2024-01-01')[0]['steps'], 100)
+        self.assertEqual(self.storage.get_rollups('a', 'day', '2024-01-07'), [])
+        latest = self.storage.get_rollups('a', 'week', limit=2)
+        self.assertEqual([r['period_start'] for r in latest], ['2024-01-08', '2024-01-01'])
+        self.assertEqual(self.storage.get_rollups('a', 'month')[0]['steps'], 150)
+
+        with self.storage.write() as connection:
+            connection.execute("DELETE FROM workouts WHERE workout_id = 'w2'")
+        self.assertEqual(self.storage.get_rollups('a', 'week', '2024-01-08'), [])
+        self.assertIsNone(self.storage.get_workout_summary('w2'))
+
+    def test_unparseable_timestamps(self):
+        """Workouts with timestamps SQLite can't parse last 0 seconds and
+        are left out of the rollups until their timestamps are fixed."""
+        self.storage.add_workouts('a', [dict(
+            make_workout('w1', ''), end_timestamp='not a date')])
+        self.assertEqual(self.storage.get_workouts('a')[0]['duration_seconds'], 0)
+        self.assertEqual(self.storage.get_workout_summary('w1')['duration_seconds'], 0)
+        self.assertEqual(self.storage.get_rollups('a', 'month'), [])
+
+        self.storage.add_workouts('a', [dict(
+            make_workout('w1', '2024-01-01 10:00:00'), end_timestamp='2024-01-01 10:30:00')])
+        self.assertEqual(self.storage.get_rollups('a', 'month')[0]['duration_seconds'], 1800)
+        self.storage.add_workouts('a', [make_workout('w1', '')])
+        self.assertEqual(self.storage.get_rollups('a', 'month'), [])
+
+    def test_migration_backfills_unparseable_timestamps(self):
+        """Summaries are backfilled for existing workouts of any timestamps."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.db')
+            connection = sqlite3.connect(path)
+            connection.executescript(MIGRATIONS[0])
+            connection.executescript("""
+                INSERT INTO users (user_id, full_name, username) VALUES ('a', 'A', 'a');
+                INSERT INTO workouts (workout_id, user_id, start_timestamp, end_timestamp)
+                VALUES ('w1', 'a', '', ''),
+                       ('w2', 'a', '2024-01-01 10:00:00', '2024-01-01 10:30:00');
+                PRAGMA user_version = 1;
+            """)
+            connection.close()
+
+            storage = Storage(path)
+            self.assertEqual(
+                [w['duration_seconds'] for w in storage.get_workouts('a')], [0, 1800])
+            self.assertEqual(storage.get_rollups('a', 'month')[0]['workouts'], 1)
+            storage.close()
+
+    def test_workout_summary_counts_new_samples_only(self):
+        """Sample and heart rate summaries ignore duplicate samples."""
+        self.storage.add_workouts('a', [
+            dict(make_workout('w1', '2024-01-01 10:00:00'), end_timestamp='2024-01-01 10:30:00')])
+        self.assertEqual(self.storage.get_workout_summary('w1'), {
+            'duration_seconds': 1800, 'sample_count': 0,
+            'heart_rate_avg': None, 'heart_rate_max': None})
+
+        self.assertEqual(self.storage.add_sensor_data(
+            'w1', SensorSeries([1, 2, 2, 3], [100.0, 140.0, 1.0, 9.0], [4, 4, 4, 0])), 3)
+        self.assertEqual(self.storage.add_sensor_data(
+            'w1', SensorSeries([2, 4], [150.0, 90.0], [4, 4])), 1)
+        summary = self.storage.get_workout_summary('w1')
+        self.assertEqual(summary['sample_count'], 4)
+        self.assertEqual(summary['heart_rate_max'], 140.0)
+        self.assertAlmostEqual(summary['heart_rate_avg'], 110.0)
+        self.assertEqual(self.storage.get_workouts('a')[0]['duration_seconds'], 1800)
+
+    def test_bulk_sensor_data(self):
+        """Bulk loads store every workout's samples and summaries."""
+        self.storage.add_workouts('a', [
+            make_workout('w1', '2024-01-01 10:00:00'), make_workout('w2', '2024-01-02 10:00:00')])
+        self.storage.add_sensor_data_bulk(['w1', 'w2'], [3, 2], SensorSeries(
+            [1, 2, 2, 5, 6], [100.0, 1.0, 140.0, 7.0, 8.0], [4, 0, 4, 0, 1]))
+        self.assertEqual(self.storage.get_sensor_data('w1').values.tolist(), [100.0, 1.0, 140.0])
+        self.assertEqual(self.storage.get_sensor_data('w2').timestamps.tolist(), [5, 6])
+        self.assertEqual(self.storage.get_workout_summary('w1'), {
+            'duration_seconds': 0, 'sample_count': 3,
+            'heart_rate_avg': 120.0, 'heart_rate_max': 140.0})
+        self.assertEqual(self.storage.get_workout_summary('w2')['heart_rate_max'], None)
+
+    def test_routes(self):
+        """Routes keep the full trace and a capped copy per zoom level."""
+        self.storage.add_workouts('a', [make_workout('w1', '2024-01-01 10:00:00')])
+        trace = np.column_stack([np.linspace(40, 41, 5000), np.sin(np.linspace(0, 20, 5000))])
+        self.storage.add_route('w1', trace)
+
+        np.testing.assert_array_equal(self.storage.get_route('w1'), trace)
+        coarse = self.storage.get_route('w1', zoom=3)
+        fine = self.storage.get_route('w1', zoom=18)
+        self.assertLess(len(coarse), len(fine))
+        self.assertLessEqual(len(fine), 500)
+        self.assertFalse(fine.flags.writeable)
+        self.assertIsNone(self.storage.get_route('nothing', zoom=10))
+
+        [route] = self.storage.get_user_routes('a', zoom=10)
+        self.assertEqual(route['workout_id'], 'w1')
+        np.testing.assert_allclose(route['bounds'], (40, -1, 41, 1), atol=1e-3)
+        self.assertEqual(self.storage.get_user_routes('b', zoom=10), [])
+
+    def test_unknown_rollup_period(self):
+        """Only day, week and month rollups exist."""
+        with self.assertRaises(ValueError):
+            self.storage.get_rollups('a', 'year')
+
+    def test_failed_write_rolls_back(self):
+        """An exception inside write() leaves the database unchanged."""
+        with self.assertRaises(RuntimeError):
+            with self.storage.write() as connection:
+                self.storage.add_user('c', make_profile('c'), connection)
+                raise RuntimeError('boom')
+        self.assertIsNone(self.storage.get_user('c'))
+
+    def test_queries_use_indexes(self):
+        """Per-user and per-workout reads are index lookups, not scans."""
+        with self.storage.read() as connection:
+            for sql in [
+                'SELECT * FROM workouts WHERE user_id = ? ORDER BY start_timestamp',
+                'SELECT * FROM sensor_samples WHERE workout_id = ? ORDER BY timestamp',
+                'SELECT * FROM posts WHERE user_id = ? ORDER BY timestamp DESC',
+            ]:
+                plan = ' '.join(row[-1] for row in connection.execute(
+                    'EXPLAIN QUERY PLAN ' + sql, ('x',)))
+                self.assertIn('USING', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_posts_for_users_are_merged(self):
+        """Each user's newest posts are read in index order and merged."""
+        self.storage.add_posts([
+            {'user_id': user_id, 'post_id': f'{user_id}{minute}',
+             'timestamp': f'2024-01-01 00:{minute:02d}:00', 'content': ''}
+            for user_id, minutes in (('a', (1, 4, 5)), ('b', (2, 3, 6)))
+            for minute in minutes
+        ])
+        posts = self.storage.get_posts_for_users(['a', 'b'], since='2024-01-01 00:01:00', limit=4)
+        self.assertEqual([p['post_id'] for p in posts], ['b6', 'a5', 'a4', 'b3'])
+        with self.storage.read() as connection:
+            plan = ' '.join(row[-1] for row in connection.execute(
+                'EXPLAIN QUERY PLAN ' + SELECT_NEWEST_POSTS, ('a', '', 4)))
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TestFileStorage(unittest.TestCase):
+    """Tests a file database shared by a pool of connections."""
+
+    def test_migrations_and_concurrent_reads(self):
+        """Reopening keeps the data, and threads can read concurrently."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.db')
+            storage = Storage(path)
+            storage.add_user('a', make_profile('a'))
+            storage.close()
+
+            storage = Storage(path, pool_size=3)
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(storage.get_user('a')))
+                for _ in range(6)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            storage.close()
+        self.assertEqual(results, [make_profile('a')] * 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,314 @@
+#############################################################################
+# synthetic.py
+#
+# This file contains a seeded generator of synthetic users, friendships,
+# workouts, sensor samples, posts and advice, used as the data set for
+# benchmarks and load tests.
+#
+# Everything is drawn from NumPy generators as whole columns and written to
+# Storage with executemany, a chunk of users per transaction, so nearly all
+# of the time goes to SQLite itself: roughly 15k workouts (with their
+# rollups) or 200k sensor samples a second. A million users without sensor
+# samples take about 20 minutes. The same seed and arguments always produce
+# the same database.
+#
+# The distributions are loosely realistic: how often people work out is
+# heavy-tailed, most workouts are in the morning or evening, pace and
+# duration are log-normal, steps and calories follow distance, friendships
+# cluster in communities, and heart rate ramps up over a workout.
+#############################################################################
+
+import numpy as np
+
+from sensor_data import SENSOR_TYPES, SensorSeries, format_timestamps, sensor_code
+from storage import INSERT_ADVICE, INSERT_FRIENDSHIP, INSERT_POST, INSERT_USER, INSERT_WORKOUT
+
+# Generated workouts fall in the DAYS days starting at START.
+START = '2024-01-01'
+DAYS = 90
+
+# How many users' data is generated and written per transaction.
+CHUNK_USERS = 1000
+
+POST_TEMPLATES = (
+    'Had a great workout today!',
+    'New personal best: {} miles!',
+    'Rest day. Legs are still sore.',
+    'Early run before work, {} miles.',
+    'The AI really motivated me to push myself further, I ran {} miles!',
+)
+ADVICE_TEMPLATES = (
+    'Your heart rate indicates you can push yourself further. You got this!',
+    "You're doing great! Keep up the good work.",
+    'You worked hard yesterday, take it easy today.',
+    'You have burned {:,} calories so far!',
+)
+
+FIRST_NAMES = ('Alex', 'Blake', 'Casey', 'Drew', 'Emery', 'Finley', 'Gray', 'Harper',
+               'Jordan', 'Kai', 'Logan', 'Morgan', 'Parker', 'Quinn', 'Remi', 'Sage')
+
+
+def user_id(index):
+    """Returns the id of the user with the given index: user1, user2, ..."""
+    return f'user{index + 1}'
+
+
+def friendships(user_count, friends_per_user, rng, community_size=1000, hubs=0, hub_friends=0):
+    """Returns every friendship as parallel (user, friend) index arrays.
+
+    Each user befriends about friends_per_user / 2 others, 90% of them in
+    their own community of community_size consecutive users. The first
+    `hubs` users are also friends with `hub_friends` random users, like
+    popular accounts. Friendships are listed both ways, without duplicates
+    or self-friendships, sorted by user and then friend.
+    """
+    sources = np.repeat(np.arange(user_count, dtype=np.int64), friends_per_user // 2)
+    community_start = sources // community_size * community_size
+    local = community_start + rng.integers(0, community_size, len(sources))
+    distant = rng.integers(0, user_count, len(sources))
+    targets = np.minimum(np.where(rng.random(len(sources)) < 0.9, local, distant), user_count - 1)
+    sources = np.concatenate([sources, np.repeat(np.arange(hubs, dtype=np.int64), hub_friends)])
+    targets = np.concatenate([targets, rng.integers(0, user_count, hubs * hub_friends)])
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    # As in FriendGraph.from_edges, one sorted int64 key per pair puts
+    # duplicates next to each other.
+    keys = np.sort(np.concatenate([sources * user_count + targets, targets * user_count + sources]))
+    keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    return np.divmod(keys, user_count)
+
+
+def generate(storage, user_count, seed=0, friends_per_user=10, workouts_per_user=20,
+             posts_per_user=5, sample_interval=60, routes_per_user=0, start=START,
+             days=DAYS, chunk_users=CHUNK_USERS):
+    """Fills an empty Storage with synthetic users and their data.
+
+    Users are user1, user2, ...; their workouts, posts and advice have ids
+    prefixed with their user id.
+
+    Args:
+        friends_per_user: the average number of friends.
+        workouts_per_user: the average number of workouts. Some users work
+            out much more than others.
+        posts_per_user: the average number of posts.
+        sample_interval: seconds between readings of each sensor during a
+            workout, or None for no sensor samples.
+        routes_per_user: how many of each user's latest workouts get a GPS
+            route. Routes are simplified as they are stored, which is slow,
+            so there are none by default.
+        start: the 'YYYY-MM-DD' day workouts start from; they span `days`.
+
+    Returns:
+        A dict with how many users, friendships, workouts, samples and posts
+        were written.
+    """
+    chunks = [(first, min(first + chunk_users, user_count))
+              for first in range(0, user_count, chunk_users)]
+    user_seed, *chunk_seeds = np.random.SeedSequence(seed).spawn(1 + len(chunks))
+    rng = np.random.default_rng(user_seed)
+    sources, targets = friendships(
+        user_count, friends_per_user, rng, community_size=min(1000, user_count))
+    # Row boundaries of each user's friends in the sorted pairs.
+    friend_offsets = np.searchsorted(sources, np.arange(user_count + 1))
+    names = rng.integers(0, len(FIRST_NAMES), user_count)
+    birthdays = format_timestamps(
+        np.datetime64('1960-01-01', 's').astype(np.int64)
+        + rng.integers(0, 45 * 365, user_count) * 86400)
+    epoch = int(np.datetime64(start, 's').astype(np.int64))
+    counts = {'users': user_count, 'friendships': len(sources), 'workouts': 0, 'samples': 0,
+              'posts': 0}
+
+    # Every user exists before any friendships are written, since friends
+    # may be in later chunks.
+    for first, last in chunks:
+        with storage.write() as connection:
+            connection.executemany(INSERT_USER, [
+                (user_id(index), f'{FIRST_NAMES[name]} {index + 1}',
+                 f'{FIRST_NAMES[name].lower()}{index + 1}', birthday[:10], None)
+                for index, name, birthday in zip(
+                    range(first, last), names[first:last].tolist(), birthdays[first:last].tolist())
+            ])
+    for (first, last), chunk_seed in zip(chunks, chunk_seeds):
+        rng = np.random.default_rng(chunk_seed)
+        with storage.write() as connection:
+            begin, end = friend_offsets[first], friend_offsets[last]
+            positions = np.arange(begin, end) - friend_offsets[sources[begin:end]]
+            connection.executemany(INSERT_FRIENDSHIP, zip(
+                map(user_id, sources[begin:end].tolist()),
+                map(user_id, targets[begin:end].tolist()), positions.tolist()))
+            workouts = _workouts(rng, first, last, workouts_per_user, epoch, days)
+            _write_workouts(connection, workouts)
+            counts['workouts'] += len(workouts['workout_id'])
+            if sample_interval:
+                sample_counts, series = _samples(rng, workouts, sample_interval)
+                storage.add_sensor_data_bulk(
+                    workouts['workout_id'], sample_counts, series, connection)
+                counts['samples'] += len(series)
+            if routes_per_user:
+                _write_routes(storage, connection, rng, workouts, routes_per_user)
+            counts['posts'] += _write_posts(connection, rng, first, last, posts_per_user, epoch, days)
+            _write_advice(connection, rng, first, last, workouts, epoch, days)
+    return counts
+
+
+def workouts(user_count, seed=0, workouts_per_user=20, start=START, days=DAYS):
+    """Returns synthetic workouts as dicts in the storage format, without
+    writing them anywhere. They are drawn like generate's, about
+    workouts_per_user for each of user_count users, ordered by user and
+    start time."""
+    rng = np.random.default_rng(seed)
+    epoch = int(np.datetime64(start, 's').astype(np.int64))
+    columns = _workouts(rng, 0, user_count, workouts_per_user, epoch, days)
+    return [
+        {'workout_id': workout_id, 'start_timestamp': start_timestamp,
+         'end_timestamp': end_timestamp, 'start_lat_lng': tuple(start_point),
+         'end_lat_lng': tuple(end_point), 'distance': distance, 'steps': steps,
+         'calories_burned': calories_burned}
+        for workout_id, start_timestamp, end_timestamp, start_point, end_point, distance, steps,
+        calories_burned in zip(
+            columns['workout_id'], format_timestamps(columns['start']).tolist(),
+            format_timestamps(columns['start'] + columns['duration']).tolist(),
+            columns['start_point'].tolist(), columns['end_point'].tolist(),
+            columns['distance'].tolist(), columns['steps'].tolist(),
+            columns['calories_burned'].tolist())
+    ]
+
+
+def sensor_samples(durations, sample_interval=60, seed=0, start=START):
+    """Returns one SensorSeries per workout of the given durations (in
+    seconds), with every sensor read every sample_interval seconds as in
+    generate. The workouts follow each other an hour apart from `start`."""
+    rng = np.random.default_rng(seed)
+    durations = np.asarray(durations, dtype=np.int64)
+    epoch = int(np.datetime64(start, 's').astype(np.int64))
+    starts = epoch + np.concatenate([[0], np.cumsum(durations + 3600)[:-1]]).astype(np.int64)
+    sample_counts, series = _samples(rng, {
+        'start': starts, 'duration': durations,
+        'intensity': rng.uniform(0.45, 0.85, len(durations)),
+    }, sample_interval)
+    ends = np.cumsum(sample_counts).tolist()
+    return [series[end - count:end] for end, count in zip(ends, sample_counts.tolist())]
+
+
+def _workouts(rng, first, last, workouts_per_user, epoch, days):
+    # Returns one column per workout field, ordered by user and start time.
+    users = last - first
+    # Each user's workout rate is log-normal around the average, so a few
+    # users have several times as many workouts as most.
+    rates = rng.lognormal(np.log(workouts_per_user) - 0.28, 0.75, users)
+    per_user = rng.poisson(rates)
+    owners = np.repeat(np.arange(first, last), per_user)
+    count = len(owners)
+    # Mornings around 7:00 and evenings around 18:00.
+    hours = np.where(rng.random(count) < 0.6, rng.normal(7, 1.5, count), rng.normal(18, 1.5, count))
+    starts = (epoch + rng.integers(0, days, count) * 86400
+              + (np.clip(hours, 0, 23.5) * 3600).astype(np.int64))
+    order = np.lexsort((starts, owners))
+    owners, starts = owners[order], starts[order]
+    durations = np.clip(rng.lognormal(np.log(40 * 60), 0.4, count), 600, 4 * 3600).astype(np.int64)
+    speeds = rng.lognormal(np.log(4.5), 0.3, count)  # miles per hour
+    distances = np.round(speeds * durations / 3600, 2)
+    # Each user starts near their own home; workouts end near where they start.
+    homes = np.column_stack([rng.uniform(25, 49, users), rng.uniform(-124, -67, users)])
+    start_points = homes[owners - first] + rng.normal(0, 0.02, (count, 2))
+    end_points = start_points + rng.normal(0, 0.01, (count, 2))
+    # Workout numbers restart at 0 for every user.
+    user_starts = np.searchsorted(owners, owners)
+    return {
+        'owner': owners,
+        'workout_id': [f'{user_id(owner)}-workout{number}' for owner, number in
+                       zip(owners.tolist(), (np.arange(count) - user_starts).tolist())],
+        'start': starts,
+        'duration': durations,
+        'start_point': start_points,
+        'end_point': end_points,
+        'distance': distances,
+        'steps': (distances * rng.normal(2100, 150, count)).astype(np.int64),
+        'calories_burned': (distances * rng.normal(100, 15, count)).astype(np.int64),
+        # How hard each workout is, from 0 (resting) to 1 (flat out).
+        'intensity': rng.uniform(0.45, 0.85, count),
+    }
+
+
+def _write_workouts(connection, workouts):
+    starts = format_timestamps(workouts['start']).tolist()
+    ends = format_timestamps(workouts['start'] + workouts['duration']).tolist()
+    connection.executemany(INSERT_WORKOUT, zip(
+        workouts['workout_id'], map(user_id, workouts['owner'].tolist()), starts, ends,
+        *workouts['start_point'].T.tolist(), *workouts['end_point'].T.tolist(),
+        workouts['distance'].tolist(), workouts['steps'].tolist(),
+        workouts['calories_burned'].tolist()))
+
+
+def _samples(rng, workouts, interval):
+    # Every sensor is read every `interval` seconds of every workout, so
+    # samples are unique and already in (timestamp, sensor type) order.
+    # Values are built as one row per reading time and one column per
+    # sensor, then flattened row by row.
+    ticks = workouts['duration'] // interval + 1
+    types = len(SENSOR_TYPES)
+    tick_owner = np.repeat(np.arange(len(ticks)), ticks)
+    readings = len(tick_owner)
+    elapsed = (np.arange(readings) - np.repeat(np.cumsum(ticks) - ticks, ticks)) * interval
+    intensity = workouts['intensity'][tick_owner]
+    values = np.empty((readings, types))
+    values[:, sensor_code('accelerometer')] = 1 + 0.5 * intensity + rng.normal(0, 0.1, readings)
+    values[:, sensor_code('gyroscope')] = np.abs(40 * intensity + rng.normal(0, 10, readings))
+    values[:, sensor_code('pressure')] = 1013 + rng.normal(0, 2, readings)
+    values[:, sensor_code('temperature')] = 15 + 8 * intensity + rng.normal(0, 0.5, readings)
+    # Heart rate climbs from ~70 towards the workout's effort over ~5 minutes.
+    effort = 70 + 120 * intensity * (1 - np.exp(-elapsed / 300))
+    values[:, sensor_code('heart_rate')] = np.clip(effort + rng.normal(0, 4, readings), 45, 200)
+    return ticks * types, SensorSeries(
+        np.repeat(workouts['start'][tick_owner] + elapsed, types),
+        np.round(values, 2).ravel(),
+        np.tile(np.arange(types, dtype=np.int8), readings))
+
+
+def _write_routes(storage, connection, rng, workouts, per_user):
+    # A wandering trace from each workout's start to its end, one point a
+    # second: a straight line plus a random walk pulled back to zero at both
+    # ends.
+    owners = workouts['owner']
+    # Workouts are ordered by user, so a user's latest are just before the
+    # next user's first.
+    from_end = np.searchsorted(owners, owners, side='right') - np.arange(len(owners))
+    for index in np.flatnonzero(from_end <= per_user).tolist():
+        point_count = int(workouts['duration'][index]) + 1
+        fraction = np.linspace(0.0, 1.0, point_count)[:, None]
+        walk = rng.normal(scale=2e-5, size=(point_count, 2)).cumsum(axis=0)
+        walk -= walk[0] + fraction * (walk[-1] - walk[0])
+        start, end = workouts['start_point'][index], workouts['end_point'][index]
+        storage.add_route(
+            workouts['workout_id'][index], start + fraction * (end - start) + walk, connection)
+
+
+def _write_posts(connection, rng, first, last, posts_per_user, epoch, days):
+    # Returns how many posts were written.
+    per_user = rng.poisson(posts_per_user, last - first)
+    owners = np.repeat(np.arange(first, last), per_user)
+    count = len(owners)
+    timestamps = format_timestamps(epoch + rng.integers(0, days * 86400, count)).tolist()
+    templates = rng.integers(0, len(POST_TEMPLATES), count).tolist()
+    miles = np.round(rng.lognormal(np.log(4), 0.5, count), 1).tolist()
+    user_starts = np.searchsorted(owners, owners)
+    connection.executemany(INSERT_POST, [
+        (f'{user_id(owner)}-post{number}', user_id(owner), timestamp,
+         POST_TEMPLATES[template].format(distance), None)
+        for owner, number, timestamp, template, distance in zip(
+            owners.tolist(), (np.arange(count) - user_starts).tolist(), timestamps, templates, miles)
+    ])
+    return count
+
+
+def _write_advice(connection, rng, first, last, workouts, epoch, days):
+    # One piece of advice per user, dated the end of the period.
+    templates = rng.integers(0, len(ADVICE_TEMPLATES), last - first).tolist()
+    calories = np.bincount(
+        workouts['owner'] - first, weights=workouts['calories_burned'], minlength=last - first)
+    timestamp = format_timestamps(epoch + days * 86400).tolist()
+    connection.executemany(INSERT_ADVICE, [
+        (f'{user_id(index)}-advice0', user_id(index), timestamp,
+         ADVICE_TEMPLATES[template].format(int(burned)), None, None)
+        for index, template, burned in zip(range(first, last), templates, calories.tolist())
+    ])
@@ -0,0 +1,153 @@
+#############################################################################
+# synthetic_test.py
+#
+# This file contains tests for synthetic.py.
+#############################################################################
+
+import unittest
+
+import numpy as np
+
+import synthetic
+from storage import Storage
+
+TABLES = ('users', 'friendships', 'workouts', 'sensor_samples', 'posts', 'advice',
+          'workout_summaries', 'user_rollups')
+
+
+def dump(storage):
+    """Returns every row of every table, in a stable order."""
+    with storage.read() as connection:
+        return {
+            table: connection.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3').fetchall()
+            for table in TABLES
+        }
+
+
+def generate(seed, **kwargs):
+    """Generates 60 small users in three chunks into a new in-memory Storage."""
+    storage = Storage(':memory:')
+    options = {'workouts_per_user': 4, 'posts_per_user': 2, 'sample_interval': 300,
+               'chunk_users': 25, **kwargs}
+    return storage, synthetic.generate(storage, 60, seed=seed, **options)
+
+
+class TestFriendships(unittest.TestCase):
+    """Tests the friendships function."""
+
+    def test_symmetric_and_unique(self):
+        """Every friendship is listed both ways, once, and never to oneself."""
+        sources, targets = synthetic.friendships(500, 10, np.random.default_rng(0), 50, hubs=2,
+                                                 hub_friends=100)
+        pairs = set(zip(sources.tolist(), targets.tolist()))
+        self.assertEqual(len(pairs), len(sources))
+        self.assertTrue(all((b, a) in pairs for a, b in pairs))
+        self.assertFalse((sources == targets).any())
+        self.assertTrue((np.diff(sources) >= 0).all())
+        # Hubs have many more friends than everyone else.
+        self.assertGreater(np.sum(sources == 0), 5 * np.median(np.bincount(sources)))
+
+
+class TestGenerate(unittest.TestCase):
+    """Tests generating and storing a synthetic data set."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage, cls.counts = generate(seed=7)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+
+    def test_same_seed_same_data(self):
+        """The same seed reproduces the database; another seed doesn't."""
+        same, _ = generate(seed=7)
+        other, _ = generate(seed=8)
+        self.assertEqual(dump(same), dump(self.storage))
+        self.assertNotEqual(dump(other)['workouts'], dump(self.storage)['workouts'])
+        same.close()
+        other.close()
+
+    def test_counts_match_storage(self):
+        """The returned counts are what was written."""
+        rows = dump(self.storage)
+        for table, key in [('users', 'users'), ('friendships', 'friendships'),
+                           ('workouts', 'workouts'), ('sensor_samples', 'samples'),
+                           ('posts', 'posts')]:
+            self.assertEqual(len(rows[table]), self.counts[key], table)
+        self.assertEqual(len(rows['advice']), 60)
+
+    def test_users_are_readable(self):
+        """Generated users read back like any other, friends and all."""
+        profile = self.storage.get_user('user1')
+        self.assertEqual(profile['username'][-1], '1')
+        for friend in profile['friends']:
+            self.assertIn('user1', self.storage.get_user(friend)['friends'])
+        self.assertIsNotNone(self.storage.get_latest_advice('user60'))
+
+    def test_workouts_and_samples(self):
+        """Workouts are plausible and their summaries match their samples."""
+        workouts = [w for i in range(60) for w in self.storage.get_workouts(synthetic.user_id(i))]
+        self.assertEqual(len(workouts), self.counts['workouts'])
+        workout = max(workouts, key=lambda w: w['duration_seconds'])
+        self.assertGreaterEqual(workout['duration_seconds'], 600)
+        self.assertGreater(workout['steps'], workout['distance'] * 1000)
+
+        series = self.storage.get_sensor_data(workout['workout_id'])
+        heart_rate = series.for_sensor('heart_rate')
+        summary = self.storage.get_workout_summary(workout['workout_id'])
+        self.assertEqual(summary['sample_count'], len(series))
+        self.assertAlmostEqual(summary['heart_rate_avg'], heart_rate.values.mean())
+        self.assertEqual(summary['heart_rate_max'], heart_rate.values.max())
+        self.assertTrue(45 <= heart_rate.values.min() <= heart_rate.values.max() <= 200)
+
+    def test_without_samples(self):
+        """sample_interval=None skips sensor samples."""
+        storage, counts = generate(seed=7, sample_interval=None)
+        self.assertEqual(counts['samples'], 0)
+        self.assertEqual(dump(storage)['workouts'], dump(self.storage)['workouts'])
+        storage.close()
+
+    def test_routes(self):
+        """routes_per_user gives each user's latest workouts a route."""
+        storage, _ = generate(seed=7, sample_interval=None, routes_per_user=2)
+        workouts = storage.get_workouts('user1')
+        routes = storage.get_user_routes('user1', zoom=16)
+        self.assertEqual([r['workout_id'] for r in routes],
+                         [w['workout_id'] for w in workouts[-2:]])
+        full = storage.get_route(workouts[-1]['workout_id'])
+        self.assertEqual(len(full), workouts[-1]['duration_seconds'] + 1)
+        np.testing.assert_allclose(full[0], workouts[-1]['start_lat_lng'])
+        np.testing.assert_allclose(full[-1], workouts[-1]['end_lat_lng'])
+        storage.close()
+
+
+class TestArrayBuilders(unittest.TestCase):
+    """Tests the workouts and sensor_samples builders used by benchmarks."""
+
+    def test_workouts(self):
+        """Workouts are seeded, and store like generated ones."""
+        workouts = synthetic.workouts(10, seed=3, workouts_per_user=5)
+        self.assertEqual(workouts, synthetic.workouts(10, seed=3, workouts_per_user=5))
+        self.assertNotEqual(workouts, synthetic.workouts(10, seed=4, workouts_per_user=5))
+        storage = Storage(':memory:')
+        storage.add_user('u', {'full_name': 'U', 'username': 'u'})
+        storage.add_workouts('u', workouts)
+        stored = storage.get_workouts('u')
+        self.assertEqual(len(stored), len(workouts))
+        self.assertTrue(all(w['duration_seconds'] >= 600 for w in stored))
+        storage.close()
+
+    def test_sensor_samples(self):
+        """Every sensor is read every interval, one series per workout."""
+        first, second = synthetic.sensor_samples([600, 1200], sample_interval=60, seed=1)
+        self.assertEqual((len(first), len(second)), (11 * 5, 21 * 5))
+        self.assertEqual(second.timestamps[0] - first.timestamps[-1], 3600)
+        heart_rate = second.for_sensor('heart_rate').values
+        self.assertTrue(45 <= heart_rate.min() <= heart_rate.max() <= 200)
+        np.testing.assert_array_equal(
+            first.values, synthetic.sensor_samples([600, 1200], 60, seed=1)[0].values)
+
+
+if __name__ == "__main__":
+    unittest.main()